@@ -11,7 +11,10 @@ Hint: A number is Fibonacci if and only if one or both of (5*n2 + 4) or
 (5*n2 – 4) is a perfect square (i.e. A number made by squaring a whole number).
 """
 
-import math
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Set
+import argparse
+import mmap
 
 
 def is_perfect_square(x: int) -> bool:
@@ -20,10 +23,21 @@ def is_perfect_square(x: int) -> bool:
     if x < 0:
         return False
 
-    root = math.sqrt(x)
+    if x < 2:
+        return True
+
+    # Integer Newton's method rather than math.sqrt, which is inexact once
+    # x is too big for a float to hold exactly. Starting from a power of
+    # two at least the root, each step comes down towards it.
+    root = 1 << ((x.bit_length() + 1) // 2)
+    while True:
+        better = (root + x // root) // 2
+        if better >= root:
+            break
+        root = better
 
     # This will only be true if the root is integer
-    return int(root) == root
+    return root * root == x
 
 
 def is_fibonacci(x: int) -> bool:
@@ -65,9 +79,262 @@ def fuzz(x: int) -> str:
     return str(x)
 
 
-def main():
-    for i in range(101):
+# The labels fuzz gives, other than plain numbers
+LABELS = ["Fizz", "Buzz", "FizzBuzz", "Flamingo", "Pink Flamingo"]
+
+# Stands for the numbers fuzz returns as themselves, in counts
+NUMBER = "Number"
+
+
+def fibonacci_numbers(stop: int) -> List[int]:
+    """The distinct Fibonacci numbers below stop, in order"""
+    numbers = []
+    last, current = 0, 1
+    while last < stop:
+        # 1 comes up twice
+        if not numbers or numbers[-1] != last:
+            numbers.append(last)
+        last, current = current, last + current
+
+    return numbers
+
+
+def counts_below(stop: int) -> Dict[str, int]:
+    """How many of 0 to stop - 1 fuzz gives each label (and NUMBER)"""
+    if stop <= 0:
+        return {label: 0 for label in LABELS + [NUMBER]}
+
+    def multiples(m: int) -> int:
+        # Including 0
+        return (stop + m - 1) // m
+
+    # Fizz, Buzz and FizzBuzz repeat every 15 numbers, so are counted by
+    # inclusion-exclusion, less the Fibonacci numbers which are flamingoes
+    # instead. There are only logarithmically many of those to go through.
+    fizz_fibs = buzz_fibs = fizzbuzz_fibs = 0
+    fibs = fibonacci_numbers(stop)
+    for x in fibs:
+        if x % 15 == 0:
+            fizzbuzz_fibs += 1
+        elif x % 3 == 0:
+            fizz_fibs += 1
+        elif x % 5 == 0:
+            buzz_fibs += 1
+
+    counts = {
+        "Fizz": multiples(3) - multiples(15) - fizz_fibs,
+        "Buzz": multiples(5) - multiples(15) - buzz_fibs,
+        "FizzBuzz": multiples(15) - fizzbuzz_fibs,
+        "Flamingo": len(fibs) - fizzbuzz_fibs,
+        "Pink Flamingo": fizzbuzz_fibs,
+    }
+    counts[NUMBER] = stop - sum(counts.values())
+    return counts
+
+
+def count(label: str, start: int, stop: int) -> int:
+    """How many of start to stop - 1 fuzz gives label (or NUMBER) for.
+
+    Takes time logarithmic in stop, so works for ranges far too big to go
+    through a number at a time.
+
+    Raises ValueError for an unknown label or a negative start.
+    """
+    if label not in LABELS and label != NUMBER:
+        raise ValueError("Unknown label '{}'".format(label))
+    if start < 0:
+        raise ValueError("Counts start from 0")
+
+    if stop <= start:
+        return 0
+
+    return counts_below(stop)[label] - counts_below(start)[label]
+
+
+def nth(label: str, n: int, start: int = 0) -> int:
+    """The nth number from start onwards which fuzz gives label for.
+
+    n counts from 1, so nth("Pink Flamingo", 2) is 6765, the second Pink
+    Flamingo. Found by binary search over the counts, so takes time
+    polylogarithmic in the answer.
+
+    Raises ValueError for an unknown label, a negative start or n < 1.
+    """
+    if n < 1:
+        raise ValueError("n counts from 1")
+
+    target = count(label, 0, start) + n
+
+    def enough(stop: int) -> bool:
+        return counts_below(stop)[label] >= target
+
+    # Double the range searched until the answer is in it. Fibonacci
+    # numbers grow exponentially too, so even for flamingoes this is a
+    # handful of steps per one passed.
+    high = start + 1
+    while not enough(high):
+        high = start + 2 * (high - start)
+
+    # Then bisect for the first stop with enough below it
+    low = start
+    while high - low > 1:
+        middle = (low + high) // 2
+        if enough(middle):
+            high = middle
+        else:
+            low = middle
+
+    return high - 1
+
+
+def output_size(start: int, stop: int) -> int:
+    """Bytes of output for start to stop - 1, a line per number.
+
+    Worked out from the counts rather than the output: the labels each
+    take a fixed number of bytes, and plain numbers take the same number
+    of digits in each run from a power of ten to the next.
+
+    Raises ValueError if start is negative.
+    """
+    if stop <= start:
+        return 0
+
+    size = sum(
+        count(label, start, stop) * (len(label) + 1) for label in LABELS
+    )
+
+    digits = 1
+    low = 0
+    while low < stop:
+        high = 10 ** digits
+        if high > start:
+            size += (digits + 1) * count(
+                NUMBER, max(low, start), min(high, stop)
+            )
+        (digits, low) = (digits + 1, high)
+
+    return size
+
+
+# Labels of the numbers in each period of 15, None for the plain numbers
+PATTERN = [
+    "FizzBuzz", None, None, "Fizz", None, "Buzz", "Fizz", None, None, "Fizz",
+    "Buzz", None, "Fizz", None, None
+]
+
+# Output for a period of 15 without flamingoes, given the plain numbers
+_PERIOD = "".join(
+    (label or "{}") + "\n" for label in PATTERN
+).format
+
+
+def _lines(start: int, stop: int, fibs: Set[int]) -> str:
+    """Output for start to stop - 1 a number at a time"""
+    lines = []
+    for x in range(start, stop):
+        if x in fibs:
+            lines.append("Pink Flamingo\n" if x % 15 == 0 else "Flamingo\n")
+        else:
+            lines.append((PATTERN[x % 15] or str(x)) + "\n")
+
+    return "".join(lines)
+
+
+def output(start: int, stop: int) -> bytes:
+    """The output for start to stop - 1, a line per number.
+
+    The same as calling fuzz on each, but a period of 15 at a time from a
+    template, except around the few Fibonacci numbers.
+    """
+    fibs = set(fibonacci_numbers(stop))
+    fib_periods = {x - x % 15 for x in fibs}
+
+    # Whole periods from first to last
+    first = min(stop, start + (-start) % 15)
+    last = max(first, stop - stop % 15)
+
+    parts = [_lines(start, first, fibs)]
+    for x in range(first, last, 15):
+        if x in fib_periods:
+            parts.append(_lines(x, x + 15, fibs))
+        else:
+            parts.append(_PERIOD(
+                x + 1, x + 2, x + 4, x + 7, x + 8, x + 11, x + 13, x + 14
+            ))
+    parts.append(_lines(last, stop, fibs))
+
+    return "".join(parts).encode()
+
+
+# Numbers written by each job in write_output
+BLOCK_SIZE = 1000000
+
+
+def _write_block(path: str, start: int, stop: int, offset: int):
+    """Write the output for start to stop - 1 at offset into the file"""
+    data = output(start, stop)
+
+    # Mappings have to start on a multiple of the allocation granularity
+    aligned = offset - offset % mmap.ALLOCATIONGRANULARITY
+    with open(path, "r+b") as fd:
+        with mmap.mmap(
+            fd.fileno(), offset + len(data) - aligned, offset=aligned
+        ) as mapped:
+            mapped[offset - aligned:] = data
+
+
+def write_output(
+    path: str,
+    start: int,
+    stop: int,
+    workers: Optional[int] = None,
+    block_size: int = BLOCK_SIZE
+):
+    """Write the output for start to stop - 1 to a file, in parallel.
+
+    The file is byte for byte what printing fuzz of each number gives, as
+    main() does. As the offset of each block of numbers in the file is
+    known without writing the ones before it, the file is made full size
+    up front and blocks are written into it by a pool of workers (one per
+    CPU by default) independently.
+
+    Raises ValueError if start is negative.
+    """
+    size = output_size(start, stop)
+    with open(path, "wb") as fd:
+        fd.truncate(size)
+
+    if size == 0:
+        return
+
+    starts = range(start, stop, block_size)
+    stops = [min(block + block_size, stop) for block in starts]
+    offsets = [output_size(start, block) for block in starts]
+
+    with ProcessPoolExecutor(workers) as pool:
+        # Gone through so that any error in a worker is raised here
+        for _ in pool.map(
+            _write_block, [path] * len(starts), starts, stops, offsets
+        ):
+            pass
+
+
+def main(stop: int = 101):
+    for i in range(stop):
         print(fuzz(i))
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--stop", type=int, default=101, help="Number to stop before"
+    )
+    parser.add_argument(
+        "--output", help="File to write to in parallel, rather than print"
+    )
+    parser.add_argument("--workers", type=int, help="Processes to write with")
+    args = parser.parse_args()
+
+    if args.output:
+        write_output(args.output, 0, args.stop, args.workers)
+    else:
+        main(args.stop)
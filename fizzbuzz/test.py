@@ -1,6 +1,16 @@
 import unittest
 
-from fizzbuzz import fuzz, is_fibonacci, is_perfect_square
+import contextlib
+import io
+import os
+import random
+import tempfile
+
+from fizzbuzz import (
+    LABELS, NUMBER, count, counts_below, fibonacci_numbers, fuzz,
+    is_fibonacci, is_perfect_square, main, nth, output, output_size,
+    write_output
+)
 
 
 class TestFuzz(unittest.TestCase):
@@ -95,5 +105,114 @@ class TestPerfectSquare(unittest.TestCase):
             self.assertTrue(is_perfect_square(i * i))
 
 
+class TestQueries(unittest.TestCase):
+
+    def label(self, x):
+        label = fuzz(x)
+        return label if label in LABELS else NUMBER
+
+    def test_counts_brute_force(self):
+        """Counts over small ranges match calling fuzz on each number"""
+        labels = [self.label(x) for x in range(2000)]
+
+        rng = random.Random(0)
+        for _ in range(200):
+            start = rng.randrange(0, 2000)
+            stop = rng.randrange(start, 2001)
+            for label in LABELS + [NUMBER]:
+                self.assertEqual(
+                    count(label, start, stop),
+                    labels[start:stop].count(label)
+                )
+
+        self.assertEqual(count("Fizz", 10, 5), 0)
+        self.assertRaises(ValueError, lambda: count("Fuzz", 0, 10))
+        self.assertRaises(ValueError, lambda: count("Fizz", -1, 10))
+
+    def test_nth_brute_force(self):
+        """nth over small ranges matches calling fuzz on each number"""
+        labels = [self.label(x) for x in range(3000)]
+
+        for label in LABELS + [NUMBER]:
+            for start in [0, 1, 7, 100, 999]:
+                found = [
+                    x for x in range(start, 3000) if labels[x] == label
+                ]
+                for n in range(1, min(len(found), 50) + 1):
+                    self.assertEqual(nth(label, n, start), found[n - 1])
+
+        self.assertRaises(ValueError, lambda: nth("Fizz", 0))
+
+    def test_huge_ranges(self):
+        """Counts and nth for ranges far too big to go through"""
+        stop = 10 ** 18
+        totals = counts_below(stop)
+        self.assertEqual(sum(totals.values()), stop)
+
+        # Fibonacci numbers are multiples of 15 every 20th one
+        self.assertEqual(totals["Pink Flamingo"], 5)
+        self.assertEqual(
+            totals["Flamingo"] + totals["Pink Flamingo"],
+            len(fibonacci_numbers(stop))
+        )
+        pink = nth("Pink Flamingo", 5)
+        self.assertEqual(pink, 23416728348467685)
+        self.assertEqual(fuzz(pink), "Pink Flamingo")
+
+        x = nth("FizzBuzz", 10 ** 16, start=stop)
+        self.assertEqual(fuzz(x), "FizzBuzz")
+        self.assertEqual(count("FizzBuzz", stop, x + 1), 10 ** 16)
+
+    def test_large_perfect_squares(self):
+        """Exact beyond where floats can represent the squares"""
+        for root in [2 ** 40 + 1, 10 ** 18 + 3, 3 ** 100]:
+            self.assertTrue(is_perfect_square(root * root))
+            self.assertFalse(is_perfect_square(root * root + 1))
+            self.assertFalse(is_perfect_square(root * root - 1))
+
+
+class TestOutput(unittest.TestCase):
+
+    def expected(self, start, stop):
+        return "".join(fuzz(x) + "\n" for x in range(start, stop)).encode()
+
+    def test_output(self):
+        """Output and its size match calling fuzz on each number"""
+        rng = random.Random(0)
+        ranges = [(0, 101), (95, 1005), (0, 0), (14, 16), (9999, 10001)]
+        for _ in range(200):
+            start = rng.randrange(0, 100000)
+            ranges.append((start, start + rng.randrange(0, 100)))
+
+        for (start, stop) in ranges:
+            expected = self.expected(start, stop)
+            self.assertEqual(output(start, stop), expected)
+            self.assertEqual(output_size(start, stop), len(expected))
+
+        # Buzz, then a 19 digit number
+        self.assertEqual(output_size(10 ** 18, 10 ** 18 + 2), 5 + 20)
+
+    def test_write_output(self):
+        """The file is the same as main() prints, whatever the blocks"""
+        printed = io.StringIO()
+        with contextlib.redirect_stdout(printed):
+            main(5000)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "fizzbuzz.txt")
+
+            for (workers, block_size) in [(1, 5000), (2, 7), (3, 1000)]:
+                write_output(path, 0, 5000, workers, block_size)
+                with open(path, "rb") as fd:
+                    self.assertEqual(fd.read(), printed.getvalue().encode())
+
+            write_output(path, 123456, 234567, 2, 9999)
+            with open(path, "rb") as fd:
+                self.assertEqual(fd.read(), self.expected(123456, 234567))
+
+            write_output(path, 10, 10)
+            self.assertEqual(os.path.getsize(path), 0)
+
+
 if __name__ == "__main__":
     unittest.main()
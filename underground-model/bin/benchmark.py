@@ -0,0 +1,294 @@
+"""Benchmark the model, queries and server on networks of different sizes.
+
+Parsing is timed on the checked-in Wikipedia pages; everything else on
+synthetic networks from underground.generate, so the same seed and sizes
+always benchmark the same networks.
+
+Results are written as one JSON document:
+
+    {
+      "meta": {"python": ..., "platform": ..., "seed": ..., ...},
+      "results": {
+        "parse": {"mean": ..., "p50": ..., "p99": ..., "runs": ...},
+        "1000": {"model_construction": {...}, "shortest_route": {...}, ...},
+        ...
+      }
+    }
+
+with timings in seconds. Given a previous run with --compare, prints how
+each benchmark's median has changed, so that regressions stand out, e.g.
+
+    bin/benchmark.py --output before.json
+    (make changes)
+    bin/benchmark.py --compare before.json
+"""
+
+import os
+import sys
+sys.path.insert(1, os.path.join(os.path.dirname(__file__), ".."))
+
+import argparse
+import json
+import platform
+import random
+import time
+
+from underground import make_standard_model
+from underground.encoding import (
+    dictionary, pack_route, pack_route_ids, packb
+)
+from underground.filters import parse_filter
+from underground.generate import generate_model
+from underground.model import Model
+from underground.graph import StationGraph
+from underground.queries import (
+    longest_line, most_interchanges, pareto_routes, shortest_route
+)
+from underground.server import make_app, route_json
+
+# Changes in median time smaller than this are reported as noise
+NOISE = 0.1
+
+# Largest network to benchmark pareto_routes on
+PARETO_MAX_STATIONS = 10_000
+
+
+def timings(function, runs: int) -> dict:
+    """Call function runs times, summarising how long the calls took"""
+    times = []
+    for _ in range(runs):
+        start_time = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start_time)
+
+    times.sort()
+    return {
+        "mean": sum(times) / len(times),
+        "p50": times[len(times) // 2],
+        "p99": times[min(len(times) - 1, int(len(times) * 0.99))],
+        "runs": len(times),
+    }
+
+
+def rebuild(model: Model) -> Model:
+    """Build a copy of a model through the public API"""
+    copy = Model()
+    for name in model.stations():
+        station = model.station(name)
+        copy.add_station(name, station.district, station.zones)
+    for line in model.lines():
+        for name in model.line(line).stations:
+            copy.add_station_to_line(name, line)
+    return copy
+
+
+def benchmark_network(stations: int, args) -> dict:
+    """Benchmark everything except parsing on a generated network"""
+    results = {}
+
+    start_time = time.perf_counter()
+    model = generate_model(
+        stations,
+        lines=args.lines,
+        interchange_density=args.interchange_density,
+        seed=args.seed
+    )
+    results["generate"] = {"seconds": time.perf_counter() - start_time}
+
+    # A few runs at most: this is slow at 100k stations
+    results["model_construction"] = timings(
+        lambda: rebuild(model), max(1, min(args.runs, 10_000 // stations))
+    )
+    results["most_interchanges"] = timings(
+        lambda: most_interchanges(model), args.runs
+    )
+    results["longest_line"] = timings(lambda: longest_line(model), args.runs)
+
+    # Compound filters over the bitset indexes: evaluating them, and
+    # scanning the result for the station names
+    (line, *_) = model.lines()
+    (district, *_) = model.districts()
+    for (name, text) in [
+        ("line AND zone", f'line:"{line}" AND zone:1'),
+        (
+            "zones AND NOT district",
+            f'(zone:1 OR zone:2) AND NOT district:"{district}"'
+        ),
+    ]:
+        query = parse_filter(text)
+        results[f"filter ({name})"] = timings(
+            lambda: query.bits(model), args.runs
+        )
+        results[f"select ({name})"] = timings(
+            lambda: model.select(query), args.runs
+        )
+
+    # Scanning a property of every station: a pass over the station
+    # objects, as the model's dicts allowed, against a filter on a column
+    # of the graph, scanned and then indexed
+    results["scan (objects)"] = timings(
+        lambda: [
+            name for name in model.stations()
+            if len(model.station(name).zones) > 1
+        ],
+        args.runs
+    )
+    scanned = rebuild(model)
+    table = scanned.graph().nodes("Station")
+    table.add_property("boundary", bool)
+    for name in scanned.stations():
+        table.set(name, "boundary", len(scanned.station(name).zones) > 1)
+    query = parse_filter("property:boundary=true")
+    results["filter (property)"] = timings(
+        lambda: scanned.select(query), args.runs
+    )
+    table.create_index("boundary")
+    results["filter (indexed property)"] = timings(
+        lambda: scanned.select(query), args.runs
+    )
+
+    # Point lookups, the first time each station is asked for and after
+    fresh = rebuild(model)
+    names = iter([*fresh.stations()][:args.runs])
+    results["station (cold)"] = timings(
+        lambda: fresh.station(next(names)), min(args.runs, stations)
+    )
+    names = iter([*fresh.stations()][:args.runs])
+    results["station (warm)"] = timings(
+        lambda: fresh.station(next(names)), min(args.runs, stations)
+    )
+
+    rng = random.Random(args.seed)
+    names = [*model.stations()]
+    pairs = [tuple(rng.sample(names, 2)) for _ in range(args.queries)]
+    routes = iter(pairs)
+    results["shortest_route"] = timings(
+        lambda: shortest_route(model, *next(routes)), len(pairs)
+    )
+
+    # As the server does, with the station graph built once. Skipped on
+    # the biggest networks, where each search takes several seconds.
+    if stations <= PARETO_MAX_STATIONS:
+        graph = StationGraph(model)
+        routes = iter(pairs)
+        results["pareto_routes"] = timings(
+            lambda: pareto_routes(model, *next(routes), graph=graph),
+            len(pairs)
+        )
+
+    # Response encodings of the same routes: time to encode and the mean
+    # bytes on the wire
+    found = [shortest_route(model, a, b) for (a, b) in pairs]
+    version = dictionary(model)["version"]
+    for (name, encode) in [
+        ("json", lambda route: json.dumps(route_json(route)).encode()),
+        ("msgpack", lambda route: packb(route_json(route))),
+        ("msgpack (direct)", pack_route),
+        ("route ids", lambda route: pack_route_ids(model, route, version)),
+    ]:
+        sizes = [len(encode(route)) for route in found]
+        routes = iter(found * args.runs)
+        results[f"encode route ({name})"] = {
+            **timings(lambda: encode(next(routes)), len(found) * args.runs),
+            "bytes": sum(sizes) / len(sizes),
+        }
+
+    start_time = time.perf_counter()
+    client = make_app(model).test_client()
+    results["make_app"] = {"seconds": time.perf_counter() - start_time}
+
+    for (name, paths) in [
+        ("GET /station", (f"/station/{a}" for (a, _) in pairs)),
+        ("GET /route", (f"/route/{a}/{b}" for (a, b) in pairs)),
+        ("GET /route (cached)", (f"/route/{a}/{b}" for (a, b) in pairs)),
+        ("GET /search", (f"/search?q={a[:-1]}" for (a, _) in pairs)),
+        ("GET /top/interchanges", ("/top/interchanges" for _ in pairs)),
+    ]:
+        results[name] = timings(lambda: client.get(next(paths)), len(pairs))
+
+    return results
+
+
+def compare(before: dict, after: dict):
+    """Print how the median time of each benchmark has changed.
+
+    The median rather than the mean, as it's less thrown by the odd slow
+    run (e.g. a garbage collection).
+    """
+    for (group, benchmarks) in after["results"].items():
+        if "p50" in benchmarks:
+            benchmarks = {"": benchmarks}
+
+        for (name, result) in benchmarks.items():
+            old = before["results"].get(group, {})
+            old = old if not name else old.get(name, {})
+            if "p50" not in result or "p50" not in old:
+                continue
+
+            change = result["p50"] / old["p50"] - 1 if old["p50"] else 0
+            if abs(change) < NOISE:
+                verdict = ""
+            elif change > 0:
+                verdict = "SLOWER"
+            else:
+                verdict = "faster"
+
+            label = f"{group} {name}".strip()
+            print(
+                f"{label:<36} {old['p50'] * 1000:>10.3f}ms -> "
+                f"{result['p50'] * 1000:>10.3f}ms {change:>+8.1%} {verdict}"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--stations", type=int, nargs="+", default=[300, 3000, 30000],
+        help="Sizes of network to benchmark (up to 100000 or so)"
+    )
+    parser.add_argument(
+        "--lines", type=int, default=None,
+        help="Number of lines (default one per 30 stations)"
+    )
+    parser.add_argument("--interchange-density", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--runs", type=int, default=200,
+        help="Runs of each quick benchmark"
+    )
+    parser.add_argument(
+        "--queries", type=int, default=50,
+        help="Random station pairs to route between and request"
+    )
+    parser.add_argument("--output", help="File to write results to")
+    parser.add_argument("--compare", help="Previous results to compare with")
+
+    args = parser.parse_args()
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "seed": args.seed,
+            "lines": args.lines,
+            "interchange_density": args.interchange_density,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": {
+            "parse": timings(make_standard_model, 5),
+        },
+    }
+
+    for stations in args.stations:
+        print(f"Benchmarking {stations} stations", file=sys.stderr)
+        report["results"][str(stations)] = benchmark_network(stations, args)
+
+    if args.output:
+        with open(args.output, "w") as fd:
+            json.dump(report, fd, indent=2)
+    elif not args.compare:
+        print(json.dumps(report, indent=2))
+
+    if args.compare:
+        with open(args.compare) as fd:
+            compare(json.load(fd), report)
@@ -0,0 +1,89 @@
+"""Compare contraction hierarchy routing against the plain searches.
+
+For each network size, reports (as one JSON object per line):
+  - Time to compile the station and boarding graphs, and to contract the
+    boarding graph
+  - Size of the graphs and of the hierarchy's index
+  - Mean per-query latency of the hierarchy, a plain Dijkstra search over
+    the station graph and shortest_route, over the same random station
+    pairs
+"""
+
+import os
+import sys
+sys.path.insert(1, os.path.join(os.path.dirname(__file__), ".."))
+
+import argparse
+import json
+import random
+import time
+
+from underground.generate import generate_model
+from underground.graph import BoardingGraph, StationGraph, dijkstra_route
+from underground.hierarchy import ContractionHierarchy
+from underground.queries import shortest_route
+
+
+def mean_latency(route, pairs):
+    """Mean seconds per call of route(start, destination)"""
+    start_time = time.perf_counter()
+    for (start, destination) in pairs:
+        route(start, destination)
+    return (time.perf_counter() - start_time) / len(pairs)
+
+
+def benchmark(stations, queries, seed):
+    model = generate_model(stations, seed=seed)
+
+    start_time = time.perf_counter()
+    graph = StationGraph(model)
+    graph_time = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    boarding = BoardingGraph(model)
+    boarding_time = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    hierarchy = ContractionHierarchy(boarding)
+    hierarchy_time = time.perf_counter() - start_time
+
+    rng = random.Random(seed)
+    names = [*model.stations()]
+    pairs = [tuple(rng.sample(names, 2)) for _ in range(queries)]
+
+    return {
+        "stations": len(graph),
+        "lines": len(model.lines()),
+        "graph_edges": graph.edge_count(),
+        "graph_seconds": graph_time,
+        "boarding_nodes": len(boarding),
+        "boarding_edges": boarding.edge_count(),
+        "boarding_seconds": boarding_time,
+        "hierarchy_seconds": hierarchy_time,
+        "hierarchy_shortcuts": hierarchy.shortcuts,
+        "hierarchy_edges": hierarchy.edge_count(),
+        "hierarchy_index_bytes": hierarchy.index_bytes(),
+        "query_seconds": {
+            "hierarchy": mean_latency(hierarchy.route, pairs),
+            "dijkstra": mean_latency(
+                lambda a, b: dijkstra_route(graph, a, b), pairs
+            ),
+            "shortest_route": mean_latency(
+                lambda a, b: shortest_route(model, a, b), pairs
+            ),
+        },
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--stations", type=int, nargs="+", default=[300, 1000, 3000]
+    )
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+
+    args = parser.parse_args()
+
+    for stations in args.stations:
+        print(json.dumps(benchmark(stations, args.queries, args.seed)))
@@ -1,20 +1,43 @@
-import requests
+"""Download (or refresh) the source pages into the current directory.
 
-UG_SRC = "https://en.wikipedia.org/wiki/List_of_London_Underground_stations"
-DLR_SRC = \
-    "https://en.wikipedia.org/wiki/List_of_Docklands_Light_Railway_stations"
+Only pages which have changed since the last run are downloaded again.
+Prints whether each one changed; the exit status is 1 if any download
+failed, otherwise 0 if anything changed and 2 if nothing did, so a
+script can skip re-parsing:
 
-def save_page(url, filename):
-    """Download the contents of a page to a file on disk.
+    bin/download.py; [ $? -eq 0 ] && (re-parse)
+"""
+
+import os
+import sys
+sys.path.insert(1, os.path.join(os.path.dirname(__file__), ".."))
+
+import argparse
+
+from underground.download import SOURCES, TIMEOUT, refresh_sources
 
-    This will be used just once initially to get the data files -
-    processing will then be done locally on the files.
-    """
-    response = requests.get(url)
-    with open(filename, 'wb') as fd:
-        for chunk in response.iter_content(chunk_size=128):
-            fd.write(chunk)
 
 if __name__ == "__main__":
-    save_page(UG_SRC, "underground.html")
-    save_page(DLR_SRC, "dlr.html")
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--directory", default=".",
+        help="Directory to save the pages in"
+    )
+    parser.add_argument("--timeout", type=float, default=TIMEOUT)
+
+    args = parser.parse_args()
+
+    downloads = refresh_sources(SOURCES, args.directory, timeout=args.timeout)
+
+    for download in downloads:
+        if download.error:
+            outcome = f"failed: {download.error}"
+        elif download.changed:
+            outcome = "changed"
+        else:
+            outcome = "unchanged"
+        print(f"{download.filename}: {outcome}")
+
+    if any(download.error for download in downloads):
+        sys.exit(1)
+    sys.exit(0 if any(download.changed for download in downloads) else 2)
@@ -0,0 +1,108 @@
+"""Load test the server, replaying a request log or with synthetic traffic.
+
+Record a log of real traffic with
+
+    bin/serve.py --request-log requests.log
+
+then replay it with the same timing (or --speed times faster):
+
+    bin/loadtest.py --replay requests.log --speed 2
+
+or generate /route requests between Zipf-distributed stations:
+
+    bin/loadtest.py --synthetic 10000 --rate 200 --concurrency 16
+
+Requests go to a fresh local instance of the server on the standard
+model, unless given the --url of one already running. The standard
+model is only loaded if it's needed, i.e. for a local server or to pick
+synthetic stations from. Prints the
+throughput, latency percentiles (in milliseconds) and error rate of each
+endpoint as JSON.
+"""
+
+import os
+import sys
+sys.path.insert(1, os.path.join(os.path.dirname(__file__), ".."))
+
+import argparse
+import json
+
+from underground import make_standard_model
+from underground.loadtest import (
+    read_log, run_load, serve_in_background, summarise, zipf_routes
+)
+from underground.server import make_app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    traffic = parser.add_mutually_exclusive_group(required=True)
+    traffic.add_argument(
+        "--replay", metavar="LOG",
+        help="Request log to replay, from bin/serve.py --request-log"
+    )
+    traffic.add_argument(
+        "--synthetic", metavar="N", type=int,
+        help="Number of synthetic /route requests to send"
+    )
+    parser.add_argument(
+        "--speed", type=float, default=1.0,
+        help="Replay this many times faster than recorded"
+    )
+    parser.add_argument(
+        "--zipf", type=float, default=1.0,
+        help="Exponent of the Zipf distribution of synthetic stations"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--rate", type=float,
+        help="Requests per second to send (default: as recorded when "
+             "replaying, otherwise as fast as possible)"
+    )
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument(
+        "--url",
+        help="Server to test (default: start one locally)"
+    )
+    parser.add_argument("--output", help="File to write results to")
+
+    args = parser.parse_args()
+
+    # Only needed for a local server or synthetic routes, and slow to load
+    model = None
+    if args.synthetic or not args.url:
+        model = make_standard_model()
+
+    offsets = None
+    if args.replay:
+        log = read_log(args.replay)
+        paths = [request.path for request in log]
+        if log and not args.rate:
+            offsets = [
+                (request.time - log[0].time) / args.speed for request in log
+            ]
+    else:
+        paths = zipf_routes(model, args.synthetic, args.zipf, args.seed)
+
+    if args.rate:
+        offsets = [n / args.rate for n in range(len(paths))]
+
+    server = None
+    url = args.url
+    if not url:
+        (server, url) = serve_in_background(make_app(model))
+
+    try:
+        (results, seconds) = run_load(
+            url.rstrip("/"), paths, offsets, args.concurrency
+        )
+    finally:
+        if server:
+            server.shutdown()
+
+    report = summarise(results, seconds)
+    if args.output:
+        with open(args.output, "w") as fd:
+            json.dump(report, fd, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
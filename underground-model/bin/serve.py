@@ -4,16 +4,60 @@ sys.path.insert(1, os.path.join(os.path.dirname(__file__), ".."))
 
 import argparse
 
-from underground import make_standard_model
+from underground import make_standard_model, trace
+from underground.geo import load_locations
+from underground.loadtest import RequestLogger
 from underground.server import make_app
+from underground.timetable import Timetable
+
+
+def start_up(args):
+    """Load everything and create the app"""
+    model = make_standard_model()
+
+    with trace.span("timetable"):
+        timetable = Timetable(model, args.gtfs) if args.gtfs else None
+
+    with trace.span("locations"):
+        locations = load_locations(args.locations) if args.locations else None
+
+    with trace.span("make_app"):
+        return make_app(model, timetable, locations)
+
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--debug", action="store_true")
+    parser.add_argument(
+        "--gtfs",
+        help="Directory of a GTFS feed, for routing by departure time"
+    )
+    parser.add_argument(
+        "--locations",
+        help="CSV file of station name,latitude,longitude, "
+             "for nearest station queries"
+    )
+    parser.add_argument(
+        "--profile-startup",
+        action="store_true",
+        help="Print the time and memory taken by each phase of start up"
+    )
+    parser.add_argument(
+        "--request-log",
+        help="File to log requests to, for replaying with bin/loadtest.py"
+    )
 
     args = parser.parse_args()
 
-    app = make_app(make_standard_model())
+    if args.profile_startup:
+        with trace.PhaseProfile() as profile:
+            app = start_up(args)
+        print(profile.report(), file=sys.stderr)
+    else:
+        app = start_up(args)
+
+    if args.request_log:
+        app.wsgi_app = RequestLogger(app.wsgi_app, open(args.request_log, "a"))
 
     # Should really use a package like gunicorn to deploy
     # a production webserver, but this'll do for the toy example.
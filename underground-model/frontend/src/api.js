@@ -5,45 +5,36 @@
 // NB: This frontend expects the backend to be running (bin/serve.py)
 const API = "http://localhost:5000";
 
-const ROUTE_REGEX = /How do I get from (.*?) to (.*?)\?/;
-const INTERCHANGES_REGEX = /What lines does (.*?) serve\?/;
-
-export async function queryApi(query) {
-  const route = query.match(ROUTE_REGEX);
-  if (route) {
-    const [, start, destination] = route;
-    const response = await fetch(`${API}/route/${start}/${destination}`);
-    const journey = await response.json();
+function listToSentence(items) {
+  if (items.length == 1) {
+    return `Just ${items[0]}.`;
+  }
 
-    if (journey.error) {
-      return [journey.error, true];
-    }
+  return `${items.slice(0, -1).join(", ")} and ${items[items.length - 1]}.`;
+}
 
-    const segments = journey.map(seg => `the ${seg.line} to ${seg.destination}`);
-    const directions = `Take ${segments.join(", then take ")}.`;
+export async function queryApi(query) {
+  // The server works out which stations and lines the question is about
+  const response = await fetch(`${API}/ask?q=${encodeURIComponent(query)}`);
+  const result = await response.json();
 
-    return [directions, true];
+  if (result.error) {
+    return [result.error, true];
   }
 
-  const interchanges = query.match(INTERCHANGES_REGEX);
-  if (interchanges) {
-    const [, station] = interchanges;
-
-    const response = await fetch(`${API}/station/${station}/interchanges`);
-    const lines = await response.json();
-
-    if (lines.error) {
-      return [lines.error, true];
-    }
+  if (result.kind == "route") {
+    const segments = result.answer.map(
+      seg => `the ${seg.line} to ${seg.destination}`
+    );
+    return [`Take ${segments.join(", then take ")}.`, true];
+  }
 
-    if (lines.length == 1) {
-      return [`Just ${lines[0]}.`, true];
-    } else {
-      const result =
-      `${lines.slice(0, -1).join(", ")} and ${lines[lines.length - 1]}.`;
+  if (result.kind == "station") {
+    return [listToSentence([...result.answer.lines].sort()), true];
+  }
 
-      return [result, true];
-    }
+  if (result.kind == "line") {
+    return [listToSentence(result.answer), true];
   }
 
   return ["error", false];
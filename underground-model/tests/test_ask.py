@@ -0,0 +1,97 @@
+import context
+import unittest
+
+from underground import make_standard_model
+from underground.ask import LINE, STATION, MentionFinder, Question, interpret
+from underground.model import Model
+
+model = make_standard_model()
+finder = MentionFinder(model)
+
+
+def mentions(text):
+    return [(m.kind, m.name) for m in finder.find(text)]
+
+
+class TestMentionFinder(unittest.TestCase):
+
+    def test_every_name(self):
+        for station in model.stations():
+            self.assertEqual(
+                mentions(f"Where is {station}?"),
+                [(STATION, station)]
+            )
+
+        for line in model.lines():
+            self.assertEqual(
+                mentions(f"Stations on the {line} line"),
+                [(LINE, line)]
+            )
+
+    def test_variants(self):
+        self.assertEqual(
+            mentions("kings cross st pancras"),
+            [(STATION, "King's Cross St Pancras")]
+        )
+        self.assertEqual(
+            mentions("elephant castle"),
+            [(STATION, "Elephant & Castle")]
+        )
+        self.assertEqual(
+            mentions("saint pauls"),
+            [(STATION, "St. Paul's")]
+        )
+        self.assertEqual(
+            mentions("the DLR"),
+            [(LINE, "Docklands Light Railway")]
+        )
+
+    def test_overlaps(self):
+        # The longest match wins
+        self.assertEqual(
+            mentions("Shepherd's Bush Market"),
+            [(STATION, "Shepherd's Bush Market")]
+        )
+        self.assertEqual(
+            mentions("Hammersmith & City line"),
+            [(LINE, "Hammersmith & City")]
+        )
+
+        # Stations beat lines of the same name unless "line" is said
+        self.assertEqual(mentions("Victoria"), [(STATION, "Victoria")])
+        self.assertEqual(mentions("Victoria line"), [(LINE, "Victoria")])
+
+        # Whole words only
+        self.assertEqual(mentions("Elbow"), [])
+        self.assertEqual(
+            mentions("Bow Road and Bow Church"),
+            [(STATION, "Bow Road"), (STATION, "Bow Church")]
+        )
+
+    def test_interpret(self):
+        self.assertEqual(
+            interpret(finder, "How do I get from Marylebone to Holborn?"),
+            Question("route", ["Marylebone", "Holborn"])
+        )
+        self.assertEqual(
+            interpret(finder, "To Holborn from Marylebone"),
+            Question("route", ["Marylebone", "Holborn"])
+        )
+        self.assertEqual(
+            interpret(finder, "What lines does Bank serve?"),
+            Question("station", ["Bank"])
+        )
+        self.assertEqual(
+            interpret(finder, "Where does the Jubilee line go?"),
+            Question("line", ["Jubilee"])
+        )
+        self.assertRaises(
+            ValueError,
+            lambda: interpret(finder, "What is the meaning of life?")
+        )
+
+    def test_version(self):
+        model = Model()
+        model.add_station("Bank", "City of London", (1,))
+        finder = MentionFinder(model)
+        self.assertEqual(finder.version(), model.version())
@@ -0,0 +1,177 @@
+import context
+import unittest
+
+import os
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from underground.download import (
+    SIDECAR_SUFFIX, fetch, read_validators, refresh_sources
+)
+
+
+class StandIn(BaseHTTPRequestHandler):
+    """Serves server.pages, honouring conditional requests like Wikipedia"""
+
+    def do_GET(self):
+        self.server.requests.append((self.path, dict(self.headers)))
+        if self.path not in self.server.pages:
+            self.send_error(404)
+            return
+
+        (body, etag, modified) = self.server.pages[self.path]
+        if (
+            (etag and self.headers.get("If-None-Match") == etag) or
+            (modified and self.headers.get("If-Modified-Since") == modified)
+        ):
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        if etag:
+            self.send_header("ETag", etag)
+        if modified:
+            self.send_header("Last-Modified", modified)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestDownload(unittest.TestCase):
+    """Tests for refreshing the sources against a local stand-in server"""
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StandIn)
+        self.server.pages = {
+            "/ug": (b"<html>underground</html>" * 10000, '"v1"', None),
+            "/dlr": (
+                b"<html>dlr</html>", None, "Mon, 01 Jan 2024 00:00:00 GMT"
+            ),
+        }
+        self.server.requests = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+        url = f"http://127.0.0.1:{self.server.server_port}"
+        self.sources = {"underground.html": url + "/ug", "dlr.html": url + "/dlr"}
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.directory.cleanup()
+
+    def refresh(self):
+        downloads = refresh_sources(self.sources, self.directory.name)
+        return {d.filename: d for d in downloads}
+
+    def path(self, filename):
+        return os.path.join(self.directory.name, filename)
+
+    def read(self, filename):
+        with open(self.path(filename), "rb") as fd:
+            return fd.read()
+
+    def test_first_download(self):
+        downloads = self.refresh()
+        self.assertEqual(
+            {(os.path.basename(f), d.changed, d.status)
+             for (f, d) in downloads.items()},
+            {("underground.html", True, 200), ("dlr.html", True, 200)}
+        )
+        self.assertEqual(
+            self.read("underground.html"), self.server.pages["/ug"][0]
+        )
+        self.assertEqual(read_validators(self.path("underground.html")).etag,
+                         '"v1"')
+        self.assertEqual(
+            read_validators(self.path("dlr.html")).last_modified,
+            "Mon, 01 Jan 2024 00:00:00 GMT"
+        )
+
+        # Nothing but the pages and their validators left behind
+        self.assertEqual(
+            sorted(os.listdir(self.directory.name)),
+            sorted([
+                "dlr.html", "dlr.html" + SIDECAR_SUFFIX,
+                "underground.html", "underground.html" + SIDECAR_SUFFIX,
+            ])
+        )
+
+    def test_unchanged(self):
+        self.refresh()
+        self.server.requests.clear()
+
+        downloads = self.refresh()
+        self.assertEqual(
+            {(d.changed, d.status) for d in downloads.values()},
+            {(False, 304)}
+        )
+        headers = dict(self.server.requests)
+        self.assertEqual(headers["/ug"]["If-None-Match"], '"v1"')
+        self.assertEqual(
+            headers["/dlr"]["If-Modified-Since"],
+            "Mon, 01 Jan 2024 00:00:00 GMT"
+        )
+
+    def test_changed(self):
+        self.refresh()
+        self.server.pages["/ug"] = (b"<html>new</html>", '"v2"', None)
+
+        downloads = self.refresh()
+        self.assertTrue(downloads[self.path("underground.html")].changed)
+        self.assertFalse(downloads[self.path("dlr.html")].changed)
+        self.assertEqual(self.read("underground.html"), b"<html>new</html>")
+        self.assertEqual(
+            read_validators(self.path("underground.html")).etag, '"v2"'
+        )
+
+    def test_same_content_resent(self):
+        # A server without validators sends the page again every time
+        self.server.pages["/dlr"] = (b"<html>dlr</html>", None, None)
+        self.refresh()
+
+        downloads = self.refresh()
+        self.assertEqual(downloads[self.path("dlr.html")].status, 200)
+        self.assertFalse(downloads[self.path("dlr.html")].changed)
+
+    def test_missing_file_downloaded_again(self):
+        self.refresh()
+        os.remove(self.path("dlr.html"))
+
+        downloads = self.refresh()
+        self.assertTrue(downloads[self.path("dlr.html")].changed)
+        self.assertEqual(self.read("dlr.html"), b"<html>dlr</html>")
+
+    def test_failure_keeps_old_file(self):
+        self.refresh()
+        del self.server.pages["/ug"]
+        os.remove(self.path("underground.html") + SIDECAR_SUFFIX)
+
+        downloads = self.refresh()
+        failed = downloads[self.path("underground.html")]
+        self.assertFalse(failed.changed)
+        self.assertEqual(failed.status, 404)
+        self.assertIsNotNone(failed.error)
+        self.assertEqual(
+            self.read("underground.html"), b"<html>underground</html>" * 10000
+        )
+        self.assertIsNone(downloads[self.path("dlr.html")].error)
+
+    def test_unreachable(self):
+        filename = self.path("page.html")
+        download = fetch(requests.Session(), "http://127.0.0.1:1/", filename)
+        self.assertFalse(download.changed)
+        self.assertIsNone(download.status)
+        self.assertIsNotNone(download.error)
+        self.assertEqual(os.listdir(self.directory.name), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+import context
+import unittest
+
+import json
+
+from underground.encoding import (
+    dictionary, pack_route, pack_route_ids, packb, unpackb
+)
+from underground.model import Model
+from underground.queries import shortest_route
+from underground.server import route_json
+
+
+class TestMessagePack(unittest.TestCase):
+    """Tests for the MessagePack encoder and decoder"""
+
+    def test_known_encodings(self):
+        # From the MessagePack specification
+        for (value, data) in [
+            (None, b"\xc0"), (False, b"\xc2"), (True, b"\xc3"),
+            (0, b"\x00"), (127, b"\x7f"), (128, b"\xcc\x80"),
+            (-1, b"\xff"), (-32, b"\xe0"), (-33, b"\xd0\xdf"),
+            (256, b"\xcd\x01\x00"), (-129, b"\xd1\xff\x7f"),
+            (1.5, b"\xcb\x3f\xf8\x00\x00\x00\x00\x00\x00"),
+            ("", b"\xa0"), ("a", b"\xa1a"),
+            ("a" * 32, b"\xd9\x20" + b"a" * 32),
+            ([], b"\x90"), ([1, 2], b"\x92\x01\x02"),
+            ({"a": 1}, b"\x81\xa1a\x01"), (b"\x00", b"\xc4\x01\x00"),
+        ]:
+            self.assertEqual(packb(value), data, value)
+            self.assertEqual(unpackb(data), value)
+
+    def test_round_trip(self):
+        for value in [
+            2 ** 64 - 1, -2 ** 63, 2 ** 32, -2 ** 31 - 1, 65535, 65536,
+            "Łódź ☃" * 100, "x" * 70000, [*range(20)], [None] * 70000,
+            {str(n): [n, float(n), n % 2 == 0] for n in range(20)},
+            b"\x01" * 300, {"nested": {"list": [{"a": []}]}},
+        ]:
+            self.assertEqual(unpackb(packb(value)), value)
+
+        # Tuples are arrays, as in JSON
+        self.assertEqual(unpackb(packb((1, (2, 3)))), [1, [2, 3]])
+
+    def test_invalid(self):
+        self.assertRaises(TypeError, lambda: packb({1, 2}))
+        self.assertRaises(ValueError, lambda: packb(2 ** 64))
+        self.assertRaises(ValueError, lambda: unpackb(b"\x92\x01"))
+        self.assertRaises(ValueError, lambda: unpackb(b"\x01\x02"))
+        self.assertRaises(ValueError, lambda: unpackb(b"\xc1"))
+
+
+class TestRoutes(unittest.TestCase):
+    """Tests for the route encodings"""
+
+    def setUp(self):
+        self.model = Model()
+        for (name, lines) in [
+            ("Bank", ["Central", "Northern"]), ("Oval", ["Northern"]),
+            ("Stratford", ["Central"]),
+        ]:
+            self.model.add_station(name, "London", (1,))
+            for line in lines:
+                self.model.add_station_to_line(name, line)
+        self.route = shortest_route(self.model, "Oval", "Stratford")
+
+    def test_pack_route(self):
+        self.assertEqual(pack_route(self.route), packb(route_json(self.route)))
+        self.assertEqual(pack_route([]), packb([]))
+        self.assertLess(
+            len(pack_route(self.route)),
+            len(json.dumps(route_json(self.route)))
+        )
+
+    def test_route_ids(self):
+        self.model.remove_station("Bank")
+        self.model.add_station("Bank", "London", (1,))
+        self.model.add_station_to_line("Bank", "Central")
+        self.model.add_station_to_line("Bank", "Northern")
+        route = shortest_route(self.model, "Oval", "Stratford")
+
+        names = dictionary(self.model)
+        (version, ids) = unpackb(
+            pack_route_ids(self.model, route, names["version"])
+        )
+        self.assertEqual(version, names["version"])
+
+        # Removed stations leave a gap, as ids aren't reused
+        self.assertEqual(names["stations"][0], None)
+        decoded = [
+            {
+                "start": names["stations"][ids[i]],
+                "destination": names["stations"][ids[i + 1]],
+                "line": names["lines"][ids[i + 2]],
+            }
+            for i in range(0, len(ids), 3)
+        ]
+        self.assertEqual(decoded, route_json(route))
+
+    def test_dictionary_version(self):
+        # The same names give the same version, however the model got
+        # there, and different names a different one
+        version = dictionary(self.model)["version"]
+        copy = self.model.copy()
+        self.assertEqual(dictionary(copy)["version"], version)
+
+        copy.add_station_to_line("Oval", "Victoria")
+        self.assertEqual(dictionary(self.model)["version"], version)
+        self.assertNotEqual(dictionary(copy)["version"], version)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,101 @@
+import context
+import os
+import random
+import tempfile
+import unittest
+
+import numpy as np
+
+from underground import make_standard_model
+from underground.fares import FareEngine, Tariff, load_tariff
+from underground.queries import shortest_route
+
+model = make_standard_model()
+
+
+def tariff_csv(zones=9):
+    """A simple tariff: 200p plus 50p a zone, and 80p more for zone 1"""
+    rows = ["from_zone,to_zone,peak,off_peak"]
+    for low in range(1, zones + 1):
+        for high in range(low, zones + 1):
+            peak = 200 + 50 * (high - low) + (80 if low == 1 else 0)
+            rows.append(f"{low},{high},{peak},{peak - 30}")
+    return "\n".join(rows) + "\n"
+
+
+class TestFares(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "tariff.csv")
+        with open(self.path, "w") as fd:
+            fd.write(tariff_csv())
+        self.engine = FareEngine(model, load_tariff(self.path))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_load(self):
+        tariff = load_tariff(self.path)
+        self.assertEqual(tariff.peak[(1, 1)], 280)
+        self.assertEqual(tariff.off_peak[(2, 4)], 270)
+
+        with open(self.path, "a") as fd:
+            fd.write("1,one,300,250\n")
+        self.assertRaises(ValueError, lambda: load_tariff(self.path))
+
+        # Every range of zones the model uses needs a fare
+        self.assertRaises(
+            ValueError,
+            lambda: FareEngine(model, Tariff(peak={(1, 1): 1}, off_peak={}))
+        )
+
+    def test_fare(self):
+        self.assertEqual(self.engine.fare("Marylebone", "Holborn"), 280)
+        self.assertEqual(
+            self.engine.fare("Marylebone", "Holborn", peak=False), 250
+        )
+        self.assertEqual(self.engine.fare("Holborn", "Acton Town"), 380)
+
+        # Archway is in zones 2 and 3, so counts as zone 3 here
+        self.assertEqual(self.engine.fare("Archway", "Acton Town"), 200)
+        self.assertEqual(self.engine.fare("Archway", "Holborn"), 330)
+
+        self.assertRaises(
+            KeyError, lambda: self.engine.fare("Foo", "Holborn")
+        )
+
+    def test_journey_fare(self):
+        # Acton Town to Balham has to go through the centre
+        journey = shortest_route(model, "Acton Town", "Balham")
+        self.assertEqual(self.engine.fare("Acton Town", "Balham"), 200)
+        self.assertEqual(self.engine.journey_fare(journey), 380)
+        self.assertEqual(self.engine.journey_fare([]), 0)
+
+    def test_batch(self):
+        names = sorted(model.stations())
+        rng = random.Random(0)
+        pairs = [(rng.choice(names), rng.choice(names)) for _ in range(500)]
+        peak = np.array([rng.random() < 0.5 for _ in pairs])
+
+        fares = self.engine.fares(
+            np.array([model.station_id(a) for (a, _) in pairs]),
+            np.array([model.station_id(b) for (_, b) in pairs]),
+            peak
+        )
+        self.assertEqual(
+            fares.tolist(),
+            [
+                self.engine.fare(a, b, bool(p))
+                for ((a, b), p) in zip(pairs, peak)
+            ]
+        )
+
+        self.assertRaises(
+            ValueError, lambda: self.engine.fares([0], [model.station_id_bound()])
+        )
+        self.assertEqual(self.engine.fares([], []).tolist(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
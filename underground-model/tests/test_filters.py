@@ -0,0 +1,186 @@
+import context
+import unittest
+
+from underground import make_standard_model
+from underground.filters import (
+    AllStations, And, HasProperty, InDistrict, InZone, Not, OnLine, Or,
+    parse_filter
+)
+from underground.model import Model
+
+# Use the real model, and compare every filter against a plain scan
+model = make_standard_model()
+
+
+def scan(predicate):
+    """The stations matching a predicate, by brute force"""
+    return sorted(
+        name for name in model.stations()
+        if predicate(model.station(name))
+    )
+
+
+class TestFilters(unittest.TestCase):
+    """Tests for evaluating compound filters on the bitset indexes"""
+
+    def test_atoms(self):
+        self.assertEqual(
+            sorted(model.select(OnLine("Jubilee"))),
+            sorted(model.line("Jubilee").stations)
+        )
+        self.assertEqual(
+            sorted(model.select(InDistrict("Ealing"))),
+            sorted(model.district("Ealing").stations)
+        )
+        self.assertEqual(
+            sorted(model.select(InZone(1))),
+            sorted(model.zone(1).stations)
+        )
+        self.assertEqual(
+            sorted(model.select(AllStations())),
+            sorted(model.stations())
+        )
+
+        self.assertRaises(ValueError, lambda: model.select(OnLine("Foo")))
+        self.assertRaises(ValueError, lambda: model.select(InDistrict("Foo")))
+        self.assertRaises(ValueError, lambda: model.select(InZone(42)))
+
+    def test_combinations(self):
+        self.assertEqual(
+            sorted(model.select(
+                And(OnLine("Central"), OnLine("Jubilee"), InZone(1))
+            )),
+            ["Bond Street"]
+        )
+
+        self.assertEqual(
+            sorted(model.select(OnLine("District") & InDistrict("Ealing"))),
+            scan(lambda s: "District" in s.lines and s.district == "Ealing")
+        )
+
+        self.assertEqual(
+            sorted(model.select(
+                Or(OnLine("Waterloo & City"), InDistrict("Harrow"))
+            )),
+            scan(lambda s: "Waterloo & City" in s.lines or
+                 s.district == "Harrow")
+        )
+
+        self.assertEqual(
+            sorted(model.select(InZone(1) & ~OnLine("Circle"))),
+            scan(lambda s: 1 in s.zones and "Circle" not in s.lines)
+        )
+
+        self.assertEqual(
+            sorted(model.select(Not(AllStations()))),
+            []
+        )
+
+    def test_parse(self):
+        self.assertEqual(
+            parse_filter("line:Central AND line:Jubilee AND zone:1"),
+            And(OnLine("Central"), OnLine("Jubilee"), InZone(1))
+        )
+
+        self.assertEqual(
+            parse_filter(
+                'district:"City of London" or not (zone:1 AND line:Circle)'
+            ),
+            Or(
+                InDistrict("City of London"),
+                Not(And(InZone(1), OnLine("Circle")))
+            )
+        )
+
+        # NOT binds tighter than AND, which binds tighter than OR
+        self.assertEqual(
+            parse_filter("zone:1 OR NOT zone:2 AND line:Central"),
+            Or(InZone(1), And(Not(InZone(2)), OnLine("Central")))
+        )
+
+        for text in [
+            "", "zone:one", "colour:red", "line:Central AND",
+            "(zone:1", "zone:1)", "zone:1 zone:2", "Bank", "property:x",
+        ]:
+            self.assertRaises(ValueError, lambda: parse_filter(text))
+
+    def test_indexes_follow_changes(self):
+        model = Model()
+        model.add_station("Aldgate", "City of London", (1,))
+        model.add_station("Bank", "City of London", (1,))
+        model.add_station_to_line("Aldgate", "Circle")
+        model.add_station_to_line("Bank", "Central")
+
+        self.assertEqual(model.select(InZone(1)), ["Aldgate", "Bank"])
+
+        model.update_station("Bank", "City of London", (2,))
+        self.assertEqual(model.select(InZone(1)), ["Aldgate"])
+        self.assertEqual(model.select(InZone(2)), ["Bank"])
+
+        # Evaluated before each change as well as after, as the model
+        # keeps the bitsets it has worked out
+        self.assertEqual(model.select(OnLine("Central")), ["Bank"])
+        self.assertEqual(model.select(OnLine("Circle")), ["Aldgate"])
+        model.remove_station_from_line("Aldgate", "Circle")
+        model.add_station_to_line("Aldgate", "Central")
+        self.assertEqual(model.select(OnLine("Central")), ["Aldgate", "Bank"])
+        self.assertRaises(ValueError, lambda: model.select(OnLine("Circle")))
+
+        self.assertEqual(
+            model.select(InDistrict("City of London")),
+            ["Aldgate", "Bank"]
+        )
+        self.assertEqual(model.select(Not(InZone(2))), ["Aldgate"])
+        copy = model.copy()
+        model.remove_station("Aldgate")
+        self.assertEqual(
+            model.select(InDistrict("City of London")),
+            ["Bank"]
+        )
+        self.assertEqual(model.select(Not(InZone(2))), [])
+
+        # The copy is unaffected
+        self.assertEqual(copy.select(Not(InZone(2))), ["Aldgate"])
+        copy.add_station("Tower Hill", "City of London", (1,))
+        self.assertEqual(copy.select(InZone(1)), ["Aldgate", "Tower Hill"])
+        self.assertRaises(ValueError, lambda: model.select(InZone(1)))
+
+    def test_properties(self):
+        model = Model()
+        for name in ["Aldgate", "Bank", "Bow Road"]:
+            model.add_station(name, "City of London", (1,))
+
+        stations = model.graph().nodes("Station")
+        stations.add_property("step_free", bool)
+        stations.add_property("operator", str)
+        stations.set("Bank", "step_free", True)
+        stations.set("Bow Road", "step_free", True)
+        stations.set("Bow Road", "operator", "London Overground")
+
+        self.assertEqual(
+            model.select(HasProperty("step_free", True)), ["Bank", "Bow Road"]
+        )
+        self.assertEqual(
+            model.select(parse_filter(
+                'property:step_free=true AND NOT '
+                'property:"operator=London Overground"'
+            )),
+            ["Bank"]
+        )
+        self.assertEqual(
+            parse_filter("property:step_free=no"),
+            HasProperty("step_free", "no")
+        )
+
+        stations.create_index("operator")
+        self.assertEqual(
+            model.select(HasProperty("operator", "London Overground")),
+            ["Bow Road"]
+        )
+
+        self.assertRaises(
+            ValueError, lambda: model.select(HasProperty("colour", "red"))
+        )
+        self.assertRaises(
+            ValueError, lambda: model.select(HasProperty("step_free", "maybe"))
+        )
@@ -0,0 +1,45 @@
+import context
+import unittest
+
+from underground.generate import generate_model
+
+
+class TestGenerate(unittest.TestCase):
+
+    def test_shape(self):
+        model = generate_model(1000, lines=20, interchange_density=0.3)
+
+        self.assertEqual(len(model.stations()), 1000)
+        self.assertEqual(len(model.lines()), 20)
+
+        interchanges = 0
+        for name in model.stations():
+            station = model.station(name)
+            self.assertGreaterEqual(len(station.lines), 1)
+            self.assertTrue(1 <= min(station.zones) <= 9)
+            interchanges += len(station.lines) > 1
+
+        # Roughly the requested proportion of interchanges
+        self.assertGreater(interchanges, 200)
+        self.assertLess(interchanges, 400)
+
+    def test_seeded(self):
+        def summary(model):
+            return [
+                (
+                    name,
+                    model.station(name).district,
+                    model.station(name).zones,
+                    model.station(name).lines
+                )
+                for name in model.stations()
+            ]
+
+        self.assertEqual(
+            summary(generate_model(200, seed=1)),
+            summary(generate_model(200, seed=1))
+        )
+        self.assertNotEqual(
+            summary(generate_model(200, seed=1)),
+            summary(generate_model(200, seed=2))
+        )
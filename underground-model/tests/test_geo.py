@@ -0,0 +1,202 @@
+import context
+import json
+import math
+import os
+import random
+import tempfile
+import time
+import unittest
+
+from underground import make_standard_model
+from underground.generate import generate_model
+from underground.geo import (
+    LocationIndex, load_locations, parse_coordinates
+)
+from underground.server import make_app
+
+model = make_standard_model()
+
+LOCATIONS = """name,latitude,longitude
+Marylebone,51.5225,-0.1631
+Baker Street,51.5226,-0.1571
+Oxford Circus,51.5152,-0.1419
+Holborn,51.5174,-0.1201
+Bank,51.5133,-0.0886
+St Pauls,51.5146,-0.0973
+Nowhere Halt,52.0,-1.0
+"""
+
+
+class TestLocations(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "locations.csv")
+        with open(self.path, "w") as fd:
+            fd.write(LOCATIONS)
+        self.locations = load_locations(self.path)
+        self.index = LocationIndex(model, self.locations)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_load(self):
+        self.assertEqual(self.locations["Bank"], (51.5133, -0.0886))
+
+        # Unknown stations are ignored, names are matched loosely
+        self.assertEqual(len(self.index), 6)
+        self.assertIn("St. Paul's", self.index.names)
+
+        with open(self.path, "a") as fd:
+            fd.write("Oval,south,-0.1\n")
+        self.assertRaises(ValueError, lambda: load_locations(self.path))
+
+    def test_nearest(self):
+        nearest = self.index.nearest_stations(51.5230, -0.1580, 2)
+        self.assertEqual(
+            [name for (name, _) in nearest],
+            ["Baker Street", "Marylebone"]
+        )
+        # About 75m
+        self.assertAlmostEqual(nearest[0][1], 75, delta=5)
+
+        # A long way from the network still finds something
+        self.assertEqual(len(self.index.nearest_stations(40.0, -3.0)), 1)
+        self.assertEqual(len(self.index.nearest_stations(51.5, -0.1, 100)), 6)
+        self.assertEqual(self.index.nearest_stations(51.5, -0.1, 0), [])
+
+    def test_within(self):
+        self.assertEqual(
+            [
+                name for (name, _) in
+                self.index.stations_within(51.5140, -0.0930, 500)
+            ],
+            ["St. Paul's", "Bank"]
+        )
+        self.assertEqual(self.index.stations_within(40.0, -3.0, 1000), [])
+
+    def test_against_scan(self):
+        # Random points around a generated network give the same answers
+        # as checking every station (allowing for the flat projection)
+        network = generate_model(2000, seed=1)
+        rng = random.Random(1)
+        locations = {
+            name: (51.3 + rng.random() * 0.4, -0.5 + rng.random() * 0.7)
+            for name in network.stations()
+        }
+        index = LocationIndex(network, locations)
+
+        for _ in range(50):
+            point = (51.2 + rng.random() * 0.6, -0.6 + rng.random() * 0.9)
+            scan = sorted(
+                (distance(point, location), name)
+                for (name, location) in locations.items()
+            )
+
+            nearest = index.nearest_stations(*point, 5)
+            for ((_, found), (expected, _)) in zip(nearest, scan[:5]):
+                self.assertAlmostEqual(found, expected, delta=expected / 100)
+
+            within = {name for (name, _) in index.stations_within(*point, 1500)}
+            self.assertLessEqual(
+                {name for (d, name) in scan if d <= 1485}, within
+            )
+            self.assertLessEqual(
+                within, {name for (d, name) in scan if d <= 1515}
+            )
+
+    def test_parse_coordinates(self):
+        self.assertEqual(parse_coordinates("@51.5,-0.1"), (51.5, -0.1))
+        self.assertIsNone(parse_coordinates("51.5,-0.1"))
+        self.assertIsNone(parse_coordinates("@51.5"))
+        self.assertIsNone(parse_coordinates("@91,0"))
+        self.assertIsNone(parse_coordinates("@nan,0"))
+        self.assertIsNone(parse_coordinates("@0,inf"))
+        self.assertIsNone(parse_coordinates("@Bank"))
+
+    def test_far_away(self):
+        # Points nowhere near the network are answered as quickly as any
+        # other, rather than walking out across the empty grid
+        network = generate_model(300, seed=2)
+        rng = random.Random(2)
+        index = LocationIndex(network, {
+            name: (51.3 + rng.random() * 0.4, -0.5 + rng.random() * 0.7)
+            for name in network.stations()
+        })
+        ranked = index.nearest_stations(51.5, -0.1, len(index))
+
+        for point in [(-51.5, 179.9), (80, -170), (10, 60), (-90, -180)]:
+            start_time = time.perf_counter()
+            nearest = index.nearest_stations(*point, 3)
+            self.assertLess(time.perf_counter() - start_time, 0.5, point)
+
+            everything = index.nearest_stations(*point, len(index))
+            self.assertEqual(nearest, everything[:3])
+            self.assertEqual(len(everything), len(ranked))
+
+    def test_server(self):
+        client = make_app(model, locations=self.locations).test_client()
+
+        response = client.get("/nearest?lat=51.5230&lon=-0.1580&k=1")
+        self.assertEqual(
+            json.loads(response.data),
+            [{"name": "Baker Street", "distance": 77}]
+        )
+
+        response = client.get("/within?lat=51.5140&lon=-0.0930&radius=500")
+        self.assertEqual(
+            [station["name"] for station in json.loads(response.data)],
+            ["St. Paul's", "Bank"]
+        )
+
+        response = client.get("/nearest?lat=north&lon=-0.1")
+        self.assertEqual(
+            json.loads(response.data), {"error": "Invalid coordinates"}
+        )
+        response = client.get("/within?lat=51.5&lon=-0.1")
+        self.assertEqual(
+            json.loads(response.data), {"error": "Invalid radius"}
+        )
+
+        # float() accepts these, but they're no use as a point or radius
+        for radius in ["inf", "nan", "-1"]:
+            response = client.get(
+                f"/within?lat=51.5&lon=-0.1&radius={radius}"
+            )
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(
+                json.loads(response.data), {"error": "Invalid radius"}
+            )
+        for point in ["lat=nan&lon=-0.1", "lat=51.5&lon=inf"]:
+            for path in ["/nearest", "/within"]:
+                response = client.get(f"{path}?{point}&radius=500")
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(
+                    json.loads(response.data),
+                    {"error": "Invalid coordinates"}
+                )
+
+        # Routes can start from coordinates
+        response = client.get("/route/@51.5230,-0.1580/Bank")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data)[0]["start"], "Baker Street")
+
+        # Without locations
+        client = make_app(model).test_client()
+        response = client.get("/nearest?lat=51.5&lon=-0.1")
+        self.assertEqual(
+            json.loads(response.data),
+            {"error": "No station locations available"}
+        )
+
+
+def distance(a, b):
+    """Distance in metres by the haversine formula"""
+    (lat1, lon1, lat2, lon2) = map(math.radians, (*a, *b))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + \
+        math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6371000.0 * math.asin(math.sqrt(h))
+
+
+if __name__ == "__main__":
+    unittest.main()
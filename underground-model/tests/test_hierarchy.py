@@ -0,0 +1,158 @@
+import context
+import random
+import unittest
+
+from underground import make_standard_model
+from underground.generate import generate_model
+from underground.graph import (
+    BoardingGraph, StationGraph, dijkstra_route, journey_cost
+)
+from underground.hierarchy import ContractionHierarchy
+from underground.queries import shortest_route
+from underground.server import route_json
+
+model = make_standard_model()
+graph = StationGraph(model)
+boarding = BoardingGraph(model)
+hierarchy = ContractionHierarchy(boarding)
+
+
+def random_pairs(model, count, seed=0):
+    rng = random.Random(seed)
+    names = [*model.stations()]
+    return [tuple(rng.sample(names, 2)) for _ in range(count)]
+
+
+class TestStationGraph(unittest.TestCase):
+
+    def assertValidJourney(self, model, start, destination, journey):
+        """Check a journey joins up and uses real lines"""
+        self.assertEqual(journey[0].start, start)
+        self.assertEqual(journey[-1].destination, destination)
+
+        for (previous, segment) in zip(journey, journey[1:]):
+            self.assertEqual(previous.destination, segment.start)
+            self.assertNotEqual(previous.line, segment.line)
+
+        for segment in journey:
+            self.assertIn(segment.line, model.station(segment.start).lines)
+            self.assertIn(
+                segment.line,
+                model.station(segment.destination).lines
+            )
+
+    def test_graph(self):
+        self.assertEqual(len(graph), len(model.stations()))
+
+        # An edge between every pair of stations sharing a line
+        acton = graph.nodes["Acton Town"]
+        neighbours = {graph.names[target] for (target, _, _) in graph.edges(acton)}
+        self.assertEqual(
+            neighbours,
+            {
+                *model.line("District").stations,
+                *model.line("Piccadilly").stations
+            } - {"Acton Town"}
+        )
+
+    def test_boarding_graph(self):
+        self.assertEqual(
+            len(boarding),
+            len(model.stations()) + len(model.lines()) + len({
+                (line, model.station(station).district)
+                for line in model.lines()
+                for station in model.line(line).stations
+            })
+        )
+        # Far fewer edges than joining every pair of stations on a line
+        self.assertLess(boarding.edge_count(), graph.edge_count() / 4)
+
+        # Boarding any line at Bank goes via a node for the City
+        bank = boarding.nodes["Bank"]
+        boarded = [target for (target, weight) in boarding.edges(bank)]
+        self.assertEqual(
+            sorted(boarding.line_names[boarding.node_lines[node]]
+                   for node in boarded),
+            sorted(model.station("Bank").lines)
+        )
+
+        # Bank to Oval on the Northern line via its line node, then on to
+        # Kennington, is a single segment
+        (northern,) = [
+            node for node in boarded
+            if boarding.line_names[boarding.node_lines[node]] == "Northern"
+        ]
+        (line_node,) = [
+            target for (target, weight) in boarding.edges(northern)
+            if boarding.node_lines[target] >= 0
+        ]
+        oval = boarding.nodes["Oval"]
+        (oval_northern,) = [
+            target for (target, weight) in boarding.edges(oval)
+            if boarding.line_names[boarding.node_lines[target]] == "Northern"
+        ]
+        path = [
+            bank, northern, line_node, oval, oval_northern,
+            boarding.nodes["Kennington"]
+        ]
+        self.assertEqual(
+            route_json(boarding.segments(path)),
+            [{
+                "start": "Bank", "destination": "Kennington",
+                "line": "Northern"
+            }]
+        )
+
+    def test_dijkstra(self):
+        for (start, destination) in random_pairs(model, 50):
+            journey = dijkstra_route(graph, start, destination)
+            self.assertValidJourney(model, start, destination, journey)
+
+            # shortest_route is a heuristic over the same costs, so can't
+            # beat the exact search
+            self.assertLessEqual(
+                journey_cost(model, journey),
+                journey_cost(
+                    model, shortest_route(model, start, destination)
+                ) + 1e-9
+            )
+
+        self.assertRaises(
+            KeyError, lambda: dijkstra_route(graph, "Bank", "Foo")
+        )
+
+    def test_hierarchy(self):
+        for (start, destination) in random_pairs(model, 200):
+            journey = hierarchy.route(start, destination)
+            self.assertValidJourney(model, start, destination, journey)
+            self.assertAlmostEqual(
+                journey_cost(model, journey),
+                journey_cost(model, dijkstra_route(graph, start, destination))
+            )
+
+        self.assertEqual(hierarchy.route("Bank", "Bank"), [])
+        self.assertRaises(KeyError, lambda: hierarchy.route("Bank", "Foo"))
+        self.assertEqual(hierarchy.version(), model.version())
+
+    def test_hierarchy_generated(self):
+        generated = generate_model(600, seed=3)
+        generated_graph = StationGraph(generated)
+        generated_hierarchy = ContractionHierarchy(BoardingGraph(generated))
+
+        for (start, destination) in random_pairs(generated, 100):
+            try:
+                expected = dijkstra_route(generated_graph, start, destination)
+            except ValueError:
+                self.assertRaises(
+                    ValueError,
+                    lambda: generated_hierarchy.route(start, destination)
+                )
+                continue
+
+            self.assertAlmostEqual(
+                journey_cost(
+                    generated,
+                    generated_hierarchy.route(start, destination)
+                ),
+                journey_cost(generated, expected)
+            )
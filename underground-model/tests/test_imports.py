@@ -0,0 +1,83 @@
+import context
+import unittest
+
+from typing import *
+
+import json
+import os
+import subprocess
+import sys
+
+# Only needed to parse the source pages
+HTML_STACK = {"bs4", "lxml", "underground.parse"}
+
+# Only needed to serve
+SERVING_STACK = {"flask", "flask_cors", "werkzeug", "underground.server"}
+
+# Only needed for the heavier analytics
+ANALYTICS_STACK = {"numpy", "multiprocessing", "underground.graph"}
+
+PROJECT_ROOT = os.path.join(os.path.dirname(__file__), "..")
+
+
+def imported_modules(module: str) -> Set[str]:
+    """The modules in sys.modules after importing one in a fresh interpreter.
+
+    Rather than timing the import, which depends on how busy the machine
+    is, this checks what the import pulls in.
+    """
+    result = subprocess.run(
+        [
+            sys.executable, "-c",
+            f"import sys, json, {module}; print(json.dumps([*sys.modules]))"
+        ],
+        cwd=PROJECT_ROOT,
+        stdout=subprocess.PIPE,
+        universal_newlines=True,
+        check=True
+    )
+    return set(json.loads(result.stdout))
+
+
+class TestImports(unittest.TestCase):
+    """Tests that entry points only import what they need"""
+
+    def test_model(self):
+        modules = imported_modules("underground.model")
+        self.assertFalse(modules & HTML_STACK)
+        self.assertFalse(modules & SERVING_STACK)
+        self.assertFalse(modules & ANALYTICS_STACK)
+
+    def test_queries(self):
+        modules = imported_modules("underground.queries")
+        self.assertFalse(modules & HTML_STACK)
+        self.assertFalse(modules & SERVING_STACK)
+        self.assertFalse(modules & ANALYTICS_STACK)
+
+    def test_server(self):
+        modules = imported_modules("underground.server")
+        self.assertIn("flask", modules)
+        self.assertFalse(modules & HTML_STACK)
+        self.assertFalse(modules & ANALYTICS_STACK)
+
+    def test_package(self):
+        # The package itself only imports the rest when first asked for it
+        modules = imported_modules("underground")
+        self.assertFalse(modules & HTML_STACK)
+        self.assertFalse(modules & SERVING_STACK)
+        self.assertFalse(modules & ANALYTICS_STACK)
+
+    def test_lazy_attributes(self):
+        import underground
+        from underground.parse import parse_underground
+        from underground.server import make_app
+
+        self.assertIs(underground.parse_underground, parse_underground)
+        self.assertIs(underground.make_app, make_app)
+        self.assertIn("parse_dlr", dir(underground))
+        with self.assertRaises(AttributeError):
+            underground.no_such_thing
+
+
+if __name__ == "__main__":
+    unittest.main()
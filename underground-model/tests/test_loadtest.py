@@ -0,0 +1,121 @@
+import context
+import unittest
+
+import io
+import json
+from collections import Counter
+from urllib.parse import unquote
+
+from underground import make_standard_model
+from underground.loadtest import (
+    LoggedRequest, RequestLogger, Result, endpoint, percentile, run_load,
+    serve_in_background, summarise, zipf_routes
+)
+from underground.server import make_app
+
+
+class TestLoadTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.model = make_standard_model()
+
+    def test_request_logger(self):
+        app = make_app(self.model)
+        log = io.StringIO()
+        app.wsgi_app = RequestLogger(app.wsgi_app, log)
+
+        client = app.test_client()
+        client.get("/route/Bank/Oval?closed=Jubilee")
+        client.get("/station/Nowhere")
+
+        records = [
+            LoggedRequest(**json.loads(line))
+            for line in log.getvalue().splitlines()
+        ]
+        self.assertEqual(
+            [(r.path, r.status) for r in records],
+            [("/route/Bank/Oval?closed=Jubilee", 200),
+             ("/station/Nowhere", 400)]
+        )
+        self.assertTrue(all(r.seconds >= 0 for r in records))
+        self.assertLessEqual(records[0].time, records[1].time)
+
+    def test_zipf_routes(self):
+        paths = zipf_routes(self.model, 2000, seed=1)
+        self.assertEqual(len(paths), 2000)
+        self.assertEqual(paths, zipf_routes(self.model, 2000, seed=1))
+
+        stations = Counter()
+        for path in paths:
+            (_, route, start, destination) = path.split("/")
+            self.assertEqual(route, "route")
+            self.assertNotEqual(start, destination)
+            stations.update([unquote(start), unquote(destination)])
+
+        for name in stations:
+            self.assertIn(name, self.model.stations())
+
+        # Skewed towards a few popular stations
+        top = sum(count for (_, count) in stations.most_common(10))
+        self.assertGreater(top, 0.3 * sum(stations.values()))
+
+        # and the more popular ones are interchanges
+        (busiest, _) = stations.most_common(1)[0]
+        self.assertGreater(len(self.model.station(busiest).lines), 1)
+
+    def test_summarise(self):
+        results = [
+            Result("/route/A/B", 200, n / 1000) for n in range(1, 1001)
+        ] + [Result("/station/C", 404, 0.5), Result("/station/D", 0, 1.0)]
+        summary = summarise(results, 2.0)
+
+        self.assertEqual(set(summary), {"all", "/route", "/station"})
+        route = summary["/route"]
+        self.assertEqual(route["requests"], 1000)
+        self.assertEqual(route["throughput"], 500)
+        self.assertEqual(route["errors"], 0)
+        self.assertAlmostEqual(route["p50"], 501)
+        self.assertAlmostEqual(route["p99"], 991)
+        self.assertAlmostEqual(route["p999"], 1000)
+        self.assertEqual(summary["/station"]["error_rate"], 1.0)
+        self.assertEqual(summary["all"]["errors"], 2)
+
+    def test_percentile(self):
+        self.assertEqual(percentile([], 0.5), 0.0)
+        self.assertEqual(percentile([3.0], 0.999), 3.0)
+        self.assertEqual(endpoint("/search?q=bank"), "/search")
+        self.assertEqual(endpoint("/"), "/")
+
+    def test_run_load(self):
+        log = io.StringIO()
+        app = make_app(self.model)
+        app.wsgi_app = RequestLogger(app.wsgi_app, log)
+        (server, url) = serve_in_background(app)
+        try:
+            paths = zipf_routes(self.model, 20) + ["/station/Nowhere"]
+            (results, seconds) = run_load(
+                url, paths, [n / 200 for n in range(len(paths))],
+                concurrency=4
+            )
+        finally:
+            server.shutdown()
+
+        self.assertEqual([r.path for r in results], paths)
+        self.assertEqual([r.status for r in results], [200] * 20 + [400])
+        # At 200 requests a second, 21 requests take at least 0.1s
+        self.assertGreaterEqual(seconds, 0.1)
+
+        summary = summarise(results, seconds)
+        self.assertEqual(summary["/route"]["errors"], 0)
+        self.assertEqual(summary["/station"]["errors"], 1)
+
+        # Every request was logged, so the run could be replayed
+        logged = sorted(
+            json.loads(line)["path"] for line in log.getvalue().splitlines()
+        )
+        self.assertEqual(logged, sorted(paths))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+import context
+import unittest
+
+from underground.metrics import Registry
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_counter(self):
+        registry = Registry()
+        requests = registry.counter(
+            "requests_total", "Requests", ("route", "status")
+        )
+        requests.inc("/", "200")
+        requests.inc("/", "200")
+        requests.inc("/say \"hi\"", "400", amount=0.5)
+
+        self.assertEqual(requests.value("/", "200"), 2)
+        self.assertEqual(requests.value("/", "404"), 0)
+        self.assertEqual(
+            registry.render(),
+            "# HELP requests_total Requests\n"
+            "# TYPE requests_total counter\n"
+            "requests_total{route=\"/\",status=\"200\"} 2\n"
+            "requests_total{route=\"/say \\\"hi\\\"\",status=\"400\"} 0.5\n"
+        )
+
+    def test_histogram(self):
+        registry = Registry()
+        latency = registry.histogram("latency", "Latency", (0.1, 1))
+        for value in (0.05, 0.1, 0.5, 3):
+            latency.observe(value)
+
+        self.assertEqual(latency.count(), 4)
+        self.assertEqual(
+            registry.render().splitlines()[2:],
+            [
+                "latency_bucket{le=\"0.1\"} 2",
+                "latency_bucket{le=\"1\"} 3",
+                "latency_bucket{le=\"+Inf\"} 4",
+                "latency_sum 3.65",
+                "latency_count 4",
+            ]
+        )
+
+    def test_gauge(self):
+        registry = Registry()
+        registry.gauge("size", "Size", lambda: 42)
+        self.assertEqual(registry.render().splitlines()[-1], "size 42")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,7 +1,7 @@
 import context
 import unittest
 
-from underground.model import Model
+from underground.model import CountIndex, Model
 from underground.parse import parse_underground, parse_dlr
 
 class TestModel(unittest.TestCase):
@@ -46,6 +46,21 @@ class TestModel(unittest.TestCase):
             for station in line_obj.stations:
                 self.assertIn(line, model.station(station).lines)
 
+        # The count indexes agree with the data
+        self.assertEqual(len(model.station_line_counts()), len(model.stations()))
+        for station in model.stations():
+            self.assertEqual(
+                model.station_line_counts().count(station),
+                len(model.station(station).lines)
+            )
+
+        self.assertEqual(len(model.line_station_counts()), len(model.lines()))
+        for line in model.lines():
+            self.assertEqual(
+                model.line_station_counts().count(line),
+                len(model.line(line).stations)
+            )
+
 
     def test_add_stations(self):
         """Check adding stations works as expected"""
@@ -199,3 +214,158 @@ class TestModel(unittest.TestCase):
         )
 
         self.assertConsistent(model)
+
+    def test_update_station(self):
+        """Check moving a station between districts and zones"""
+        model = Model()
+
+        model.add_station("Aldgate", "City of London", (1,))
+        model.add_station("Bank", "City of London", (1,))
+
+        model.update_station("Aldgate", "Tower Hamlets", (1, 2))
+
+        self.assertEqual(model.station("Aldgate").district, "Tower Hamlets")
+        self.assertEqual(model.station("Aldgate").zones, (1, 2))
+        self.assertEqual(model.district("City of London").stations, ["Bank"])
+        self.assertEqual(model.district("Tower Hamlets").stations, ["Aldgate"])
+        self.assertEqual(model.zone(2).stations, ["Aldgate"])
+
+        # Emptied districts and zones disappear
+        model.update_station("Bank", "Tower Hamlets", (2,))
+        self.assertEqual([*model.districts()], ["Tower Hamlets"])
+        self.assertEqual([*model.zones()], [1, 2])
+
+        model.update_station("Aldgate", "Tower Hamlets", (2,))
+        self.assertEqual([*model.zones()], [2])
+
+        self.assertRaises(
+            KeyError,
+            lambda: model.update_station("Foo", "Tower Hamlets", (2,))
+        )
+
+        self.assertConsistent(model)
+
+    def test_remove_stations(self):
+        """Check removing stations and line memberships"""
+        model = Model()
+
+        model.add_station("Aldgate", "City of London", (1,))
+        model.add_station("Baker Street", "City of Westminster", (1,))
+        model.add_station_to_line("Aldgate", "Metropolitan")
+        model.add_station_to_line("Aldgate", "Circle")
+        model.add_station_to_line("Baker Street", "Metropolitan")
+
+        self.assertRaises(
+            ValueError,
+            lambda: model.remove_station_from_line("Baker Street", "Circle")
+        )
+        self.assertRaises(
+            KeyError,
+            lambda: model.remove_station_from_line("Foo", "Circle")
+        )
+
+        model.remove_station_from_line("Aldgate", "Metropolitan")
+        self.assertEqual(model.station("Aldgate").lines, ["Circle"])
+        self.assertEqual(model.line("Metropolitan").stations, ["Baker Street"])
+        self.assertConsistent(model)
+
+        # Removing the last station on a line removes the line
+        model.remove_station("Aldgate")
+        self.assertEqual([*model.stations()], ["Baker Street"])
+        self.assertEqual([*model.lines()], ["Metropolitan"])
+        self.assertEqual([*model.districts()], ["City of Westminster"])
+        self.assertConsistent(model)
+
+        self.assertRaises(KeyError, lambda: model.remove_station("Aldgate"))
+
+        model.remove_station("Baker Street")
+        self.assertEqual([*model.stations()], [])
+        self.assertEqual([*model.lines()], [])
+        self.assertEqual([*model.districts()], [])
+        self.assertEqual([*model.zones()], [])
+
+    def test_version(self):
+        """Check every change to the model bumps the version"""
+        model = Model()
+        versions = [model.version()]
+
+        model.add_station("Aldgate", "City of London", (1,))
+        versions.append(model.version())
+        model.add_station_to_line("Aldgate", "Circle")
+        versions.append(model.version())
+        model.update_station("Aldgate", "City of London", (1, 2))
+        versions.append(model.version())
+        model.remove_station_from_line("Aldgate", "Circle")
+        versions.append(model.version())
+        model.remove_station("Aldgate")
+        versions.append(model.version())
+
+        self.assertEqual(versions, sorted({*versions}))
+
+        # Failed changes leave the version alone
+        self.assertRaises(KeyError, lambda: model.remove_station("Aldgate"))
+        self.assertEqual(model.version(), versions[-1])
+
+    def test_ids(self):
+        """Check stations and lines get stable, unique ids"""
+        model = Model()
+
+        model.add_station("Aldgate", "City of London", (1,))
+        model.add_station("Bank", "City of London", (1,))
+        model.add_station_to_line("Bank", "Central")
+
+        self.assertEqual(model.station_id("Aldgate"), 0)
+        self.assertEqual(model.station_id("Bank"), 1)
+        self.assertEqual(model.station_name(1), "Bank")
+        self.assertEqual(model.line_id("Central"), 0)
+        self.assertEqual(model.line_name(0), "Central")
+        self.assertEqual(model.station_id_bound(), 2)
+        self.assertEqual(model.line_id_bound(), 1)
+
+        # Ids aren't reused after removal
+        model.remove_station("Aldgate")
+        model.add_station("Aldgate", "City of London", (1,))
+        self.assertEqual(model.station_id("Aldgate"), 2)
+        self.assertRaises(KeyError, lambda: model.station_name(0))
+        self.assertRaises(KeyError, lambda: model.station_name(5))
+
+        model.remove_station("Bank")
+        self.assertRaises(KeyError, lambda: model.line_id("Central"))
+        self.assertRaises(KeyError, lambda: model.line_name(0))
+
+
+class TestCountIndex(unittest.TestCase):
+    """Unit tests for the CountIndex class"""
+
+    def test_counts(self):
+        order = ["a", "b", "c", "d"]
+        index = CountIndex(key=order.index)
+
+        self.assertRaises(ValueError, index.max)
+        self.assertEqual(index.top(3), [])
+
+        index.set("c", 2)
+        index.set("a", 2)
+        index.set("b", 1)
+        index.set("d", 0)
+
+        self.assertEqual(index.max(), (2, ["a", "c"]))
+        self.assertEqual(index.top(3), [("a", 2), ("c", 2), ("b", 1)])
+        self.assertEqual(
+            index.top(10),
+            [("a", 2), ("c", 2), ("b", 1), ("d", 0)]
+        )
+
+        index.set("b", 5)
+        self.assertEqual(index.max(), (5, ["b"]))
+        self.assertEqual(index.count("b"), 5)
+
+        # Max drops back down as the top buckets empty
+        index.remove("b")
+        self.assertEqual(index.max(), (2, ["a", "c"]))
+        index.set("a", 0)
+        index.set("c", 0)
+        self.assertEqual(index.max(), (0, ["a", "c", "d"]))
+
+        self.assertRaises(KeyError, lambda: index.remove("b"))
+        self.assertEqual(len(index), 3)
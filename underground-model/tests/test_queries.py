@@ -2,7 +2,9 @@ import context
 import unittest
 
 from underground import make_standard_model, queries
-from underground.queries import JourneySegment
+from underground.graph import journey_cost
+from underground.model import Model
+from underground.queries import Closures, JourneySegment
 
 # Just use the main underground model for regression testing queries
 #
@@ -26,6 +28,34 @@ class TestQueries(unittest.TestCase):
             (60, ["District"])
         )
 
+    def test_top_interchanges(self):
+        top = queries.top_interchanges(model, 10)
+
+        self.assertEqual(len(top), 10)
+        self.assertEqual(top[0], ("King's Cross St Pancras", 6))
+
+        # Cross-check against a full scan of the model
+        self.assertEqual(
+            [count for (_, count) in top],
+            sorted(
+                (len(model.station(s).lines) for s in model.stations()),
+                reverse=True
+            )[:10]
+        )
+
+    def test_longest_lines(self):
+        ranked = queries.longest_lines(model, len(model.lines()))
+
+        self.assertEqual(ranked[0], ("District", 60))
+        self.assertEqual(
+            sorted(name for (name, _) in ranked),
+            sorted(model.lines())
+        )
+        for (line, count) in ranked:
+            self.assertEqual(count, len(model.line(line).stations))
+
+        self.assertEqual(queries.longest_lines(model, 0), [])
+
     def test_shortest_route(self):
         EXPECTED_ROUTES = [
             # Straightforward one
@@ -77,3 +107,242 @@ class TestQueries(unittest.TestCase):
                 queries.shortest_route(model, start, end),
                 journey
             )
+
+    def test_search_stats(self):
+        stats = queries.SearchStats()
+        queries.shortest_route(model, "Marylebone", "Holborn", stats=stats)
+        self.assertGreater(stats.lines_expanded, 0)
+        self.assertGreaterEqual(stats.stations_relaxed, stats.lines_expanded)
+
+        # Totals build up over searches
+        lines_expanded = stats.lines_expanded
+        queries.shortest_route(model, "Marylebone", "Holborn", stats=stats)
+        self.assertEqual(stats.lines_expanded, 2 * lines_expanded)
+
+    def test_shortest_route_closures(self):
+        # Bank closed: go round via West Ham instead
+        self.assertEqual(
+            queries.shortest_route(
+                model,
+                "Paddington",
+                "Cutty Sark for Maritime Greenwich",
+                Closures(stations=["Bank"])
+            ),
+            [
+                JourneySegment(
+                    start="Paddington",
+                    destination="West Ham",
+                    line="District"
+                ),
+                JourneySegment(
+                    start="West Ham",
+                    destination="Cutty Sark for Maritime Greenwich",
+                    line="Docklands Light Railway"
+                )
+            ]
+        )
+
+        # No Waterloo & City
+        self.assertEqual(
+            queries.shortest_route(
+                model, "Waterloo", "Bank",
+                Closures(lines=["Waterloo & City"])
+            ),
+            [
+                JourneySegment(
+                    start="Waterloo",
+                    destination="Bank",
+                    line="Northern"
+                )
+            ]
+        )
+
+        # Closing either end makes the journey impossible
+        self.assertRaises(
+            ValueError,
+            lambda: queries.shortest_route(
+                model, "Waterloo", "Bank", Closures(stations=["Bank"])
+            )
+        )
+
+        # Closing every line at the start makes the journey impossible
+        self.assertRaises(
+            ValueError,
+            lambda: queries.shortest_route(
+                model, "Waterloo", "Bank",
+                Closures(lines=model.station("Waterloo").lines)
+            )
+        )
+
+        # Unknown closures are rejected
+        self.assertRaises(
+            KeyError,
+            lambda: queries.shortest_route(
+                model, "Waterloo", "Bank", Closures(stations=["Foo"])
+            )
+        )
+
+    def test_closures_hashable(self):
+        self.assertEqual(
+            hash(Closures(stations=["Bank", "Aldgate"])),
+            hash(Closures(stations=("Aldgate", "Bank")))
+        )
+        self.assertFalse(Closures())
+        self.assertTrue(Closures(lines=["Central"]))
+
+    def test_reachable(self):
+        # Line A: O - P - Q, all in district D1. Q is also on line B with
+        # R, and R on line C with the cheaper S.
+        small = Model()
+        for (name, district, zone) in [
+            ("O", "D1", 3), ("P", "D1", 3), ("Q", "D1", 2),
+            ("R", "D2", 2), ("S", "D2", 1)
+        ]:
+            small.add_station(name, district, (zone,))
+        for (line, stations) in [
+            ("A", ["O", "P", "Q"]), ("B", ["Q", "R"]), ("C", ["R", "S"])
+        ]:
+            for name in stations:
+                small.add_station_to_line(name, line)
+
+        reach = queries.reachable(small, ["O"])
+        self.assertEqual(
+            {name: (r.cost, r.interchanges) for (name, r) in reach.items()},
+            {
+                "O": (0, 0), "Q": (1.5, 0), "P": (2.5, 0),
+                "R": (3.5, 1), "S": (4.0, 2)
+            }
+        )
+        self.assertEqual([*reach][:2], ["O", "Q"])
+
+        # Budget and interchange limits
+        self.assertEqual([*queries.reachable(small, ["O"], budget=3)],
+                         ["O", "Q", "P"])
+        self.assertEqual([*queries.reachable(small, ["O"], max_interchanges=1)],
+                         ["O", "Q", "P", "R"])
+
+        # Several origins: each station from the nearest
+        reach = queries.reachable(small, ["O", "S"])
+        self.assertEqual(reach["P"].origin, "O")
+        self.assertEqual(reach["R"].origin, "S")
+        self.assertEqual(reach["R"].cost, 1.5)
+
+        # Closures
+        reach = queries.reachable(small, ["O"], closures=Closures(lines=["B"]))
+        self.assertEqual([*reach], ["O", "Q", "P"])
+        self.assertRaises(
+            ValueError,
+            lambda: queries.reachable(small, ["O"], closures=Closures(["O"]))
+        )
+        self.assertRaises(KeyError, lambda: queries.reachable(small, ["Z"]))
+
+        # Never dearer than shortest_route's journey
+        reach = queries.reachable(model, ["Marylebone"])
+        self.assertEqual(len(reach), len(model.stations()))
+        for destination in ["Bank", "Upminster", "Stratford", "Morden"]:
+            journey = queries.shortest_route(model, "Marylebone", destination)
+            self.assertLessEqual(
+                reach[destination].cost, journey_cost(model, journey)
+            )
+
+    def test_pareto_routes(self):
+        # From O to T (both zone 3) without a direct line: through X in
+        # zone 1 (cheapest), W in zone 2, Y and Z staying in zone 3, or Q
+        # and R in zone 2 (no better than through W)
+        small = Model()
+        for (name, zone) in [
+            ("O", 3), ("T", 3), ("X", 1), ("W", 2), ("Y", 3), ("Z", 3),
+            ("Q", 2), ("R", 2)
+        ]:
+            small.add_station(name, name, (zone,))
+        for (line, stations) in [
+            ("A", ["O", "X"]), ("B", ["X", "T"]), ("F", ["O", "W"]),
+            ("G", ["W", "T"]), ("C", ["O", "Y"]), ("D", ["Y", "Z"]),
+            ("E", ["Z", "T"]), ("H", ["O", "Q"]), ("I", ["Q", "R"]),
+            ("J", ["R", "T"]),
+        ]:
+            for name in stations:
+                small.add_station_to_line(name, line)
+
+        def trade_off(**kwargs):
+            return [
+                (route.cost, route.interchanges, route.zones)
+                for route in queries.pareto_routes(small, "O", "T", **kwargs)
+            ]
+
+        self.assertEqual(trade_off(), [(4, 1, 4), (5, 1, 2), (9, 2, 0)])
+        self.assertEqual(
+            queries.pareto_routes(small, "O", "T")[0].journey,
+            [JourneySegment("O", "X", "A"), JourneySegment("X", "T", "B")]
+        )
+
+        self.assertEqual(
+            trade_off(closures=Closures(lines=["A"])), [(5, 1, 2), (9, 2, 0)]
+        )
+        self.assertEqual(
+            trade_off(closures=Closures(stations=["W"])),
+            [(4, 1, 4), (7, 2, 2), (9, 2, 0)]
+        )
+        self.assertRaises(
+            ValueError,
+            lambda: trade_off(closures=Closures(lines=["A", "F", "C", "H"]))
+        )
+        self.assertRaises(
+            KeyError, lambda: queries.pareto_routes(small, "O", "Nowhere")
+        )
+
+        # On the whole network the cheapest is as cheap as shortest_route,
+        # and none is beaten on everything by another
+        for (start, destination) in [
+            ("Marylebone", "Holborn"), ("Epping", "Morden"),
+            ("Upminster", "Heathrow Terminal 5"), ("Bank", "Beckton"),
+        ]:
+            routes = queries.pareto_routes(model, start, destination)
+            journey = queries.shortest_route(model, start, destination)
+            self.assertEqual(routes[0].cost, journey_cost(model, journey))
+
+            for route in routes:
+                self.assertEqual(route.journey[0].start, start)
+                self.assertEqual(route.journey[-1].destination, destination)
+                self.assertEqual(
+                    route.cost, journey_cost(model, route.journey)
+                )
+                self.assertEqual(route.interchanges, len(route.journey) - 1)
+                for other in routes:
+                    self.assertFalse(
+                        other is not route and
+                        other.cost <= route.cost and
+                        other.interchanges <= route.interchanges and
+                        other.zones <= route.zones
+                    )
+
+    def test_betweenness_centrality(self):
+        # Two lines meeting at X: every journey between the A and B
+        # stations changes there
+        small = Model()
+        for (name, zone) in [("A1", 2), ("A2", 2), ("X", 1), ("B1", 2)]:
+            small.add_station(name, name, (zone,))
+        for name in ["A1", "A2", "X"]:
+            small.add_station_to_line(name, "A")
+        for name in ["X", "B1"]:
+            small.add_station_to_line(name, "B")
+
+        centrality = queries.betweenness_centrality(small)
+        self.assertEqual(
+            centrality.stations, {"A1": 0, "A2": 0, "X": 4, "B1": 0}
+        )
+        # 6 journeys within line A plus the 4 changing at X
+        self.assertEqual(centrality.lines, {"A": 10, "B": 6})
+        self.assertEqual(centrality.version, small.version())
+
+        # Whole network, split across processes
+        centrality = queries.betweenness_centrality(model, workers=2)
+        self.assertEqual(centrality.top_stations(1)[0][0], "Bank")
+        self.assertEqual(
+            [name for (name, _) in centrality.top_lines(2)],
+            ["Northern", "Central"]
+        )
+
+        # Nobody changes trains at a station on one line
+        self.assertEqual(centrality.stations["Upminster Bridge"], 0)
+
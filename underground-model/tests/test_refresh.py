@@ -0,0 +1,130 @@
+import context
+import unittest
+
+from underground import make_standard_model
+from underground.model import Model
+from underground.refresh import (
+    StationUpdate, apply_changes, diff_models, refresh_model
+)
+
+
+def build_model(stations):
+    """Build a model from (name, district, zones, lines) tuples"""
+    model = Model()
+
+    for (name, district, zones, lines) in stations:
+        model.add_station(name, district, zones)
+        for line in lines:
+            model.add_station_to_line(name, line)
+
+    return model
+
+
+def summarise(model):
+    """Order-independent summary of the model contents"""
+    return {
+        name: (
+            model.station(name).district,
+            model.station(name).zones,
+            sorted(model.station(name).lines)
+        )
+        for name in model.stations()
+    }
+
+
+class TestRefresh(unittest.TestCase):
+    """Tests for incrementally updating a model"""
+
+    OLD = [
+        ("Aldgate", "City of London", (1,), ["Metropolitan", "Circle"]),
+        ("Bank", "City of London", (1,), ["Central", "Waterloo & City"]),
+        ("Waterloo", "Lambeth", (1,), ["Waterloo & City", "Jubilee"]),
+        ("Stratford", "Newham", (2, 3), ["Central", "Jubilee"]),
+    ]
+
+    NEW = [
+        # Aldgate loses the Metropolitan line
+        ("Aldgate", "City of London", (1,), ["Circle"]),
+        # Bank gains the DLR (and loses nothing)
+        ("Bank", "City of London", (1,),
+         ["Central", "Waterloo & City", "Docklands Light Railway"]),
+        # Waterloo removed entirely
+        # Stratford rezoned
+        ("Stratford", "Newham", (3,), ["Central", "Jubilee"]),
+        # A brand new station in a new district
+        ("Canary Wharf", "Tower Hamlets", (2,),
+         ["Jubilee", "Docklands Light Railway"]),
+    ]
+
+    def test_diff(self):
+        changes = diff_models(build_model(self.OLD), build_model(self.NEW))
+
+        self.assertEqual(
+            changes.added_stations,
+            [StationUpdate("Canary Wharf", "Tower Hamlets", (2,))]
+        )
+        self.assertEqual(changes.removed_stations, ["Waterloo"])
+        self.assertEqual(
+            changes.changed_stations,
+            [StationUpdate("Stratford", "Newham", (3,))]
+        )
+        self.assertEqual(
+            changes.added_to_lines,
+            [
+                ("Bank", "Docklands Light Railway"),
+                ("Canary Wharf", "Jubilee"),
+                ("Canary Wharf", "Docklands Light Railway"),
+            ]
+        )
+        self.assertEqual(
+            changes.removed_from_lines,
+            [("Aldgate", "Metropolitan")]
+        )
+
+        self.assertTrue(changes.stations_changed())
+        self.assertTrue(changes.routes_changed())
+
+    def test_apply(self):
+        model = build_model(self.OLD)
+        version = model.version()
+
+        changes = apply_changes(model, diff_models(model, build_model(self.NEW)))
+
+        self.assertEqual(summarise(model), summarise(build_model(self.NEW)))
+        self.assertGreater(model.version(), version)
+
+        self.assertEqual(changes.added_lines, ["Docklands Light Railway"])
+        self.assertEqual(changes.removed_lines, ["Metropolitan"])
+        self.assertEqual(changes.added_districts, ["Tower Hamlets"])
+        self.assertEqual(changes.removed_districts, ["Lambeth"])
+        self.assertEqual(changes.added_zones, [])
+        self.assertEqual(changes.removed_zones, [])
+
+    def test_no_changes(self):
+        model = build_model(self.OLD)
+        version = model.version()
+
+        changes = apply_changes(model, diff_models(model, build_model(self.OLD)))
+
+        self.assertTrue(changes.is_empty())
+        self.assertFalse(changes.stations_changed())
+        self.assertFalse(changes.routes_changed())
+        self.assertEqual(model.version(), version)
+
+    def test_refresh_standard_model(self):
+        model = make_standard_model()
+        model.remove_station("Bank")
+        model.remove_station_from_line("Acton Town", "District")
+        model.update_station("Aldgate", "Camden", (4,))
+        model.add_station("Foo", "Bar", (1,))
+
+        changes = refresh_model(model)
+
+        self.assertEqual([u.name for u in changes.added_stations], ["Bank"])
+        self.assertEqual(changes.removed_stations, ["Foo"])
+        self.assertEqual(
+            [u.name for u in changes.changed_stations],
+            ["Aldgate"]
+        )
+        self.assertIn(("Acton Town", "District"), changes.added_to_lines)
+        self.assertEqual(summarise(model), summarise(make_standard_model()))
@@ -0,0 +1,100 @@
+import context
+import unittest
+
+from underground import make_standard_model
+from underground.model import Model
+from underground.search import StationIndex, edit_distance, normalise
+
+model = make_standard_model()
+index = StationIndex(model)
+
+
+def names(results):
+    return [result.name for result in results]
+
+
+class TestNormalise(unittest.TestCase):
+
+    def test_normalise(self):
+        self.assertEqual(normalise("St. John's Wood"), "st johns wood")
+        self.assertEqual(normalise("Harrow-on-the-Hill"), "harrow on the hill")
+        self.assertEqual(normalise("Elephant & Castle"), "elephant and castle")
+        self.assertEqual(normalise("Kensington (Olympia)"), "kensington olympia")
+        self.assertEqual(normalise("  KING'S  cross "), "kings cross")
+
+    def test_edit_distance(self):
+        self.assertEqual(edit_distance("bank", "bank", 2), 0)
+        self.assertEqual(edit_distance("bank", "tank", 2), 1)
+        self.assertEqual(edit_distance("marylbone", "marylebone", 2), 1)
+        self.assertEqual(edit_distance("kitten", "sitting", 5), 3)
+
+        # Distances over the limit are capped at limit + 1
+        self.assertEqual(edit_distance("kitten", "sitting", 2), 3)
+        self.assertEqual(edit_distance("a", "abcdef", 2), 3)
+
+
+class TestStationIndex(unittest.TestCase):
+
+    def test_exact(self):
+        for station in model.stations():
+            self.assertEqual(names(index.search(station, 1)), [station])
+            self.assertTrue(index.search(station, 1)[0].exact)
+            self.assertEqual(index.resolve(station), station)
+
+    def test_normalised(self):
+        self.assertEqual(names(index.search("st pauls", 1)), ["St. Paul's"])
+        self.assertEqual(
+            names(index.search("elephant and castle", 1)),
+            ["Elephant & Castle"]
+        )
+
+    def test_prefix(self):
+        results = names(index.search("shepherd"))
+        self.assertEqual(
+            results[:2],
+            ["Shepherd's Bush", "Shepherd's Bush Market"]
+        )
+
+        # Every result for a prefix (other than typo matches) contains it
+        for result in index.search("high", 100):
+            if result.distance == 0:
+                self.assertIn("high", normalise(result.name))
+
+    def test_words(self):
+        self.assertEqual(
+            names(index.search("heathrow 5")),
+            ["Heathrow Terminal 5"]
+        )
+        self.assertEqual(names(index.search("kings cross", 1)),
+                         ["King's Cross St Pancras"])
+
+    def test_typos(self):
+        self.assertEqual(names(index.search("marylbone", 1)), ["Marylebone"])
+        self.assertEqual(
+            names(index.search("picadilly circus", 1)),
+            ["Piccadilly Circus"]
+        )
+        self.assertEqual(
+            names(index.search("harow on the hil", 1)),
+            ["Harrow-on-the-Hill"]
+        )
+
+        self.assertEqual(index.resolve("Marylbone"), "Marylebone")
+        self.assertEqual(index.resolve("Picadilly Circus"), "Piccadilly Circus")
+
+        # Too far off, or too short to guess
+        self.assertIsNone(index.resolve("Foo"))
+        self.assertIsNone(index.resolve("Ban"))
+        self.assertEqual(index.search("xyz"), [])
+        self.assertEqual(index.search(""), [])
+        self.assertEqual(index.search("bank", 0), [])
+        self.assertRaises(ValueError, lambda: index.search("bank", -1))
+
+    def test_version(self):
+        model = Model()
+        model.add_station("Bank", "City of London", (1,))
+        index = StationIndex(model)
+        self.assertEqual(index.version(), model.version())
+
+        model.add_station("Aldgate", "City of London", (1,))
+        self.assertNotEqual(index.version(), model.version())
@@ -1,11 +1,15 @@
+import gzip
 import json
+import time
+import tracemalloc
 import unittest
 
 import context
 
 from underground import make_standard_model
+from underground.encoding import MSGPACK, ROUTE_IDS, unpackb
 from underground.queries import JourneySegment
-from underground.server import make_app
+from underground.server import make_app, network_hash
 
 # Just use the main underground model for regression testing server
 #
@@ -46,6 +50,96 @@ class TestServer(unittest.TestCase):
             {"error": "No such station 'Foo'"}
         )
 
+    def test_search(self):
+        self.assertEqual(
+            json.loads(client.get("/search?q=marylbone").data)[0],
+            "Marylebone"
+        )
+        self.assertEqual(
+            len(json.loads(client.get("/search?q=h&limit=3").data)),
+            3
+        )
+        self.assertEqual(json.loads(client.get("/search?q=").data), [])
+
+        response = client.get("/search?q=h&limit=-1")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            json.loads(response.data), {"error": "Invalid limit"}
+        )
+
+    def test_filter_stations(self):
+        self.assertEqual(
+            json.loads(client.get(
+                "/stations?q=line:Central AND line:Jubilee AND zone:1"
+            ).data),
+            ["Bond Street"]
+        )
+
+        self.assertEqual(
+            json.loads(client.get("/stations?q=line:Foo").data),
+            {"error": "No such line 'Foo'"}
+        )
+
+    def test_network(self):
+        response = client.get("/network")
+        records = [
+            json.loads(line) for line in response.data.decode().splitlines()
+        ]
+        etag = response.headers["ETag"]
+
+        self.assertEqual(records[0]["type"], "network")
+        self.assertEqual(records[0]["version"], model.version())
+        stations = [r for r in records if r["type"] == "station"]
+        self.assertEqual(len(stations), len(model.stations()))
+        self.assertIn(
+            {
+                "type": "station",
+                "name": "Acton Town",
+                "district": "Ealing",
+                "zones": [3],
+                "lines": ["District", "Piccadilly"]
+            },
+            stations
+        )
+        self.assertEqual(
+            len([r for r in records if r["type"] == "line"]),
+            len(model.lines())
+        )
+
+        # Compressed
+        response = client.get(
+            "/network", headers={"Accept-Encoding": "gzip, deflate"}
+        )
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertEqual(
+            gzip.decompress(response.data).decode().splitlines(),
+            [json.dumps(record) for record in records]
+        )
+        self.assertNotEqual(response.headers["ETag"], etag)
+
+        # The ETag is a hash of the network rather than the model
+        # version, which only counts changes within this process
+        self.assertEqual(etag, f'"{network_hash(model)}"')
+        changed = model.copy()
+        changed.remove_station_from_line("Bank", "Waterloo & City")
+        self.assertNotEqual(network_hash(changed), network_hash(model))
+
+        # Refusing gzip, or not mentioning it, gets it uncompressed
+        for accept in ["gzip;q=0, deflate", "deflate", "identity"]:
+            response = client.get(
+                "/network", headers={"Accept-Encoding": accept}
+            )
+            self.assertNotIn("Content-Encoding", response.headers)
+            self.assertEqual(response.headers["ETag"], etag)
+
+        # Up to date mirrors get nothing
+        response = client.get("/network", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b"")
+
+        response = client.get("/network", headers={"If-None-Match": '"-1"'})
+        self.assertEqual(response.status_code, 200)
+
     def test_line_stations(self):
         for line in model.lines():
             self.assertEqual(
@@ -58,6 +152,67 @@ class TestServer(unittest.TestCase):
             {"error": "No such line 'Foo'"}
         )
 
+    def test_rankings(self):
+        interchanges = json.loads(client.get("/top/interchanges?k=3").data)
+        self.assertEqual(len(interchanges), 3)
+        self.assertEqual(
+            interchanges[0],
+            {"name": "King's Cross St Pancras", "lines": 6}
+        )
+
+        lines = json.loads(client.get("/top/lines").data)
+        self.assertEqual(len(lines), 10)
+        self.assertEqual(lines[0], {"name": "District", "stations": 60})
+
+    def get_counted(self, client, url, timeout=30):
+        """Get a URL answered once journeys are counted in the background"""
+        deadline = time.monotonic() + timeout
+        response = client.get(url)
+        while response.status_code == 503:
+            self.assertIn("Retry-After", response.headers)
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.05)
+            response = client.get(url)
+
+        return response
+
+    def test_critical(self):
+        critical = json.loads(
+            self.get_counted(client, "/analytics/critical?k=3").data
+        )
+        self.assertEqual(len(critical["stations"]), 3)
+        self.assertEqual(len(critical["lines"]), 3)
+        self.assertEqual(critical["stations"][0]["name"], "Bank")
+        self.assertGreater(
+            critical["stations"][0]["journeys"],
+            critical["stations"][1]["journeys"]
+        )
+
+    def test_critical_background(self):
+        # The first request doesn't wait for journeys to be counted
+        changing = make_standard_model()
+        changing_client = make_app(changing).test_client()
+        started = time.monotonic()
+        response = changing_client.get("/analytics/critical?k=1")
+        self.assertLess(time.monotonic() - started, 0.1)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers["Retry-After"], "5")
+        self.assertIn("error", json.loads(response.data))
+
+        critical = json.loads(
+            self.get_counted(changing_client, "/analytics/critical?k=1").data
+        )
+        self.assertEqual(critical["stations"][0]["name"], "Bank")
+
+        # They're counted again once the model changes
+        changing.remove_station("Bank")
+        response = changing_client.get("/analytics/critical?k=1")
+        self.assertEqual(response.status_code, 503)
+        critical = json.loads(
+            self.get_counted(changing_client, "/analytics/critical?k=1").data
+        )
+        self.assertNotEqual(critical["stations"][0]["name"], "Bank")
+
     def test_shortest_route(self):
         self.assertEqual(
             json.loads(client.get("/route/Marylebone/Holborn").data),
@@ -75,6 +230,12 @@ class TestServer(unittest.TestCase):
             ]
         )
 
+        # Mistyped names are corrected where there's an obvious match
+        self.assertEqual(
+            json.loads(client.get("/route/marylbone/HOLBORN").data),
+            json.loads(client.get("/route/Marylebone/Holborn").data)
+        )
+
         self.assertEqual(
             json.loads(client.get("/route/Marylebone/Foo").data),
             {"error": "No such station 'Foo'"}
@@ -84,3 +245,313 @@ class TestServer(unittest.TestCase):
             json.loads(client.get("/route/Foo/Holborn").data),
             {"error": "No such station 'Foo'"}
         )
+
+    def test_shortest_route_closures(self):
+        self.assertEqual(
+            json.loads(client.get(
+                "/route/Waterloo/Bank?closed_line=Waterloo %26 City"
+            ).data),
+            [
+                {
+                    "start": "Waterloo",
+                    "destination": "Bank",
+                    "line": "Northern"
+                }
+            ]
+        )
+
+        # Normal service is unaffected by the cached disrupted route
+        self.assertEqual(
+            json.loads(client.get("/route/Waterloo/Bank").data),
+            [
+                {
+                    "start": "Waterloo",
+                    "destination": "Bank",
+                    "line": "Waterloo & City"
+                }
+            ]
+        )
+
+        self.assertEqual(
+            json.loads(client.get(
+                "/route/Waterloo/Bank?closed_station=Bank"
+            ).data),
+            {"error": "Bank is closed"}
+        )
+
+        self.assertEqual(
+            json.loads(client.get(
+                "/route/Waterloo/Bank?closed_station=Foo"
+            ).data),
+            {"error": "No such station 'Foo'"}
+        )
+
+        self.assertEqual(
+            json.loads(client.get(
+                "/route/Waterloo/Bank?closed_line=Foo"
+            ).data),
+            {"error": "No such line 'Foo'"}
+        )
+
+    def test_pareto_route(self):
+        routes = json.loads(
+            client.get("/route/Epping/Morden?mode=pareto").data
+        )
+        self.assertGreater(len(routes), 1)
+        self.assertEqual(
+            routes[0]["route"],
+            json.loads(client.get("/route/Epping/Morden").data)
+        )
+        self.assertEqual(
+            sorted(routes[0]), ["cost", "interchanges", "route", "zones"]
+        )
+
+        self.assertEqual(
+            json.loads(client.get("/route/Epping/Foo?mode=pareto").data),
+            {"error": "No such station 'Foo'"}
+        )
+        self.assertEqual(
+            json.loads(client.get("/route/Epping/Morden?mode=fast").data),
+            {"error": "Invalid mode 'fast'"}
+        )
+
+    def test_reachable(self):
+        reach = json.loads(
+            client.get("/reachable/Marylebone?budget=1&interchanges=0").data
+        )
+        self.assertEqual(reach["from"], ["Marylebone"])
+        self.assertEqual(reach["stations"][0], "Marylebone")
+        self.assertEqual(len(reach["stations"]), len(reach["costs"]))
+        self.assertIn("Baker Street", reach["stations"])
+        self.assertTrue(all(cost <= 1 for cost in reach["costs"]))
+        self.assertEqual(set(reach["interchanges"]), {0})
+
+        reach = json.loads(client.get("/reachable/Marylebone?from=Bank").data)
+        self.assertEqual(reach["from"], ["Marylebone", "Bank"])
+        self.assertEqual(
+            reach["origins"][reach["stations"].index("Bank")], 1
+        )
+
+        self.assertEqual(
+            json.loads(client.get("/reachable/Foo").data),
+            {"error": "No such station 'Foo'"}
+        )
+        self.assertEqual(
+            json.loads(client.get("/reachable/Bank?budget=lots").data),
+            {"error": "Invalid budget"}
+        )
+
+    def test_metrics(self):
+        # A fresh app, so the counts start from zero
+        client = make_app(model).test_client()
+        client.get("/route/Marylebone/Holborn")
+        client.get("/route/Marylebone/Holborn")
+        client.get("/station/Foo")
+
+        metrics = client.get("/metrics").data.decode().splitlines()
+        self.assertIn(
+            'underground_requests_total{route="/route/<start>/<destination>",'
+            'status="200"} 2',
+            metrics
+        )
+        self.assertIn(
+            'underground_request_duration_seconds_count'
+            '{route="/route/<start>/<destination>"} 2',
+            metrics
+        )
+        self.assertIn(
+            'underground_errors_total{kind="unknown_station"} 1', metrics
+        )
+        # The second route came from the cache
+        self.assertIn("underground_route_searches_total 1", metrics)
+        self.assertIn("underground_route_cache_hits 1", metrics)
+        self.assertTrue(any(
+            line.startswith("underground_route_lines_expanded_total ")
+            for line in metrics
+        ))
+
+    def test_error_metrics(self):
+        # Each error response counted as the kind its endpoint gives it
+        client = make_app(model).test_client()
+        for path in [
+            "/station/Foo", "/route/Bank/Oval?closed_station=Bank",
+            "/route/Bank/Oval?closed_line=Foo", "/stations?q=zone:",
+            "/route/Bank/Oval?mode=fastest",
+        ]:
+            self.assertEqual(client.get(path).status_code, 400)
+
+        metrics = client.get("/metrics").data.decode().splitlines()
+        for (kind, count) in [
+            ("unknown_station", 1), ("closed_station", 1),
+            ("unknown_line", 1), ("bad_request", 2),
+        ]:
+            self.assertIn(
+                f'underground_errors_total{{kind="{kind}"}} {count}', metrics
+            )
+
+    def test_ask(self):
+        self.assertEqual(
+            json.loads(client.get(
+                "/ask?q=How do I get from Marylebone to Holborn?"
+            ).data),
+            {
+                "kind": "route",
+                "names": ["Marylebone", "Holborn"],
+                "answer": json.loads(
+                    client.get("/route/Marylebone/Holborn").data
+                )
+            }
+        )
+
+        self.assertEqual(
+            json.loads(client.get(
+                "/ask?q=What lines does Acton Town serve?"
+            ).data)["answer"],
+            json.loads(client.get("/station/Acton Town").data)
+        )
+
+        self.assertEqual(
+            json.loads(client.get(
+                "/ask?q=Where does the Jubilee line go?"
+            ).data)["answer"],
+            json.loads(client.get("/line/Jubilee/list-stations").data)
+        )
+
+        self.assertEqual(
+            json.loads(client.get("/ask?q=Hello").data),
+            {"error": "Couldn't find any stations or lines in the question"}
+        )
+
+
+    def test_encodings(self):
+        def get(path, accept):
+            response = client.get(path, headers={"Accept": accept})
+            self.assertEqual(response.headers["Vary"], "Accept")
+            return response
+
+        for path in [
+            "/station/Bank", "/route/Marylebone/Holborn", "/top/lines",
+            "/reachable/Oval?budget=3",
+        ]:
+            expected = json.loads(client.get(path).data)
+            response = get(path, MSGPACK)
+            self.assertEqual(response.mimetype, MSGPACK)
+            self.assertEqual(unpackb(response.data), expected)
+
+            # JSON unless MessagePack is preferred
+            for accept in ["*/*", "text/html", f"{MSGPACK};q=0.5, */*"]:
+                self.assertEqual(
+                    json.loads(get(path, accept).data), expected
+                )
+
+        # Errors are always JSON
+        response = client.get("/station/Foo", headers={"Accept": MSGPACK})
+        self.assertEqual(
+            json.loads(response.data), {"error": "No such station 'Foo'"}
+        )
+
+    def test_route_ids(self):
+        names = json.loads(client.get("/dictionary").data)
+        (version, ids) = unpackb(
+            client.get(
+                "/route/Marylebone/Holborn", headers={"Accept": ROUTE_IDS}
+            ).data
+        )
+        self.assertEqual(version, names["version"])
+        self.assertEqual(
+            [
+                [names["stations"][ids[i]], names["stations"][ids[i + 1]],
+                 names["lines"][ids[i + 2]]]
+                for i in range(0, len(ids), 3)
+            ],
+            [
+                [segment["start"], segment["destination"], segment["line"]]
+                for segment in json.loads(
+                    client.get("/route/Marylebone/Holborn").data
+                )
+            ]
+        )
+
+        # Only offered for routes
+        self.assertEqual(
+            client.get(
+                "/station/Bank", headers={"Accept": ROUTE_IDS}
+            ).mimetype,
+            "application/json"
+        )
+
+        etag = client.get("/dictionary").headers["ETag"]
+        self.assertEqual(etag, f'"{names["version"]}"')
+        self.assertEqual(
+            client.get(
+                "/dictionary", headers={"If-None-Match": etag}
+            ).status_code,
+            304
+        )
+
+
+class TestNetworks(unittest.TestCase):
+    """Tests for hosting several networks in one app"""
+
+    def setUp(self):
+        self.weekend = model.copy()
+        self.weekend.remove_station_from_line("Bank", "Waterloo & City")
+        self.client = make_app(
+            model, networks={"weekend": self.weekend}
+        ).test_client()
+
+    def get(self, path):
+        return json.loads(self.client.get(path).data)
+
+    def test_networks(self):
+        self.assertEqual(self.get("/net"), ["weekend"])
+        self.assertEqual(
+            self.get("/net/weekend/station/Bank")["lines"],
+            self.weekend.station("Bank").lines
+        )
+        self.assertIn("Waterloo & City", self.get("/station/Bank")["lines"])
+        self.assertEqual(
+            self.get("/net/weekend/line/Waterloo & City/list-stations"),
+            ["Waterloo"]
+        )
+        self.assertEqual(
+            self.get("/net/weekend/search?q=marylbone")[0], "Marylebone"
+        )
+        self.assertNotEqual(
+            self.get("/net/weekend/route/Waterloo/Bank"),
+            self.get("/route/Waterloo/Bank")
+        )
+
+        self.assertEqual(
+            self.client.get("/net/nowhere/station/Bank").status_code, 404
+        )
+        self.assertRaises(
+            ValueError, lambda: make_app(model, networks={"a/b": model})
+        )
+
+    def test_changes(self):
+        # Each network's indexes follow its own changes
+        self.weekend.add_station("Brent Cross West", "Barnet", (3,))
+        self.assertEqual(
+            self.get("/net/weekend/search?q=brent cross west")[0],
+            "Brent Cross West"
+        )
+        self.assertNotIn(
+            "Brent Cross West", self.get("/search?q=brent cross west")
+        )
+
+    def test_variants_share_memory(self):
+        def allocated(make):
+            tracemalloc.start()
+            try:
+                before = tracemalloc.get_traced_memory()[0]
+                app = make()
+                return tracemalloc.get_traced_memory()[0] - before
+            finally:
+                tracemalloc.stop()
+
+        one = allocated(lambda: make_app(model))
+        variants = {f"variant-{n}": model.copy() for n in range(4)}
+        five = allocated(lambda: make_app(model, networks=variants))
+        self.assertLess(five, one * 1.5)
+
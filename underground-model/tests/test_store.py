@@ -0,0 +1,414 @@
+import context
+import unittest
+
+import math
+import tracemalloc
+
+from underground.model import Model
+from underground.store import ChunkedList, PropertyGraph
+
+
+def keys(table, bits):
+    return table.keys_from_bits(bits)
+
+
+def allocated(make):
+    """Bytes allocated by make() and still held afterwards"""
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = make()
+        return tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+
+
+def make_model(stations):
+    """A model with six zones, 20 districts and ten lines"""
+    model = Model()
+    for n in range(stations):
+        model.add_station(f"Station {n}", f"District {n % 20}", (n % 6 + 1,))
+        model.add_station_to_line(f"Station {n}", f"Line {n % 10}")
+    return model
+
+
+class TestNodeTable(unittest.TestCase):
+    """Tests for nodes and their property columns"""
+
+    def setUp(self):
+        self.graph = PropertyGraph()
+        self.stations = self.graph.add_nodes("Station")
+        for name in ["Aldgate", "Bank", "Bow Road", "Oval"]:
+            self.stations.add(name)
+
+    def test_nodes(self):
+        stations = self.stations
+        self.assertEqual(
+            [*stations.keys()], ["Aldgate", "Bank", "Bow Road", "Oval"]
+        )
+        self.assertEqual(stations.id("Bank"), 1)
+        self.assertEqual(stations.key(2), "Bow Road")
+        self.assertEqual(keys(stations, stations.bits()), [*stations.keys()])
+
+        stations.remove("Bank")
+        self.assertNotIn("Bank", stations)
+        self.assertEqual(len(stations), 3)
+        self.assertRaises(KeyError, lambda: stations.key(1))
+        self.assertRaises(KeyError, lambda: stations.id("Bank"))
+
+        # Ids are never reused
+        self.assertEqual(stations.add("Bank"), 4)
+        self.assertEqual(stations.id_bound(), 5)
+        self.assertRaises(ValueError, lambda: stations.add("Bank"))
+
+    def test_properties(self):
+        stations = self.stations
+        stations.add_property("platforms", int)
+        stations.add_property("latitude", float)
+        stations.add_property("step_free", bool)
+        stations.add_property("operator", str)
+
+        self.assertEqual(
+            stations.properties(),
+            {"platforms": int, "latitude": float, "step_free": bool,
+             "operator": str}
+        )
+        self.assertRaises(
+            ValueError, lambda: stations.add_property("platforms", int)
+        )
+        self.assertRaises(ValueError, lambda: stations.add_property("x", list))
+
+        # Defaults until set
+        self.assertEqual(stations.get("Bank", "platforms"), 0)
+        self.assertTrue(math.isnan(stations.get("Bank", "latitude")))
+        self.assertIs(stations.get("Bank", "step_free"), False)
+        self.assertIsNone(stations.get("Bank", "operator"))
+
+        stations.set("Bank", "platforms", 10)
+        stations.set("Bank", "latitude", 51.513)
+        stations.set("Bank", "step_free", True)
+        stations.set("Bank", "operator", "TfL")
+        self.assertEqual(stations.get("Bank", "platforms"), 10)
+        self.assertEqual(stations.get("Bank", "latitude"), 51.513)
+        self.assertIs(stations.get("Bank", "step_free"), True)
+        self.assertEqual(stations.get("Bank", "operator"), "TfL")
+
+        # Nodes added later get the defaults too
+        stations.add("Epping")
+        self.assertEqual(stations.get("Epping", "platforms"), 0)
+
+        self.assertRaises(
+            KeyError, lambda: stations.get("Nowhere", "platforms")
+        )
+        self.assertRaises(KeyError, lambda: stations.get("Bank", "colour"))
+
+        self.assertEqual(stations.parse("step_free", "yes"), True)
+        self.assertEqual(stations.parse("platforms", "4"), 4)
+        self.assertRaises(ValueError, lambda: stations.parse("step_free", "?"))
+
+    def test_strings_interned(self):
+        stations = self.stations
+        stations.add_property("operator", str)
+        for name in stations.keys():
+            stations.set(name, "operator", "".join(["Tf", "L"]))
+
+        values = {
+            id(stations.get(name, "operator")) for name in stations.keys()
+        }
+        self.assertEqual(len(values), 1)
+
+    def test_where(self):
+        stations = self.stations
+        stations.add_property("platforms", int)
+        stations.add_property("operator", str)
+        for (name, platforms, operator) in [
+            ("Aldgate", 4, "TfL"), ("Bank", 10, "TfL"),
+            ("Bow Road", 2, "Overground"), ("Oval", 2, "TfL"),
+        ]:
+            stations.set(name, "platforms", platforms)
+            stations.set(name, "operator", operator)
+
+        for indexed in [False, True]:
+            if indexed:
+                stations.create_index("operator")
+                stations.create_index("platforms")
+
+            self.assertEqual(
+                keys(stations, stations.where("operator", "TfL")),
+                ["Aldgate", "Bank", "Oval"]
+            )
+            self.assertEqual(stations.where("operator", "DLR"), 0)
+            self.assertEqual(
+                keys(stations, stations.where("platforms", 2)),
+                ["Bow Road", "Oval"]
+            )
+            self.assertEqual(stations.indexed("operator"), indexed)
+
+        self.assertEqual(
+            keys(stations, stations.between("platforms", 3, 10)),
+            ["Aldgate", "Bank"]
+        )
+        self.assertRaises(
+            ValueError, lambda: stations.between("operator", "A", "Z")
+        )
+
+        # Indexes and scans follow changes
+        stations.set("Oval", "operator", "Overground")
+        stations.remove("Bow Road")
+        stations.add("Epping")
+        self.assertEqual(
+            keys(stations, stations.where("operator", "Overground")), ["Oval"]
+        )
+        self.assertEqual(
+            keys(stations, stations.where("operator", None)), ["Epping"]
+        )
+        self.assertEqual(
+            keys(stations, stations.between("platforms", 0, 2)),
+            ["Oval", "Epping"]
+        )
+
+    def test_many_nodes(self):
+        # Bitsets built from numpy masks line up with the ids
+        stations = self.graph.add_nodes("Generated")
+        stations.add_property("n", int)
+        for n in range(1000):
+            stations.add(n)
+            stations.set(n, "n", n % 7)
+        stations.remove(14)
+
+        self.assertEqual(
+            keys(stations, stations.where("n", 0)),
+            [n for n in range(1000) if n % 7 == 0 and n != 14]
+        )
+        self.assertEqual(
+            keys(stations, stations.between("n", 5, 6)),
+            [n for n in range(1000) if n % 7 >= 5]
+        )
+
+
+class TestRelationshipTable(unittest.TestCase):
+    """Tests for relationships, their indexes and CSR form"""
+
+    def setUp(self):
+        self.graph = PropertyGraph()
+        self.stations = self.graph.add_nodes("Station")
+        self.lines = self.graph.add_nodes("Line")
+        for name in ["Aldgate", "Bank", "Oval"]:
+            self.stations.add(name)
+        for name in ["Circle", "Central", "Northern"]:
+            self.lines.add(name)
+        self.on = self.graph.add_relationships(
+            "ON_LINE", "Station", "Line", degrees=True
+        )
+
+        for (station, line) in [
+            ("Aldgate", "Circle"), ("Bank", "Central"), ("Bank", "Northern"),
+            ("Oval", "Northern"),
+        ]:
+            self.on.add(station, line)
+
+    def test_relationships(self):
+        self.assertEqual(len(self.on), 4)
+        self.assertTrue(self.on.has("Bank", "Central"))
+        self.assertFalse(self.on.has("Aldgate", "Central"))
+        self.assertEqual(self.on.targets("Bank"), ["Central", "Northern"])
+        self.assertEqual(self.on.sources("Northern"), ["Bank", "Oval"])
+        self.assertEqual(
+            keys(self.stations, self.on.source_bits("Northern")),
+            ["Bank", "Oval"]
+        )
+
+        self.assertRaises(
+            ValueError, lambda: self.on.add("Bank", "Central")
+        )
+        self.assertRaises(KeyError, lambda: self.on.add("Bank", "Jubilee"))
+        self.assertRaises(KeyError, lambda: self.on.add("Epping", "Central"))
+        self.on.remove("Bank", "Central")
+        self.assertRaises(
+            ValueError, lambda: self.on.remove("Bank", "Central")
+        )
+        self.assertEqual(self.on.targets("Bank"), ["Northern"])
+        self.assertEqual(self.on.source_bits("Central"), 0)
+
+    def test_degrees(self):
+        self.assertEqual(self.on.out_degrees.max(), (2, ["Bank"]))
+        self.assertEqual(
+            self.on.in_degrees.top(3),
+            [("Northern", 2), ("Circle", 1), ("Central", 1)]
+        )
+
+        # Without degrees=True there's no index
+        self.graph.add_nodes("Zone")
+        in_zone = self.graph.add_relationships("IN_ZONE", "Station", "Zone")
+        self.assertIsNone(in_zone.out_degrees)
+
+    def test_csr(self):
+        (offsets, targets) = self.on.csr()
+        self.assertEqual([*offsets], [0, 1, 3, 4])
+        self.assertEqual([*targets], [0, 1, 2, 2])
+
+        (offsets, sources) = self.on.csr(reverse=True)
+        self.assertEqual([*offsets], [0, 1, 2, 4])
+        self.assertEqual([*sources], [0, 1, 1, 2])
+
+        # Kept until something changes
+        self.assertIs(self.on.csr()[0], self.on.csr()[0])
+        self.on.remove("Aldgate", "Circle")
+        self.assertEqual([*self.on.csr()[0]], [0, 0, 2, 3])
+
+        # Removed nodes leave holes
+        self.stations.remove("Bank")
+        (offsets, targets) = self.on.csr()
+        self.assertEqual([*offsets], [0, 0, 0, 1])
+        self.assertEqual([*targets], [2])
+
+    def test_node_removal(self):
+        version = self.graph.version()
+        self.stations.remove("Bank")
+        self.assertGreater(self.graph.version(), version)
+
+        self.assertEqual(len(self.on), 2)
+        self.assertEqual(self.on.sources("Northern"), ["Oval"])
+        self.assertEqual(self.on.in_degrees.count("Central"), 0)
+        self.assertRaises(KeyError, lambda: self.on.out_degrees.count("Bank"))
+
+        self.lines.remove("Northern")
+        self.assertEqual(self.on.targets("Oval"), [])
+        self.assertEqual(len(self.on), 1)
+
+        # New nodes join the relationship's indexes
+        self.stations.add("Epping")
+        self.assertEqual(self.on.targets("Epping"), [])
+        self.assertEqual(self.on.out_degrees.count("Epping"), 0)
+
+
+class TestChunkedList(unittest.TestCase):
+    """Tests for lists which share chunks with their copies"""
+
+    def test_list(self):
+        items = ChunkedList(range(150))
+        self.assertEqual(len(items), 150)
+        self.assertEqual(items, [*range(150)])
+        self.assertEqual((items[0], items[70], items[-1]), (0, 70, 149))
+        self.assertIn(130, items)
+
+        items.remove(70)
+        self.assertNotIn(70, items)
+        self.assertEqual(items[70], 71)
+        self.assertRaises(ValueError, lambda: items.remove(70))
+        self.assertRaises(IndexError, lambda: items[149])
+
+    def test_copy(self):
+        items = ChunkedList(range(150))
+        copy = items.copy()
+        copy.remove(10)
+        copy.append(150)
+        self.assertEqual(items, [*range(150)])
+        self.assertEqual(copy, [*range(10), *range(11, 151)])
+
+        # Only the chunks changed were copied
+        self.assertIs(copy._chunks[1], items._chunks[1])
+        self.assertIsNot(copy._chunks[0], items._chunks[0])
+
+
+class TestModelGraph(unittest.TestCase):
+    """Tests for the Model as a façade over the graph"""
+
+    def test_model_graph(self):
+        model = Model()
+        model.add_station("Bank", "City of London", (1,))
+        model.add_station("Stratford", "Newham", (2, 3))
+        model.add_station_to_line("Bank", "Central")
+        model.add_station_to_line("Stratford", "Central")
+
+        graph = model.graph()
+        self.assertEqual(
+            [*graph.labels()], ["Station", "Line", "District", "Zone"]
+        )
+        on_line = graph.relationships("ON_LINE")
+        self.assertEqual(
+            keys(graph.nodes("Station"), on_line.source_bits("Central")),
+            ["Bank", "Stratford"]
+        )
+
+        # Properties added to the graph don't disturb the model
+        stations = graph.nodes("Station")
+        stations.add_property("step_free", bool)
+        version = model.version()
+        stations.set("Stratford", "step_free", True)
+        self.assertGreater(model.version(), version)
+        self.assertEqual(model.station("Stratford").zones, (2, 3))
+
+        # and stations added later get the property
+        model.add_station("Oval", "Lambeth", (2,))
+        self.assertIs(stations.get("Oval", "step_free"), False)
+
+    def test_views_follow_changes(self):
+        model = Model()
+        model.add_station("Bank", "City of London", (1,))
+        bank = model.station("Bank")
+        self.assertIs(model.station("Bank"), bank)
+
+        model.add_station_to_line("Bank", "Central")
+        self.assertEqual(model.station("Bank").lines, ["Central"])
+        self.assertEqual(model.line("Central").stations, ["Bank"])
+
+        model.update_station("Bank", "City", (1, 2))
+        self.assertEqual(model.station("Bank").zones, (1, 2))
+        self.assertEqual(model.zone(2).stations, ["Bank"])
+        self.assertRaises(KeyError, lambda: model.district("City of London"))
+
+    def test_copy(self):
+        model = Model()
+        model.add_station("Bank", "City of London", (1,))
+        model.add_station("Oval", "Lambeth", (2,))
+        model.add_station_to_line("Bank", "Northern")
+        model.add_station_to_line("Oval", "Northern")
+        bank = model.station("Bank")
+        copy = model.copy()
+        self.assertIs(copy.station("Bank"), bank)
+
+        # Changes to either side are copied on write, not seen by the other
+        copy.remove_station_from_line("Bank", "Northern")
+        model.add_station("Stratford", "Newham", (2, 3))
+        model.add_station_to_line("Stratford", "Northern")
+        self.assertEqual(copy.line("Northern").stations, ["Oval"])
+        self.assertEqual(
+            model.line("Northern").stations, ["Bank", "Oval", "Stratford"]
+        )
+        self.assertNotIn("Stratford", copy.stations())
+        self.assertEqual(copy.station("Bank").lines, [])
+        self.assertEqual(model.station("Bank").lines, ["Northern"])
+
+        # Names are interned, so equal names are the same object
+        name = "".join(["Ba", "nk"])
+        other = Model()
+        other.add_station(name, "City of London", (1,))
+        self.assertIs(other.station(name).name, model.station("Bank").name)
+
+    def test_copy_shares_memory(self):
+        model = make_model(500)
+        self.assertLess(
+            allocated(model.copy), allocated(lambda: make_model(500)) / 2
+        )
+
+    def test_variant_memory_constant(self):
+        # A variant differing by a station costs about the same however
+        # big the network, as only what's changed is copied
+        def variant_cost(stations):
+            model = make_model(stations)
+
+            def make_variant():
+                variant = model.copy()
+                variant.update_station("Station 0", "Elsewhere", (9,))
+                variant.remove_station_from_line("Station 0", "Line 0")
+                variant.add_station("New", "District 1", (1,))
+                variant.add_station_to_line("New", "Line 1")
+                return variant
+
+            return allocated(make_variant)
+
+        self.assertLess(variant_cost(8000), variant_cost(1000) * 1.5)
+
+if __name__ == "__main__":
+    unittest.main()
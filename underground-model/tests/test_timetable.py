@@ -0,0 +1,225 @@
+import context
+import json
+import os
+import tempfile
+import unittest
+
+from underground import make_standard_model
+from underground.queries import Closures
+from underground.server import make_app
+from underground.timetable import (
+    TimedJourneySegment, Timetable, format_time, parse_time
+)
+
+model = make_standard_model()
+
+STOPS = """stop_id,stop_name,parent_station
+MYB,Marylebone Underground Station,
+MYB1,Marylebone Platform 1,MYB
+OXC,Oxford Circus,
+HOL,Holborn Underground Station,
+BNK,Bank,
+NWH,Nowhere Halt,
+"""
+
+ROUTES = """route_id,route_short_name,route_long_name
+B,BAK,Bakerloo
+C,CEN,Central
+X,X1,
+"""
+
+TRIPS = """route_id,service_id,trip_id
+B,weekday,b1
+B,weekday,b2
+C,weekday,c1
+C,weekday,c2
+X,weekday,x1
+X,weekday,x2
+"""
+
+STOP_TIMES = """trip_id,arrival_time,departure_time,stop_id,stop_sequence
+b1,08:00:00,08:00:00,MYB1,1
+b1,08:05:00,08:05:00,OXC,2
+b2,08:10:00,08:10:00,MYB1,1
+b2,08:15:00,08:15:00,OXC,2
+c1,08:06:00,08:06:00,OXC,1
+c1,08:10:00,08:10:00,HOL,2
+c1,08:15:00,08:15:00,BNK,3
+c2,08:20:00,08:20:00,OXC,1
+c2,08:24:00,08:24:00,HOL,2
+c2,08:29:00,08:29:00,BNK,3
+x1,08:01:00,08:01:00,MYB,1
+x1,08:30:00,08:30:00,HOL,2
+x1,08:50:00,08:50:00,NWH,3
+x2,08:40:00,08:40:00,MYB,1
+x2,09:10:00,09:10:00,HOL,2
+x2,09:30:00,09:30:00,NWH,3
+"""
+
+
+def write_feed(directory, stop_times=STOP_TIMES):
+    for (name, content) in [
+        ("stops.txt", STOPS),
+        ("routes.txt", ROUTES),
+        ("trips.txt", TRIPS),
+        ("stop_times.txt", stop_times),
+    ]:
+        with open(os.path.join(directory, name), "w") as fd:
+            fd.write(content)
+
+
+class TestTimetable(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        write_feed(self.directory.name)
+        self.timetable = Timetable(model, self.directory.name)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_times(self):
+        self.assertEqual(parse_time("08:30"), 8 * 3600 + 30 * 60)
+        self.assertEqual(parse_time("25:00:01"), 25 * 3600 + 1)
+        self.assertEqual(format_time(8 * 3600 + 5), "08:00:05")
+        self.assertRaises(ValueError, lambda: parse_time("8.30"))
+
+    def test_load(self):
+        # Stops are matched to model stations, platforms to their parent
+        self.assertEqual(
+            sorted(self.timetable.nodes),
+            ["Bank", "Holborn", "Marylebone", "Nowhere Halt", "Oxford Circus"]
+        )
+        self.assertEqual(
+            self.timetable.line_names,
+            ["Bakerloo", "Central", "X1"]
+        )
+        self.assertEqual(self.timetable.stop_time_count(), 16)
+
+    def test_earliest_arrival(self):
+        # Change at Oxford Circus, just missing the first Central line
+        # train, still beats the direct bus
+        self.assertEqual(
+            self.timetable.earliest_arrival(
+                "Marylebone", "Holborn", parse_time("07:55")
+            ),
+            [
+                TimedJourneySegment(
+                    start="Marylebone",
+                    destination="Oxford Circus",
+                    line="Bakerloo",
+                    departure=parse_time("08:00"),
+                    arrival=parse_time("08:05")
+                ),
+                TimedJourneySegment(
+                    start="Oxford Circus",
+                    destination="Holborn",
+                    line="Central",
+                    departure=parse_time("08:20"),
+                    arrival=parse_time("08:24")
+                ),
+            ]
+        )
+
+        # Too late for the tube, but there's another bus
+        self.assertEqual(
+            self.timetable.earliest_arrival(
+                "Marylebone", "Holborn", parse_time("08:11")
+            ),
+            [
+                TimedJourneySegment(
+                    start="Marylebone",
+                    destination="Holborn",
+                    line="X1",
+                    departure=parse_time("08:40"),
+                    arrival=parse_time("09:10")
+                ),
+            ]
+        )
+
+        # Ride through a stop on the same train
+        journey = self.timetable.earliest_arrival(
+            "Oxford Circus", "Bank", parse_time("08:00")
+        )
+        self.assertEqual(len(journey), 1)
+        self.assertEqual(journey[0].arrival, parse_time("08:15"))
+
+        self.assertRaises(
+            ValueError,
+            lambda: self.timetable.earliest_arrival(
+                "Marylebone", "Holborn", parse_time("09:00")
+            )
+        )
+        self.assertRaises(
+            KeyError,
+            lambda: self.timetable.earliest_arrival(
+                "Marylebone", "Acton Town", parse_time("08:00")
+            )
+        )
+
+    def test_closures(self):
+        journey = self.timetable.earliest_arrival(
+            "Marylebone", "Holborn", parse_time("07:55"),
+            Closures(stations=["Oxford Circus"])
+        )
+        self.assertEqual([s.line for s in journey], ["X1"])
+
+        journey = self.timetable.earliest_arrival(
+            "Marylebone", "Holborn", parse_time("07:55"),
+            Closures(lines=["Central"])
+        )
+        self.assertEqual([s.line for s in journey], ["X1"])
+
+    def test_ungrouped(self):
+        with tempfile.TemporaryDirectory() as directory:
+            lines = STOP_TIMES.splitlines()
+            # Move the start of b1 to the end
+            write_feed(
+                directory,
+                "\n".join([lines[0], *lines[2:], lines[1]]) + "\n"
+            )
+            self.assertRaises(
+                ValueError,
+                lambda: Timetable(model, directory)
+            )
+
+    def test_server(self):
+        client = make_app(model, self.timetable).test_client()
+
+        self.assertEqual(
+            json.loads(client.get(
+                "/route/Marylebone/Holborn?depart=08:11"
+            ).data),
+            [
+                {
+                    "start": "Marylebone",
+                    "destination": "Holborn",
+                    "line": "X1",
+                    "departure": "08:40:00",
+                    "arrival": "09:10:00"
+                }
+            ]
+        )
+
+        self.assertEqual(
+            json.loads(client.get(
+                "/route/Marylebone/Holborn?depart=soon"
+            ).data),
+            {"error": "Invalid time 'soon'"}
+        )
+
+        self.assertEqual(
+            json.loads(client.get(
+                "/route/Marylebone/Acton Town?depart=08:00"
+            ).data),
+            {"error": "No timetabled trains at 'Acton Town'"}
+        )
+
+        # Without a timetable
+        client = make_app(model).test_client()
+        self.assertEqual(
+            json.loads(client.get(
+                "/route/Marylebone/Holborn?depart=08:00"
+            ).data),
+            {"error": "No timetable available"}
+        )
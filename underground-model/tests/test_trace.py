@@ -0,0 +1,100 @@
+import context
+import unittest
+
+from underground import make_standard_model, trace
+from underground.queries import shortest_route
+
+
+class Recorder(trace.Collector):
+    """Collector remembering every event"""
+
+    def __init__(self):
+        self.events = []
+
+    def start(self, path):
+        self.events.append(("start", path))
+
+    def end(self, path, seconds):
+        self.events.append(("end", path))
+
+
+@trace.traced("double")
+def double(x):
+    with trace.span("inner"):
+        return 2 * x
+
+
+class TestTrace(unittest.TestCase):
+
+    def test_disabled(self):
+        # Nothing listening: the shared no-op span
+        self.assertIs(trace.span("a"), trace.span("b"))
+        self.assertEqual(double(2), 4)
+        self.assertEqual(double.__name__, "double")
+
+    def test_spans(self):
+        recorder = Recorder()
+        trace.add_collector(recorder)
+        try:
+            with trace.span("outer"):
+                double(1)
+        finally:
+            trace.remove_collector(recorder)
+
+        self.assertEqual(recorder.events, [
+            ("start", ("outer",)),
+            ("start", ("outer", "double")),
+            ("start", ("outer", "double", "inner")),
+            ("end", ("outer", "double", "inner")),
+            ("end", ("outer", "double")),
+            ("end", ("outer",)),
+        ])
+
+        # Removed, so no more events
+        double(1)
+        self.assertEqual(len(recorder.events), 6)
+
+    def test_span_exception(self):
+        recorder = Recorder()
+        trace.add_collector(recorder)
+        try:
+            with self.assertRaises(ValueError):
+                with trace.span("failing"):
+                    raise ValueError()
+            with trace.span("next"):
+                pass
+        finally:
+            trace.remove_collector(recorder)
+
+        self.assertEqual(recorder.events[-1], ("end", ("next",)))
+
+    def test_phase_profile(self):
+        with trace.PhaseProfile() as profile:
+            model = make_standard_model()
+            shortest_route(model, "Marylebone", "Holborn")
+
+        phases = profile.phases
+        self.assertEqual(phases[("make_standard_model",)].calls, 1)
+        self.assertEqual(
+            phases[(
+                "make_standard_model", "parse.parse_underground",
+                "model.add_station"
+            )].calls,
+            270
+        )
+        self.assertGreater(
+            phases[(
+                "make_standard_model", "parse.parse_underground", "parse.html"
+            )].allocated,
+            0
+        )
+        self.assertEqual(phases[("queries.shortest_route",)].calls, 1)
+
+        report = profile.report().splitlines()
+        self.assertTrue(report[1].startswith("make_standard_model "))
+        self.assertTrue(report[2].startswith("  parse.parse_underground "))
+        self.assertTrue(report[-1].startswith("queries.shortest_route "))
+
+
+if __name__ == "__main__":
+    unittest.main()
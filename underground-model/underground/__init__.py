@@ -1,9 +1,44 @@
+"""A model of the London Underground and DLR, with queries and a server.
+
+Only the model itself is imported up front. The parser (and with it
+BeautifulSoup and lxml) and the server (and Flask) are imported on first
+use, so code which only needs a Model and the queries doesn't pay for
+them at start up; see tests/test_imports.py.
+"""
+
+from . import trace
 from .model import Model
-from .parse import parse_dlr, parse_underground
 
-def make_standard_model():
+# Name -> module of the attributes imported on first use
+_LAZY = {
+    "parse_dlr": "parse",
+    "parse_underground": "parse",
+    "make_app": "server",
+}
+
+
+def __getattr__(name: str):
+    if name in _LAZY:
+        from importlib import import_module
+        value = getattr(import_module("." + _LAZY[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted([*globals(), *_LAZY])
+
+
+@trace.traced("make_standard_model")
+def make_standard_model(
+    underground_file: str="underground.html",
+    dlr_file: str="dlr.html"
+):
     """Make the standard underground + DLR model."""
+    from .parse import parse_dlr, parse_underground
+
     model = Model()
-    parse_underground("underground.html", model)
-    parse_dlr("dlr.html", model)
+    parse_underground(underground_file, model)
+    parse_dlr(dlr_file, model)
     return model
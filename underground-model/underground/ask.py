@@ -0,0 +1,233 @@
+"""Find the stations and lines mentioned in free text.
+
+Used to answer questions like "How do I get from Marylebone to Holborn?"
+or "What lines does King's Cross serve?" without the client having to
+pick the names out itself.
+
+Every station and line name (and a few variants of each) is compiled into
+an Aho-Corasick automaton once, so finding every mention in a question is
+a single pass over its characters however many names there are.
+"""
+
+from typing import *
+
+import attr
+
+from .model import Model
+from .search import normalise
+
+
+# Other names people use for lines
+LINE_ALIASES = {
+    "Docklands Light Railway": ["dlr"],
+}
+
+STATION = "station"
+LINE = "line"
+
+
+@attr.s(auto_attribs=True)
+class Mention:
+    """A station or line named in some text"""
+
+    kind: str
+    """STATION or LINE"""
+
+    name: str
+    """The name of the station or line in the model"""
+
+    start: int
+    """Offset of the start of the mention in the normalised text"""
+
+    end: int
+    """Offset of the end of the mention in the normalised text"""
+
+
+def _variants(name: str) -> Set[str]:
+    """Normalised forms of a name which should be recognised"""
+    key = normalise(name)
+    variants = {key}
+
+    # "Elephant & Castle" -> "elephant castle" as well as "elephant and..."
+    if " and " in key:
+        variants.add(key.replace(" and ", " "))
+
+    # "Kensington (Olympia)" -> "kensington olympia" is already covered,
+    # but "St. Paul's" -> "saint pauls" isn't
+    if key.startswith("st "):
+        variants.add("saint " + key[3:])
+
+    return variants
+
+
+class MentionFinder:
+    """Aho-Corasick automaton over the station and line names of a Model.
+
+    The finder is a snapshot; it will not reflect changes made to the model
+    after it is built. Compare version() with the model's to tell if it
+    needs rebuilding.
+    """
+
+    _version: int
+
+    # The trie: transitions, failure links and the patterns which end at
+    # each state (including via failure links), by state number
+    _goto: List[Dict[str, int]]
+    _fail: List[int]
+    _output: List[List[int]]
+
+    # Pattern id -> (length, kind, name)
+    _patterns: List[Tuple[int, str, str]]
+
+    def __init__(self, model: Model):
+        """Compile the automaton for the model's stations and lines"""
+        self._version = model.version()
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+        self._patterns = []
+
+        for station in model.stations():
+            for variant in _variants(station):
+                self._add(variant, STATION, station)
+
+        for line in model.lines():
+            for variant in _variants(line) | {*LINE_ALIASES.get(line, [])}:
+                self._add(variant, LINE, line)
+                # So that "victoria line" means the line not the station
+                self._add(variant + " line", LINE, line)
+
+        self._link()
+
+    def version(self) -> int:
+        """The version of the model the finder was built from"""
+        return self._version
+
+    def _add(self, pattern: str, kind: str, name: str):
+        """Add a pattern to the trie"""
+        state = 0
+        for char in pattern:
+            if char not in self._goto[state]:
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+                self._goto[state][char] = len(self._goto) - 1
+            state = self._goto[state][char]
+
+        self._output[state].append(len(self._patterns))
+        self._patterns.append((len(pattern), kind, name))
+
+    def _link(self):
+        """Compute the failure links breadth first"""
+        queue = [*self._goto[0].values()]
+
+        for state in queue:
+            for (char, next_state) in self._goto[state].items():
+                queue.append(next_state)
+
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+
+                self._fail[next_state] = self._goto[fallback].get(char, 0)
+
+                self._output[next_state] = \
+                    self._output[next_state] + \
+                    self._output[self._fail[next_state]]
+
+    def find_all(self, text: str) -> List[Mention]:
+        """Every mention in the (already normalised) text, overlaps included.
+
+        Only whole words match, so "bow" does not match inside "elbow".
+        """
+        mentions = []
+        state = 0
+
+        for (end, char) in enumerate(text, 1):
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+
+            if end < len(text) and text[end] != " ":
+                continue
+
+            for pattern in self._output[state]:
+                (length, kind, name) = self._patterns[pattern]
+                start = end - length
+                if start == 0 or text[start - 1] == " ":
+                    mentions.append(Mention(kind, name, start, end))
+
+        return mentions
+
+    def find(self, text: str) -> List[Mention]:
+        """The mentions in some text, in order, without overlaps.
+
+        Where mentions overlap the longest wins, e.g. "edgware road" is
+        the station rather than a mention of "road" (were there one).
+        Where a station and a line have the same name, the station wins.
+        """
+        mentions = sorted(
+            self.find_all(normalise(text)),
+            key=lambda m: (m.start, m.start - m.end, m.kind != STATION)
+        )
+
+        result = []
+        for mention in mentions:
+            if not result or mention.start >= result[-1].end:
+                result.append(mention)
+            elif (
+                mention.end - mention.start >
+                result[-1].end - result[-1].start
+            ):
+                # A longer mention starting inside the previous one
+                result[-1] = mention
+
+        return result
+
+
+@attr.s(auto_attribs=True)
+class Question:
+    """What a free text question is asking about"""
+
+    kind: str
+    """The kind of question: route, station or line"""
+
+    names: List[str]
+    """The start and destination stations for a route, otherwise the
+    station or line in question"""
+
+
+def interpret(finder: MentionFinder, text: str) -> Question:
+    """Work out what a free text question is asking.
+
+    - Two or more stations: a route between them. The first is the start,
+      unless the text says "to A from B".
+    - One station: information about the station.
+    - Otherwise one line: the stations on the line.
+
+    Raises ValueError if no stations or lines are mentioned.
+    """
+    mentions = finder.find(text)
+    stations = [m for m in mentions if m.kind == STATION]
+    lines = [m for m in mentions if m.kind == LINE]
+
+    if len(stations) >= 2:
+        (start, destination) = stations[:2]
+
+        # "to X from Y"
+        words = normalise(text)
+        if (
+            words[:destination.start].endswith("from ") and
+            words[:start.start].endswith("to ")
+        ):
+            (start, destination) = (destination, start)
+
+        return Question("route", [start.name, destination.name])
+
+    if stations:
+        return Question("station", [stations[0].name])
+
+    if lines:
+        return Question("line", [lines[0].name])
+
+    raise ValueError("Couldn't find any stations or lines in the question")
@@ -0,0 +1,195 @@
+"""Downloading the source pages the model is parsed from.
+
+All the sources are fetched at once over a shared session. Each request
+is conditional on the ETag and Last-Modified validators saved alongside
+the file last time, so a page which hasn't changed costs a 304 and no
+download. Pages are streamed to a temporary file next to the target and
+renamed over it once complete, so a failed or interrupted download never
+leaves a half-written page behind for the parser.
+
+The results say which sources changed, so that re-parsing (and
+refresh_model) can be skipped when nothing has.
+"""
+
+from typing import *
+
+import hashlib
+import json
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import attr
+import requests
+from requests.adapters import HTTPAdapter
+
+UG_SRC = "https://en.wikipedia.org/wiki/List_of_London_Underground_stations"
+DLR_SRC = \
+    "https://en.wikipedia.org/wiki/List_of_Docklands_Light_Railway_stations"
+
+# File name -> URL of the pages make_standard_model parses
+SOURCES = {
+    "underground.html": UG_SRC,
+    "dlr.html": DLR_SRC,
+}
+
+# Bytes read from the network and written to disk at a time
+BUFFER_SIZE = 1 << 20
+
+# Seconds to wait to connect, and between bytes of the response
+TIMEOUT = 30
+
+# Appended to a file's name for the file its validators are saved in
+SIDECAR_SUFFIX = ".validators.json"
+
+
+@attr.s(auto_attribs=True)
+class Validators:
+    """What's known about the last download of a source"""
+
+    url: str
+    """The URL it was downloaded from"""
+
+    etag: Optional[str] = None
+    """The ETag response header, if any"""
+
+    last_modified: Optional[str] = None
+    """The Last-Modified response header, if any"""
+
+    sha256: Optional[str] = None
+    """Hash of the content, to spot servers resending the same page"""
+
+
+@attr.s(auto_attribs=True)
+class Download:
+    """The outcome of refreshing one source"""
+
+    filename: str
+    """Where the source is saved"""
+
+    url: str
+    """Where the source was downloaded from"""
+
+    changed: bool
+    """True if the file's content has changed"""
+
+    status: Optional[int] = None
+    """The response status, if there was a response"""
+
+    error: Optional[str] = None
+    """Why the download failed, if it did. The file is left untouched."""
+
+
+def read_validators(filename: str) -> Optional[Validators]:
+    """The validators saved for a file, if any and the file still exists"""
+    if not os.path.exists(filename):
+        return None
+    try:
+        with open(filename + SIDECAR_SUFFIX) as fd:
+            return Validators(**json.load(fd))
+    except (OSError, ValueError, TypeError):
+        return None
+
+
+def _replace(filename: str, write: Callable[[BinaryIO], None]):
+    """Write a file via a temporary file renamed over it"""
+    (fd, temporary) = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(filename)),
+        prefix=os.path.basename(filename) + ".",
+        suffix=".part"
+    )
+    try:
+        with open(fd, "wb", buffering=BUFFER_SIZE) as out:
+            write(out)
+        os.replace(temporary, filename)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+
+
+def write_validators(filename: str, validators: Validators):
+    """Save the validators for a file"""
+    _replace(
+        filename + SIDECAR_SUFFIX,
+        lambda out: out.write(json.dumps(attr.asdict(validators)).encode())
+    )
+
+
+def fetch(
+    session: requests.Session,
+    url: str,
+    filename: str,
+    timeout: float=TIMEOUT
+) -> Download:
+    """Download url to filename unless it's unchanged since last time"""
+    previous = read_validators(filename)
+    if previous is not None and previous.url != url:
+        previous = None
+
+    headers = {}
+    if previous is not None:
+        if previous.etag:
+            headers["If-None-Match"] = previous.etag
+        if previous.last_modified:
+            headers["If-Modified-Since"] = previous.last_modified
+
+    try:
+        with session.get(
+            url, headers=headers, stream=True, timeout=timeout
+        ) as response:
+            if response.status_code == 304 and previous is not None:
+                return Download(filename, url, False, 304)
+            response.raise_for_status()
+
+            digest = hashlib.sha256()
+
+            def write(out: BinaryIO):
+                for chunk in response.iter_content(BUFFER_SIZE):
+                    digest.update(chunk)
+                    out.write(chunk)
+
+            _replace(filename, write)
+
+            validators = Validators(
+                url=url,
+                etag=response.headers.get("ETag"),
+                last_modified=response.headers.get("Last-Modified"),
+                sha256=digest.hexdigest()
+            )
+            write_validators(filename, validators)
+
+            changed = previous is None or previous.sha256 != validators.sha256
+            return Download(filename, url, changed, response.status_code)
+
+    except (requests.RequestException, OSError) as e:
+        status = None
+        if isinstance(e, requests.HTTPError) and e.response is not None:
+            status = e.response.status_code
+        return Download(filename, url, False, status, str(e))
+
+
+def refresh_sources(
+    sources: Dict[str, str]=SOURCES,
+    directory: str=".",
+    session: Optional[requests.Session]=None,
+    timeout: float=TIMEOUT
+) -> List[Download]:
+    """Bring the downloaded sources up to date, all at once.
+
+    sources maps file names (relative to directory) to URLs. Returns the
+    outcome for each source, in the same order.
+    """
+    if session is None:
+        session = requests.Session()
+        # Enough pooled connections that no fetch waits for another
+        adapter = HTTPAdapter(pool_maxsize=max(1, len(sources)))
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+
+    with ThreadPoolExecutor(max(1, len(sources))) as pool:
+        return [*pool.map(
+            lambda item: fetch(
+                session, item[1], os.path.join(directory, item[0]), timeout
+            ),
+            sources.items()
+        )]
@@ -0,0 +1,289 @@
+"""Compact binary encodings of responses, for service-to-service traffic.
+
+Alongside JSON the server speaks MessagePack (https://msgpack.org), which
+encodes the same values as JSON in fewer bytes and is quicker to decode,
+and for routes an ID-based form: stations and lines as their ids in the
+model, to be looked up in the dictionary of names clients fetch once from
+/dictionary, rather than repeating every name in every journey segment.
+
+The encoder and decoder are small enough to include here rather than
+depend on the msgpack package. Routes have their own encoders writing the
+bytes straight from the journey segments, without building the dicts
+route_json would, and names and ids are only ever encoded once.
+"""
+
+from typing import *
+
+import functools
+import hashlib
+import json
+import struct
+
+from .model import Model
+from .queries import JourneySegment
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+
+# Routes as [dictionary version, [start, destination, line, start, ...]]
+# with stations and lines as ids, MessagePack encoded
+ROUTE_IDS = "application/vnd.underground.route-ids+msgpack"
+
+# Distinct strings and integers to remember the encodings of, comfortably
+# more than the names and ids in a network
+ENCODING_CACHE_SIZE = 8192
+
+
+def _header(length: int, fix: int, fix_limit: int, wide: bytes) -> bytes:
+    """A length header: fixed width if small enough, else 16 or 32 bit.
+
+    wide is the 16 and 32 bit type bytes, e.g. b"\\xdc\\xdd" for arrays.
+    """
+    if length < fix_limit:
+        return bytes([fix | length])
+    if length < 1 << 16:
+        return bytes([wide[0]]) + struct.pack(">H", length)
+    if length < 1 << 32:
+        return bytes([wide[1]]) + struct.pack(">I", length)
+    raise ValueError("Too long for MessagePack")
+
+
+def _array_header(length: int) -> bytes:
+    return _header(length, 0x90, 16, b"\xdc\xdd")
+
+
+def _map_header(length: int) -> bytes:
+    return _header(length, 0x80, 16, b"\xde\xdf")
+
+
+@functools.lru_cache(maxsize=ENCODING_CACHE_SIZE)
+def _pack_str(value: str) -> bytes:
+    data = value.encode()
+    if len(data) < 32:
+        return bytes([0xa0 | len(data)]) + data
+    if len(data) < 1 << 8:
+        return b"\xd9" + bytes([len(data)]) + data
+    return _header(len(data), 0, 0, b"\xda\xdb") + data
+
+
+# (type byte, struct format, exclusive limit) of each integer width
+_UNSIGNED = [
+    (b"\xcc", ">B", 1 << 8), (b"\xcd", ">H", 1 << 16),
+    (b"\xce", ">I", 1 << 32), (b"\xcf", ">Q", 1 << 64),
+]
+_SIGNED = [
+    (b"\xd0", ">b", 1 << 7), (b"\xd1", ">h", 1 << 15),
+    (b"\xd2", ">i", 1 << 31), (b"\xd3", ">q", 1 << 63),
+]
+
+
+@functools.lru_cache(maxsize=ENCODING_CACHE_SIZE)
+def _pack_int(value: int) -> bytes:
+    if 0 <= value < 128:
+        return bytes([value])
+    if -32 <= value < 0:
+        return bytes([value & 0xff])
+    for (code, format, limit) in _UNSIGNED if value > 0 else _SIGNED:
+        if -limit <= value < limit:
+            return code + struct.pack(format, value)
+    raise ValueError("Integer too large for MessagePack")
+
+
+def _pack(value: Any, out: bytearray):
+    """Append the MessagePack encoding of value to out"""
+    # Most likely first: names, then counts
+    if isinstance(value, str):
+        out += _pack_str(value)
+    elif value is None:
+        out.append(0xc0)
+    elif value is True:
+        out.append(0xc3)
+    elif value is False:
+        out.append(0xc2)
+    elif isinstance(value, int):
+        out += _pack_int(value)
+    elif isinstance(value, float):
+        out += b"\xcb" + struct.pack(">d", value)
+    elif isinstance(value, (list, tuple)):
+        out += _array_header(len(value))
+        for item in value:
+            _pack(item, out)
+    elif isinstance(value, dict):
+        out += _map_header(len(value))
+        for (key, item) in value.items():
+            _pack(key, out)
+            _pack(item, out)
+    elif isinstance(value, bytes):
+        if len(value) < 1 << 8:
+            out += b"\xc4" + bytes([len(value)])
+        else:
+            out += _header(len(value), 0, 0, b"\xc5\xc6")
+        out += value
+    else:
+        raise TypeError(
+            f"Object of type {type(value).__name__} is not MessagePack "
+            "serializable"
+        )
+
+
+def packb(value: Any) -> bytes:
+    """Encode a JSON-like value (plus bytes) as MessagePack.
+
+    Tuples are encoded as arrays, as json does. Raises TypeError for
+    anything else.
+    """
+    out = bytearray()
+    _pack(value, out)
+    return bytes(out)
+
+
+class _Reader:
+    """Decodes MessagePack from a buffer, one value at a time"""
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self.offset = 0
+
+    def take(self, count: int) -> bytes:
+        if self.offset + count > len(self.data):
+            raise ValueError("Truncated MessagePack")
+        data = self.data[self.offset:self.offset + count]
+        self.offset += count
+        return data
+
+    def number(self, format: str):
+        return struct.unpack(format, self.take(struct.calcsize(format)))[0]
+
+    def value(self) -> Any:
+        code = self.take(1)[0]
+        if code < 0x80:
+            return code
+        if code >= 0xe0:
+            return code - 0x100
+        if code < 0x90:
+            return self.map(code & 0x0f)
+        if code < 0xa0:
+            return self.array(code & 0x0f)
+        if code < 0xc0:
+            return self.take(code & 0x1f).decode()
+
+        if code in _CONSTANTS:
+            return _CONSTANTS[code]
+        if code in _NUMBERS:
+            return self.number(_NUMBERS[code])
+        if code in _LENGTHS:
+            (kind, format) = _LENGTHS[code]
+            length = self.number(format)
+            if kind == "str":
+                return self.take(length).decode()
+            if kind == "bin":
+                return self.take(length)
+            return self.array(length) if kind == "array" else self.map(length)
+        raise ValueError(f"Unsupported MessagePack type 0x{code:02x}")
+
+    def array(self, length: int) -> list:
+        return [self.value() for _ in range(length)]
+
+    def map(self, length: int) -> dict:
+        return {self.value(): self.value() for _ in range(length)}
+
+
+_CONSTANTS = {0xc0: None, 0xc2: False, 0xc3: True}
+
+_NUMBERS = {
+    0xca: ">f", 0xcb: ">d",
+    0xcc: ">B", 0xcd: ">H", 0xce: ">I", 0xcf: ">Q",
+    0xd0: ">b", 0xd1: ">h", 0xd2: ">i", 0xd3: ">q",
+}
+
+_LENGTHS = {
+    0xc4: ("bin", ">B"), 0xc5: ("bin", ">H"), 0xc6: ("bin", ">I"),
+    0xd9: ("str", ">B"), 0xda: ("str", ">H"), 0xdb: ("str", ">I"),
+    0xdc: ("array", ">H"), 0xdd: ("array", ">I"),
+    0xde: ("map", ">H"), 0xdf: ("map", ">I"),
+}
+
+
+def unpackb(data: bytes) -> Any:
+    """Decode a MessagePack value, as encoded by packb.
+
+    Raises ValueError if data isn't exactly one value, or uses types (e.g.
+    extensions) which packb never produces.
+    """
+    reader = _Reader(data)
+    value = reader.value()
+    if reader.offset != len(data):
+        raise ValueError("Extra data after MessagePack value")
+    return value
+
+
+# The map header and keys of every segment in a route
+_SEGMENT = (
+    _map_header(3) + _pack_str("start"),
+    _pack_str("destination"),
+    _pack_str("line"),
+)
+
+
+def pack_route(route: List[JourneySegment]) -> bytes:
+    """A route as MessagePack, the same as packb(route_json(route))"""
+    (start, destination, line) = _SEGMENT
+    out = bytearray(_array_header(len(route)))
+    for segment in route:
+        out += start
+        out += _pack_str(segment.start)
+        out += destination
+        out += _pack_str(segment.destination)
+        out += line
+        out += _pack_str(segment.line)
+    return bytes(out)
+
+
+def pack_route_ids(
+    model: Model,
+    route: List[JourneySegment],
+    version: str
+) -> bytes:
+    """A route in the ROUTE_IDS form.
+
+    version is that of the model's dictionary, i.e. dictionary(model)
+    ["version"], and is included so a client can tell when its copy of
+    the dictionary is out of date.
+    """
+    (station_id, line_id) = (model.station_id, model.line_id)
+    out = bytearray(b"\x92")
+    out += _pack_str(version)
+    out += _array_header(3 * len(route))
+    for segment in route:
+        out += _pack_int(station_id(segment.start))
+        out += _pack_int(station_id(segment.destination))
+        out += _pack_int(line_id(segment.line))
+    return bytes(out)
+
+
+def dictionary(model: Model) -> Dict[str, Any]:
+    """The names of the stations and lines, indexed by id.
+
+    Ids which no longer belong to a station or line are None. The version
+    is a hash of the names, so is the same for the same names in any
+    process (unlike the model version, which counts changes made in this
+    one) and changes whenever they do.
+    """
+    def names(bound: int, name: Callable[[int], str]) -> List[Optional[str]]:
+        result = []
+        for id in range(bound):
+            try:
+                result.append(name(id))
+            except KeyError:
+                result.append(None)
+        return result
+
+    stations = names(model.station_id_bound(), model.station_name)
+    lines = names(model.line_id_bound(), model.line_name)
+    digest = hashlib.sha256(json.dumps([stations, lines]).encode())
+
+    return {
+        "version": digest.hexdigest()[:16],
+        "stations": stations,
+        "lines": lines,
+    }
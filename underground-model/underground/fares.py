@@ -0,0 +1,196 @@
+"""Zone-based fares.
+
+Fares depend on the range of zones a journey travels in, and on whether
+it is made at peak time. They are read from a local tariff file, a CSV
+with a row per range of zones:
+
+    from_zone,to_zone,peak,off_peak
+    1,1,280,270
+    1,2,340,280
+    ...
+
+with fares in pence. Stations on a zone boundary count as whichever zone
+makes the journey cheapest.
+
+For pricing in bulk the fare between every pair of stations is reduced to
+a lookup: stations are grouped by the zones they are in (there are only
+a handful of distinct groups), and the fare between every pair of groups,
+peak and off-peak, is worked out up front into one matrix. Pricing an
+array of journeys is then a single NumPy gather from that matrix.
+"""
+
+from typing import *
+
+import csv
+
+import attr
+import numpy as np
+
+from .model import Model
+from .queries import JourneySegment
+
+
+@attr.s(auto_attribs=True)
+class Tariff:
+    """Fares in pence by (lowest zone, highest zone) travelled in"""
+
+    peak: Dict[Tuple[int, int], int] = attr.Factory(dict)
+    """Fares at peak times"""
+
+    off_peak: Dict[Tuple[int, int], int] = attr.Factory(dict)
+    """Fares at other times"""
+
+
+def load_tariff(path: str) -> Tariff:
+    """Read a tariff file.
+
+    Raises ValueError if a row has an invalid zone or fare.
+    """
+    tariff = Tariff()
+
+    with open(path, newline="") as fd:
+        for (n, row) in enumerate(csv.DictReader(fd), start=2):
+            try:
+                zones = (int(row["from_zone"]), int(row["to_zone"]))
+                zones = (min(zones), max(zones))
+                peak = int(row["peak"])
+                off_peak = int(row["off_peak"])
+            except (TypeError, ValueError):
+                raise ValueError(f"Invalid fare on line {n} of {path}")
+
+            tariff.peak[zones] = peak
+            tariff.off_peak[zones] = off_peak
+
+    return tariff
+
+
+class FareEngine:
+    """Prices journeys on a Model by a Tariff.
+
+    The engine is a snapshot of the model's stations and zones. Compare
+    version() with the model's to tell if it needs rebuilding.
+    """
+
+    _version: int
+
+    # Station id -> index of its group of zones, or -1 for unused ids
+    _station_groups: np.ndarray
+
+    # (off-peak / peak, group, group) -> fare
+    _matrix: np.ndarray
+
+    def __init__(self, model: Model, tariff: Tariff):
+        """Work out the fares between every pair of stations.
+
+        Raises ValueError if the tariff has no fare for a range of zones
+        the model needs.
+        """
+        self._version = model.version()
+        self._model = model
+        self._tariff = tariff
+
+        for zones in [*tariff.peak, *tariff.off_peak]:
+            if zones not in tariff.peak or zones not in tariff.off_peak:
+                raise ValueError(
+                    f"Missing peak or off-peak fare for zones {zones[0]} "
+                    f"to {zones[1]}"
+                )
+
+        model_zones = sorted(model.zones())
+        for (i, low) in enumerate(model_zones):
+            for high in model_zones[i:]:
+                if (low, high) not in tariff.peak:
+                    raise ValueError(f"No fare for zones {low} to {high}")
+
+        groups: Dict[Tuple[int, ...], int] = {}
+        self._station_groups = np.full(model.station_id_bound(), -1)
+        for name in model.stations():
+            zones = tuple(model.station(name).zones)
+            group = groups.setdefault(zones, len(groups))
+            self._station_groups[model.station_id(name)] = group
+
+        self._matrix = np.zeros((2, len(groups), len(groups)), dtype=np.int64)
+        for (a, i) in groups.items():
+            for (b, j) in groups.items():
+                self._matrix[0, i, j] = self._cheapest([a, b], peak=False)
+                self._matrix[1, i, j] = self._cheapest([a, b], peak=True)
+
+    def version(self) -> int:
+        """The version of the model the fares were worked out for"""
+        return self._version
+
+    def _cheapest(self, stations: List[Tuple[int, ...]], peak: bool) -> int:
+        """Cheapest fare covering a zone of each of the stations"""
+        fares = self._tariff.peak if peak else self._tariff.off_peak
+
+        return min(
+            fare
+            for ((low, high), fare) in fares.items()
+            if all(
+                any(low <= zone <= high for zone in zones)
+                for zones in stations
+            )
+        )
+
+    def fare(self, start: str, destination: str, peak: bool=True) -> int:
+        """Fare from one station to another, in pence.
+
+        This is the fare by the cheapest route, which only depends on the
+        zones of the two stations.
+
+        Raises KeyError if either station does not exist.
+        """
+        groups = self._station_groups
+        return int(self._matrix[
+            int(peak),
+            groups[self._model.station_id(start)],
+            groups[self._model.station_id(destination)]
+        ])
+
+    def journey_fare(self, journey: List[JourneySegment], peak: bool=True) \
+            -> int:
+        """Fare for a particular journey (e.g. from shortest_route), in pence.
+
+        The journey is charged for every zone it touches at the stations
+        it starts, changes and ends at, so going via the centre can cost
+        more than the cheapest route would.
+
+        Raises KeyError if a station does not exist.
+        """
+        if not journey:
+            return 0
+
+        stations = [journey[0].start, *(s.destination for s in journey)]
+        return self._cheapest(
+            [tuple(self._model.station(name).zones) for name in stations],
+            peak
+        )
+
+    def fares(
+        self,
+        origins: np.ndarray,
+        destinations: np.ndarray,
+        peak: Union[bool, np.ndarray]=True
+    ) -> np.ndarray:
+        """Fares between arrays of station ids (see Model.station_id).
+
+        peak may be a single flag or an array of flags, one per journey.
+        Returns an array of fares in pence, with the arrays' shape.
+
+        Raises ValueError if an id isn't a station's.
+        """
+        origins = np.asarray(origins, dtype=np.intp)
+        destinations = np.asarray(destinations, dtype=np.intp)
+
+        for ids in (origins, destinations):
+            if ids.size and (
+                ids.min() < 0 or ids.max() >= len(self._station_groups) or
+                (self._station_groups[ids] < 0).any()
+            ):
+                raise ValueError("Unknown station id")
+
+        return self._matrix[
+            np.asarray(peak, dtype=np.intp),
+            self._station_groups[origins],
+            self._station_groups[destinations]
+        ]
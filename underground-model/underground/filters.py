@@ -0,0 +1,281 @@
+"""Compound station filters evaluated over the Model's bitset indexes.
+
+Filters combine membership of lines, zones and districts with AND, OR and
+NOT, e.g. "stations on both Central and Jubilee in zone 1":
+
+    And(OnLine("Central"), OnLine("Jubilee"), InZone(1))
+
+or in the text form accepted by parse_filter (and the server):
+
+    line:Central AND line:Jubilee AND zone:1
+
+Each filter evaluates to a Python int used as a bitset of station ids,
+so combining them is a handful of bitwise operations on the indexes
+the Model maintains rather than a scan over its stations. Properties
+added to the model's graph can be filtered on too (property:step_free=true),
+by a lookup if the property is indexed, otherwise a numpy scan of its
+column.
+"""
+
+from typing import *
+
+import re
+
+import attr
+
+from .model import Model
+
+
+class StationFilter:
+    """Base class of station filters.
+
+    Filters can be combined with &, | and ~ as well as And, Or and Not.
+    """
+
+    def bits(self, model: Model) -> int:
+        """Evaluate to a bitset of matching station ids.
+
+        Raises ValueError if the filter names a line, district or zone
+        which does not exist.
+        """
+        raise NotImplementedError
+
+    def __and__(self, other: "StationFilter") -> "StationFilter":
+        return And(self, other)
+
+    def __or__(self, other: "StationFilter") -> "StationFilter":
+        return Or(self, other)
+
+    def __invert__(self) -> "StationFilter":
+        return Not(self)
+
+
+@attr.s(auto_attribs=True)
+class AllStations(StationFilter):
+    """Matches every station"""
+
+    def bits(self, model: Model) -> int:
+        return model.station_bits()
+
+
+@attr.s(auto_attribs=True)
+class OnLine(StationFilter):
+    """Matches stations on a line"""
+
+    line: str
+    """The name of the line"""
+
+    def bits(self, model: Model) -> int:
+        try:
+            return model.line_bits(self.line)
+        except KeyError:
+            raise ValueError(f"No such line '{self.line}'")
+
+
+@attr.s(auto_attribs=True)
+class InDistrict(StationFilter):
+    """Matches stations in a district"""
+
+    district: str
+    """The name of the district"""
+
+    def bits(self, model: Model) -> int:
+        try:
+            return model.district_bits(self.district)
+        except KeyError:
+            raise ValueError(f"No such district '{self.district}'")
+
+
+@attr.s(auto_attribs=True)
+class InZone(StationFilter):
+    """Matches stations in a zone (including those on a zone boundary)"""
+
+    zone: int
+    """The id of the zone"""
+
+    def bits(self, model: Model) -> int:
+        try:
+            return model.zone_bits(self.zone)
+        except KeyError:
+            raise ValueError(f"No such zone '{self.zone}'")
+
+
+@attr.s(auto_attribs=True)
+class HasProperty(StationFilter):
+    """Matches stations with a value of a property added to the graph"""
+
+    property: str
+    """The name of the property"""
+
+    value: Any
+    """The value to match. Text is converted to the property's type."""
+
+    def bits(self, model: Model) -> int:
+        stations = model.graph().nodes("Station")
+        if self.property not in stations.properties():
+            raise ValueError(f"No such property '{self.property}'")
+
+        value = self.value
+        if isinstance(value, str):
+            try:
+                value = stations.parse(self.property, value)
+            except ValueError:
+                raise ValueError(f"Invalid {self.property} '{value}'")
+
+        return stations.where(self.property, value)
+
+
+def _has_property(text: str) -> HasProperty:
+    """Parse the NAME=VALUE of a property: term"""
+    (name, equals, value) = text.partition("=")
+    if not name or not equals:
+        raise ValueError(f"Expected NAME=VALUE, found '{text}'")
+    return HasProperty(name, value)
+
+
+@attr.s(auto_attribs=True, init=False)
+class And(StationFilter):
+    """Matches stations matched by all the filters"""
+
+    filters: List[StationFilter]
+
+    def __init__(self, *filters: StationFilter):
+        self.filters = [*filters]
+
+    def bits(self, model: Model) -> int:
+        result = model.station_bits()
+        for f in self.filters:
+            result &= f.bits(model)
+        return result
+
+
+@attr.s(auto_attribs=True, init=False)
+class Or(StationFilter):
+    """Matches stations matched by any of the filters"""
+
+    filters: List[StationFilter]
+
+    def __init__(self, *filters: StationFilter):
+        self.filters = [*filters]
+
+    def bits(self, model: Model) -> int:
+        result = 0
+        for f in self.filters:
+            result |= f.bits(model)
+        return result
+
+
+@attr.s(auto_attribs=True)
+class Not(StationFilter):
+    """Matches stations not matched by the filter"""
+
+    filter: StationFilter
+
+    def bits(self, model: Model) -> int:
+        # Python ints have infinitely many leading 1s after ~, so mask
+        # down to the stations which actually exist
+        return model.station_bits() & ~self.filter.bits(model)
+
+
+#
+# Text form
+#
+
+# Tokens: brackets, key:"quoted value", key:value, or a bare word
+_TOKEN = re.compile(r'''
+    \s*(?:
+        (?P<bracket>[()])
+      | (?P<key>\w+):(?:"(?P<quoted>[^"]*)"|(?P<value>[^\s()]+))
+      | (?P<word>[^\s()]+)
+    )
+''', re.VERBOSE)
+
+_ATOMS = {
+    "line": OnLine,
+    "district": InDistrict,
+    "zone": lambda value: InZone(int(value)),
+    "property": _has_property,
+}
+
+
+def parse_filter(text: str) -> StationFilter:
+    """Parse the text form of a filter.
+
+    The grammar is a boolean expression over line:NAME, district:NAME,
+    zone:ID and property:NAME=VALUE terms using AND, OR, NOT and brackets,
+    with the usual precedence (NOT binds tightest, then AND, then OR).
+    Names containing spaces must be quoted, e.g. district:"City of London".
+
+    Raises ValueError if the text is not a valid filter.
+    """
+    tokens = []
+    position = 0
+    text = text.rstrip()
+
+    while position < len(text):
+        match = _TOKEN.match(text, position)
+        if not match:
+            raise ValueError(f"Cannot parse filter at '{text[position:]}'")
+        position = match.end()
+
+        if match["bracket"]:
+            tokens.append(match["bracket"])
+        elif match["key"]:
+            key = match["key"].lower()
+            value = match["value"] if match["quoted"] is None \
+                else match["quoted"]
+
+            if key not in _ATOMS:
+                raise ValueError(f"Unknown filter '{key}'")
+            try:
+                tokens.append(_ATOMS[key](value))
+            except ValueError:
+                raise ValueError(f"Invalid {key} '{value}'")
+        elif match["word"].upper() in ("AND", "OR", "NOT"):
+            tokens.append(match["word"].upper())
+        else:
+            raise ValueError(f"Unexpected '{match['word']}'")
+
+    # Simple recursive descent parser over the tokens
+    def peek() -> Any:
+        return tokens[0] if tokens else None
+
+    def parse_or() -> StationFilter:
+        terms = [parse_and()]
+        while peek() == "OR":
+            tokens.pop(0)
+            terms.append(parse_and())
+        return terms[0] if len(terms) == 1 else Or(*terms)
+
+    def parse_and() -> StationFilter:
+        terms = [parse_not()]
+        while peek() == "AND":
+            tokens.pop(0)
+            terms.append(parse_not())
+        return terms[0] if len(terms) == 1 else And(*terms)
+
+    def parse_not() -> StationFilter:
+        if peek() == "NOT":
+            tokens.pop(0)
+            return Not(parse_not())
+
+        token = tokens.pop(0) if tokens else None
+
+        if token == "(":
+            result = parse_or()
+            if peek() != ")":
+                raise ValueError("Missing ')'")
+            tokens.pop(0)
+            return result
+
+        if not isinstance(token, StationFilter):
+            raise ValueError(f"Expected a filter, found {token or 'nothing'}")
+
+        return token
+
+    result = parse_or()
+
+    if tokens:
+        raise ValueError(f"Unexpected '{tokens[0]}'")
+
+    return result
@@ -0,0 +1,97 @@
+"""Generate synthetic networks for benchmarking.
+
+The real network is small enough that most things are fast on it. To see
+how the code scales we need bigger networks with a similar shape:
+
+  - Stations in outer zones are more common than central ones
+  - Each line is a run of stations from the outskirts through the centre
+    and out again
+  - Stations next to each other on a line tend to be in the same district
+  - Some stations are interchanges, on more than one line
+
+The same seed always gives the same network.
+"""
+
+from typing import *
+
+import random
+
+from .model import Model
+
+
+def generate_model(
+    stations: int,
+    lines: Optional[int]=None,
+    interchange_density: float=0.2,
+    zones: int=9,
+    stations_per_district: int=10,
+    seed: int=0
+) -> Model:
+    """Generate a random network.
+
+    Every station is on at least one line. interchange_density is the
+    proportion of stations which are on at least one more line (and some
+    of those are on several). By default there is a line for every 30
+    stations, about the same as the real network.
+    """
+    rng = random.Random(seed)
+    model = Model()
+    lines = lines or max(1, stations // 30)
+
+    # Zones: more stations further out. Zone n gets a share of the stations
+    # proportional to n (like the area of a ring), with a few stations on
+    # the boundary between two zones.
+    weights = [*range(1, zones + 1)]
+    names = [f"Station {n}" for n in range(stations)]
+    station_zones = {}
+
+    for name in names:
+        zone = rng.choices(range(1, zones + 1), weights)[0]
+        if zone < zones and rng.random() < 0.05:
+            station_zones[name] = (zone, zone + 1)
+        else:
+            station_zones[name] = (zone,)
+
+    # Lines: deal the stations out between the lines so every station has
+    # one, then arrange each line outskirts -> centre -> outskirts.
+    rng.shuffle(names)
+    line_stations = [names[n::lines] for n in range(lines)]
+
+    for n in range(lines):
+        ordered = sorted(line_stations[n], key=lambda s: station_zones[s])
+        line_stations[n] = ordered[1::2][::-1] + ordered[0::2]
+
+    # Interchanges: add some stations to other lines too, next to a
+    # station in the same zone so the line stays sensibly ordered
+    if lines > 1:
+        for name in names:
+            extra = 0
+            while rng.random() < interchange_density / (1 + extra) ** 2:
+                line = line_stations[rng.randrange(lines)]
+                if name not in line:
+                    zone = station_zones[name][0]
+                    position = min(
+                        range(len(line)),
+                        key=lambda i: abs(station_zones[line[i]][0] - zone)
+                    )
+                    line.insert(position, name)
+                extra += 1
+                if extra >= lines - 1:
+                    break
+
+    # Districts: runs of stations along the first line they're on
+    districts = {}
+    for (n, line) in enumerate(line_stations):
+        for (i, name) in enumerate(line):
+            if name not in districts:
+                districts[name] = \
+                    f"District {n}-{i // stations_per_district}"
+
+    for name in sorted(names, key=lambda s: int(s.split()[1])):
+        model.add_station(name, districts[name], station_zones[name])
+
+    for (n, line) in enumerate(line_stations):
+        for name in line:
+            model.add_station_to_line(name, f"Line {n}")
+
+    return model
@@ -0,0 +1,290 @@
+"""Station locations and a spatial index for "nearest station" queries.
+
+The Model has no idea where stations are. Locations are kept separately,
+read from a local CSV file of name,latitude,longitude rows, and linked to
+the Model's stations by name.
+
+The index projects every station onto a flat plane in metres (an
+equirectangular projection around the stations' mean latitude, which is
+accurate to well under 1% across a city) and buckets them into a grid of
+square cells. Nearest station queries search outwards from the query's
+cell a ring of cells at a time, stopping as soon as no unsearched cell
+could hold anything closer, so they look at a handful of stations rather
+than all of them.
+
+The coordinates are held in flat float arrays, sorted by cell so that
+each cell's stations are a contiguous slice.
+"""
+
+from typing import *
+
+from array import array
+import csv
+import heapq
+import math
+
+from .model import Model
+from .search import normalise
+
+# Mean radius of the Earth in metres
+EARTH_RADIUS = 6371000.0
+
+# Width of a grid cell in metres. About the spacing of central stations,
+# so a typical query searches a few cells with a few stations each.
+CELL_SIZE = 500.0
+
+
+def load_locations(path: str) -> Dict[str, Tuple[float, float]]:
+    """Read station name -> (latitude, longitude) from a CSV file.
+
+    The file needs name, latitude and longitude columns.
+
+    Raises ValueError if a row has a missing or invalid coordinate.
+    """
+    locations = {}
+
+    with open(path, newline="") as fd:
+        for (n, row) in enumerate(csv.DictReader(fd), start=2):
+            try:
+                latitude = float(row["latitude"])
+                longitude = float(row["longitude"])
+            except (TypeError, ValueError):
+                raise ValueError(f"Invalid coordinates on line {n} of {path}")
+
+            if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+                raise ValueError(f"Invalid coordinates on line {n} of {path}")
+
+            locations[row["name"]] = (latitude, longitude)
+
+    return locations
+
+
+class LocationIndex:
+    """Grid index over the locations of a Model's stations.
+
+    Like the other indexes the grid is a snapshot of the model it was built
+    from. Compare version() with the model's to tell if it needs
+    rebuilding.
+    """
+
+    _version: int
+
+    names: List[str]
+    """Point -> station name, in grid order"""
+
+    latitudes: array
+    """Point -> latitude"""
+
+    longitudes: array
+    """Point -> longitude"""
+
+    # Projected coordinates in metres
+    _x: array
+    _y: array
+
+    # Cell (column, row) -> slice of points in that cell
+    _cells: Dict[Tuple[int, int], Tuple[int, int]]
+
+    # Bounds of the occupied cells: (min column, min row, max column,
+    # max row)
+    _bounds: Tuple[int, int, int, int]
+
+    def __init__(
+        self,
+        model: Model,
+        locations: Dict[str, Tuple[float, float]],
+        cell_size: float=CELL_SIZE
+    ):
+        """Index the locations of the model's stations.
+
+        Names are matched exactly, or failing that after normalising (so
+        "St Pauls" finds "St. Paul's"). Stations with no location are left
+        out; locations of unknown stations are ignored.
+        """
+        self._version = model.version()
+        self._cell_size = cell_size
+
+        by_normal_name = {
+            normalise(name): location for (name, location) in locations.items()
+        }
+        points = []
+        for name in model.stations():
+            location = locations.get(name) or \
+                by_normal_name.get(normalise(name))
+            if location is not None:
+                points.append((name, *location))
+
+        # Project around the middle of the network
+        if points:
+            mean_latitude = sum(p[1] for p in points) / len(points)
+        else:
+            mean_latitude = 0.0
+        self._x_scale = math.cos(math.radians(mean_latitude))
+
+        projected = []
+        for (name, latitude, longitude) in points:
+            (x, y) = self._project(latitude, longitude)
+            projected.append((self._cell(x, y), name, latitude, longitude, x, y))
+        projected.sort()
+
+        self.names = [p[1] for p in projected]
+        self.latitudes = array("d", (p[2] for p in projected))
+        self.longitudes = array("d", (p[3] for p in projected))
+        self._x = array("d", (p[4] for p in projected))
+        self._y = array("d", (p[5] for p in projected))
+
+        self._cells = {}
+        for (i, p) in enumerate(projected):
+            (start, _) = self._cells.get(p[0], (i, i))
+            self._cells[p[0]] = (start, i + 1)
+
+        if self._cells:
+            columns = [column for (column, _) in self._cells]
+            rows = [row for (_, row) in self._cells]
+            self._bounds = (min(columns), min(rows), max(columns), max(rows))
+        else:
+            self._bounds = (0, 0, -1, -1)
+
+    def version(self) -> int:
+        """The version of the model the index was built from"""
+        return self._version
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def _project(self, latitude: float, longitude: float) \
+            -> Tuple[float, float]:
+        """Position on the plane in metres"""
+        return (
+            EARTH_RADIUS * math.radians(longitude) * self._x_scale,
+            EARTH_RADIUS * math.radians(latitude)
+        )
+
+    def _cell(self, x: float, y: float) -> Tuple[int, int]:
+        return (
+            math.floor(x / self._cell_size),
+            math.floor(y / self._cell_size)
+        )
+
+    def _ring(self, column: int, row: int, ring: int) \
+            -> Iterator[Tuple[int, int]]:
+        """The occupied cells exactly ring cells away from (column, row)"""
+        if ring == 0:
+            if (column, row) in self._cells:
+                yield (column, row)
+            return
+
+        # Only the parts of the ring inside the occupied bounds, so that a
+        # point far from the network doesn't walk round thousands of empty
+        # cells per ring
+        (min_column, min_row, max_column, max_row) = self._bounds
+        columns = range(
+            max(column - ring, min_column), min(column + ring, max_column) + 1
+        )
+        rows = range(
+            max(row - ring + 1, min_row), min(row + ring - 1, max_row) + 1
+        )
+
+        for r in (row - ring, row + ring):
+            if min_row <= r <= max_row:
+                for c in columns:
+                    if (c, r) in self._cells:
+                        yield (c, r)
+
+        for c in (column - ring, column + ring):
+            if min_column <= c <= max_column:
+                for r in rows:
+                    if (c, r) in self._cells:
+                        yield (c, r)
+
+    def nearest_stations(self, latitude: float, longitude: float, k: int=1) \
+            -> List[Tuple[str, float]]:
+        """The k stations nearest a point, as (name, distance in metres).
+
+        Nearest first.
+        """
+        if k <= 0 or not self.names:
+            return []
+
+        (x, y) = self._project(latitude, longitude)
+        (column, row) = self._cell(x, y)
+        (min_column, min_row, max_column, max_row) = self._bounds
+
+        # Nothing is nearer than the edge of the grid, and nothing is
+        # further than its far corner
+        first_ring = max(
+            0, min_column - column, column - max_column,
+            min_row - row, row - max_row
+        )
+        last_ring = max(
+            abs(column - min_column), abs(column - max_column),
+            abs(row - min_row), abs(row - max_row)
+        )
+
+        # Max-heap (by negated distance) of the best k found so far
+        best: List[Tuple[float, int]] = []
+
+        for ring in range(first_ring, last_ring + 1):
+            for cell in self._ring(column, row, ring):
+                (start, end) = self._cells[cell]
+                for i in range(start, end):
+                    distance = math.hypot(self._x[i] - x, self._y[i] - y)
+                    if len(best) < k:
+                        heapq.heappush(best, (-distance, i))
+                    elif distance < -best[0][0]:
+                        heapq.heapreplace(best, (-distance, i))
+
+            # Every cell further out is at least ring cells away
+            if len(best) == k and -best[0][0] <= ring * self._cell_size:
+                break
+
+        return [
+            (self.names[i], -distance) for (distance, i) in sorted(best)[::-1]
+        ]
+
+    def stations_within(
+        self,
+        latitude: float,
+        longitude: float,
+        radius: float
+    ) -> List[Tuple[str, float]]:
+        """Stations within radius metres of a point, as (name, distance).
+
+        Nearest first.
+        """
+        (x, y) = self._project(latitude, longitude)
+        (min_column, min_row) = self._cell(x - radius, y - radius)
+        (max_column, max_row) = self._cell(x + radius, y + radius)
+
+        # Only look at cells which are both in range and occupied
+        min_column = max(min_column, self._bounds[0])
+        min_row = max(min_row, self._bounds[1])
+        max_column = min(max_column, self._bounds[2])
+        max_row = min(max_row, self._bounds[3])
+
+        found = []
+        for column in range(min_column, max_column + 1):
+            for row in range(min_row, max_row + 1):
+                (start, end) = self._cells.get((column, row), (0, 0))
+                for i in range(start, end):
+                    distance = math.hypot(self._x[i] - x, self._y[i] - y)
+                    if distance <= radius:
+                        found.append((distance, self.names[i]))
+
+        return [(name, distance) for (distance, name) in sorted(found)]
+
+
+def parse_coordinates(text: str) -> Optional[Tuple[float, float]]:
+    """Parse "@latitude,longitude", or None if text isn't of that form"""
+    if not text.startswith("@"):
+        return None
+
+    try:
+        (latitude, longitude) = (float(part) for part in text[1:].split(","))
+    except ValueError:
+        return None
+
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        return None
+
+    return (latitude, longitude)
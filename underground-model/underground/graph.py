@@ -0,0 +1,465 @@
+"""The Model compiled into a weighted station-to-station graph.
+
+shortest_route works a line at a time, which suits the Model's structure
+but doesn't lend itself to graph algorithms which need to look at
+individual edges (contraction hierarchies, centrality and so on). This
+module flattens the Model into a directed graph:
+
+  - A node for each station
+  - An edge from A to B for every line A and B are both on, meaning
+    "ride that line from A to B without changing"
+
+The edge cost uses the same heuristic as shortest_route: the (lowest) zone
+of the destination, less 0.5 if both stations are in the same district.
+Costs are always positive, and riding straight from A to C is never more
+expensive than stopping at B on the way, so each edge of a shortest path
+is one JourneySegment. Each edge also records the zone boundaries it
+crosses, for searches weighing up more than cost.
+
+The adjacency is stored in compressed sparse row form: the edges out of
+node n are at positions offsets[n] to offsets[n + 1] of the edge arrays.
+"""
+
+from typing import *
+
+from array import array
+import heapq
+
+import numpy as np
+
+from .model import Model
+from .queries import JourneySegment
+
+# Limit on the size of the (sources x edges) arrays betweenness works on at
+# once. Each array of this many floats takes 32MB.
+BETWEENNESS_BATCH_CELLS = 2 ** 22
+
+
+def station_cost(model: Model, origin: str, station: str) -> float:
+    """Cost of riding to station on a line boarded at origin"""
+    origin = model.station(origin)
+    station = model.station(station)
+
+    cost = min(station.zones)
+    if station.district == origin.district:
+        cost -= 0.5
+
+    return cost
+
+
+def zones_crossed(model: Model, origin: str, station: str) -> int:
+    """Zone boundaries crossed riding from origin to station.
+
+    Stations on a zone boundary count as their lowest zone, as for the
+    cost, so riding straight from A to C never crosses more than stopping
+    at B on the way.
+    """
+    return abs(
+        min(model.station(origin).zones) - min(model.station(station).zones)
+    )
+
+
+class StationGraph:
+    """A Model compiled to a station-to-station graph.
+
+    The graph is a snapshot; it will not reflect changes made to the model
+    after it is built. Compare version() with the model's to tell if it
+    needs rebuilding.
+    """
+
+    _version: int
+
+    names: List[str]
+    """Node number -> station name"""
+
+    nodes: Dict[str, int]
+    """Station name -> node number"""
+
+    line_names: List[str]
+    """Line number -> line name"""
+
+    offsets: array
+    """Start of each node's edges in the edge arrays (plus a final end)"""
+
+    targets: array
+    """Node at the end of each edge"""
+
+    weights: array
+    """Cost of each edge"""
+
+    lines: array
+    """Line number of each edge"""
+
+    crossings: array
+    """Zone boundaries crossed by each edge"""
+
+    def __init__(self, model: Model):
+        """Compile the model"""
+        self._version = model.version()
+        self.names = [*model.stations()]
+        self.nodes = {name: n for (n, name) in enumerate(self.names)}
+        self.line_names = [*model.lines()]
+
+        self.offsets = array("l", [0])
+        self.targets = array("l")
+        self.weights = array("d")
+        self.lines = array("l")
+        self.crossings = array("l")
+
+        line_numbers = {line: n for (n, line) in enumerate(self.line_names)}
+
+        for origin in self.names:
+            # Every station reachable without changing, and the first
+            # line found to get there (the cost is the same on any line)
+            edges: Dict[str, int] = {}
+            for line in model.station(origin).lines:
+                for station in model.line(line).stations:
+                    if station != origin and station not in edges:
+                        edges[station] = line_numbers[line]
+
+            for (station, line) in edges.items():
+                self.targets.append(self.nodes[station])
+                self.weights.append(station_cost(model, origin, station))
+                self.lines.append(line)
+                self.crossings.append(zones_crossed(model, origin, station))
+
+            self.offsets.append(len(self.targets))
+
+    def version(self) -> int:
+        """The version of the model the graph was built from"""
+        return self._version
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def edge_count(self) -> int:
+        """The number of edges in the graph"""
+        return len(self.targets)
+
+    def edges(self, node: int) -> Iterator[Tuple[int, float, int]]:
+        """(target, weight, line) for each edge out of a node"""
+        for i in range(self.offsets[node], self.offsets[node + 1]):
+            yield (self.targets[i], self.weights[i], self.lines[i])
+
+    def segments(self, path: List[int], lines: List[int]) \
+            -> List[JourneySegment]:
+        """Convert a path of nodes and the lines between them to a journey.
+
+        Consecutive rides on the same line are merged.
+        """
+        journey: List[JourneySegment] = []
+
+        for (i, line) in enumerate(lines):
+            line = self.line_names[line]
+            destination = self.names[path[i + 1]]
+
+            if journey and journey[-1].line == line:
+                journey[-1].destination = destination
+            else:
+                journey.append(JourneySegment(
+                    start=self.names[path[i]],
+                    destination=destination,
+                    line=line
+                ))
+
+        return journey
+
+
+class BoardingGraph:
+    """A Model compiled to a sparse graph with boarding and line nodes.
+
+    StationGraph joins every pair of stations on a line, so a line of n
+    stations has n² edges. Here the same journeys are made up of smaller
+    steps, with three kinds of node:
+
+      - A node for each station
+      - A boarding node for each (line, district) pair, meaning "on that
+        line, having boarded in that district"
+      - A line node for each line, meaning "on that line, having boarded
+        anywhere"
+
+    and edges:
+
+      - Station -> each of its boarding nodes, cost 0 (boarding)
+      - Boarding node -> its line node, cost 0
+      - Line node -> each station on the line, cost the station's zone
+      - Boarding node -> each station on the line in its district, cost
+        the station's zone less 0.5
+
+    So the cheapest way from a station to another on the same line costs
+    exactly what the StationGraph edge does, but the graph has only a few
+    edges per station on each line.
+
+    Like StationGraph this is a snapshot of the model.
+    """
+
+    _version: int
+
+    names: List[str]
+    """Node number -> station name, for the station nodes"""
+
+    nodes: Dict[str, int]
+    """Station name -> node number"""
+
+    line_names: List[str]
+    """Line number -> line name"""
+
+    node_lines: array
+    """Line number of each boarding and line node, -1 for stations"""
+
+    offsets: array
+    """Start of each node's edges in the edge arrays (plus a final end)"""
+
+    targets: array
+    """Node at the end of each edge"""
+
+    weights: array
+    """Cost of each edge"""
+
+    def __init__(self, model: Model):
+        """Compile the model"""
+        self._version = model.version()
+        # Station nodes come first, numbered as in the StationGraph
+        self.names = [*model.stations()]
+        self.nodes = {name: n for (n, name) in enumerate(self.names)}
+        self.line_names = [*model.lines()]
+        self.node_lines = array("l", [-1] * len(self.names))
+
+        adjacency: List[List[Tuple[int, float]]] = \
+            [[] for _ in range(len(self.names))]
+
+        def add_node(line: int) -> int:
+            self.node_lines.append(line)
+            adjacency.append([])
+            return len(adjacency) - 1
+
+        for (number, line) in enumerate(self.line_names):
+            line_node = add_node(number)
+            boarding: Dict[str, int] = {}
+
+            for name in model.line(line).stations:
+                station = model.station(name)
+                node = self.nodes[name]
+                zone = min(station.zones)
+                adjacency[line_node].append((node, zone))
+
+                if station.district not in boarding:
+                    boarding[station.district] = add_node(number)
+                    adjacency[boarding[station.district]].append(
+                        (line_node, 0)
+                    )
+
+                district_node = boarding[station.district]
+                adjacency[node].append((district_node, 0))
+                adjacency[district_node].append((node, zone - 0.5))
+
+        self.offsets = array("l", [0])
+        self.targets = array("l")
+        self.weights = array("d")
+        for edges in adjacency:
+            for (target, weight) in edges:
+                self.targets.append(target)
+                self.weights.append(weight)
+            self.offsets.append(len(self.targets))
+
+    def version(self) -> int:
+        """The version of the model the graph was built from"""
+        return self._version
+
+    def __len__(self) -> int:
+        return len(self.node_lines)
+
+    def edge_count(self) -> int:
+        """The number of edges in the graph"""
+        return len(self.targets)
+
+    def edges(self, node: int) -> Iterator[Tuple[int, float]]:
+        """(target, weight) for each edge out of a node"""
+        for i in range(self.offsets[node], self.offsets[node + 1]):
+            yield (self.targets[i], self.weights[i])
+
+    def segments(self, path: List[int]) -> List[JourneySegment]:
+        """Convert a path of nodes from one station to another to a journey.
+
+        Each ride is from a station, via a boarding node (and perhaps the
+        line node), to the next station. Consecutive rides on the same line
+        are merged.
+        """
+        journey: List[JourneySegment] = []
+        start = path[0]
+        line = -1
+
+        for node in path[1:]:
+            if self.node_lines[node] >= 0:
+                line = self.node_lines[node]
+                continue
+
+            line_name = self.line_names[line]
+            if journey and journey[-1].line == line_name:
+                journey[-1].destination = self.names[node]
+            else:
+                journey.append(JourneySegment(
+                    start=self.names[start],
+                    destination=self.names[node],
+                    line=line_name
+                ))
+            start = node
+
+        return journey
+
+
+def dijkstra_route(
+    graph: StationGraph,
+    start: str,
+    destination: str
+) -> List[JourneySegment]:
+    """Cheapest journey from one station to another by a plain search.
+
+    This is the baseline the faster searches are measured against.
+
+    Raises ValueError if a route cannot be found.
+    Raises KeyError if either station does not exist.
+    """
+    source = graph.nodes[start]
+    target = graph.nodes[destination]
+
+    # Node -> (cost, previous node, line used)
+    best: Dict[int, Tuple[float, int, int]] = {source: (0, -1, -1)}
+    settled = set()
+    queue = [(0.0, source)]
+
+    while queue:
+        (cost, node) = heapq.heappop(queue)
+        if node in settled:
+            continue
+        settled.add(node)
+
+        if node == target:
+            break
+
+        for (next_node, weight, line) in graph.edges(node):
+            next_cost = cost + weight
+            if next_node not in best or next_cost < best[next_node][0]:
+                best[next_node] = (next_cost, node, line)
+                heapq.heappush(queue, (next_cost, next_node))
+
+    if target not in settled:
+        raise ValueError(f"Cannot find a route from {start} to {destination}")
+
+    path = [target]
+    lines = []
+    while path[-1] != source:
+        (_, previous, line) = best[path[-1]]
+        path.append(previous)
+        lines.append(line)
+
+    return graph.segments(path[::-1], lines[::-1])
+
+
+def journey_cost(model: Model, journey: List[JourneySegment]) -> float:
+    """Total cost of a journey, by the same measure as the graph's edges"""
+    return sum(
+        station_cost(model, segment.start, segment.destination)
+        for segment in journey
+    )
+
+
+def betweenness(graph: StationGraph, sources: Iterable[int]) \
+        -> Tuple[np.ndarray, np.ndarray]:
+    """Brandes' betweenness centrality, counting paths from some sources.
+
+    Returns (node scores, edge scores). A node's score is the number of
+    (source, destination) pairs whose cheapest journeys change trains
+    there, shared out between equally cheap journeys; an edge's score is
+    the number of pairs whose cheapest journeys ride it. Summing the
+    results for disjoint sets of sources gives the result for all of them,
+    so the work can be split up.
+
+    Rather than searching from one source at a time, a batch of sources is
+    handled at once as rows of B x E NumPy arrays (one column per edge),
+    with every step a whole-array operation:
+
+      - Costs by Bellman-Ford: relax every edge at once until nothing
+        changes, one round per edge on the longest cheapest path.
+      - The edges on cheapest paths are those where cost[u] + weight ==
+        cost[v]. Edge costs are multiples of 0.5, so the sums are exact.
+      - sigma, the number of cheapest paths to each node, by pushing path
+        counts along those edges a round at a time.
+      - Brandes' dependencies, from q[v] = 1 / sigma[v] + sum(q[w]) over
+        cheapest path edges v -> w, pulled back the same way. Then the
+        dependency of v is sigma[v] * q[v] - 1 and an edge v -> w carries
+        sigma[v] * q[w] paths.
+    """
+    sources = np.fromiter(sources, dtype=np.int64)
+    nodes = len(graph)
+    offsets = np.asarray(graph.offsets, dtype=np.int64)
+    edge_targets = np.asarray(graph.targets, dtype=np.int64)
+    edge_weights = np.asarray(graph.weights)
+    edge_sources = np.repeat(np.arange(nodes), np.diff(offsets))
+
+    # Edges grouped by target, for combining each node's in-edges
+    by_target = np.argsort(edge_targets, kind="stable")
+    (has_in, in_starts) = np.unique(edge_targets[by_target], return_index=True)
+
+    # Edges are already grouped by source (in CSR order)
+    has_out = np.flatnonzero(np.diff(offsets))
+    out_starts = offsets[has_out]
+
+    def into_targets(ufunc, values: np.ndarray, fill: float) -> np.ndarray:
+        """Reduce B x E values over each node's in-edges to B x N"""
+        result = np.full((len(values), nodes), fill)
+        if len(has_in):
+            result[:, has_in] = ufunc.reduceat(
+                values[:, by_target], in_starts, axis=1
+            )
+        return result
+
+    def into_sources(values: np.ndarray) -> np.ndarray:
+        """Sum B x E values over each node's out-edges to B x N"""
+        result = np.zeros((len(values), nodes))
+        if len(has_out):
+            result[:, has_out] = np.add.reduceat(values, out_starts, axis=1)
+        return result
+
+    node_scores = np.zeros(nodes)
+    edge_scores = np.zeros(len(edge_targets))
+    batch_size = max(1, BETWEENNESS_BATCH_CELLS // max(1, len(edge_targets)))
+
+    for first in range(0, len(sources), batch_size):
+        batch = sources[first:first + batch_size]
+        rows = np.arange(len(batch))
+
+        cost = np.full((len(batch), nodes), np.inf)
+        cost[rows, batch] = 0
+        while True:
+            relaxed = np.minimum(cost, into_targets(
+                np.minimum, cost[:, edge_sources] + edge_weights, np.inf
+            ))
+            if np.array_equal(relaxed, cost):
+                break
+            cost = relaxed
+
+        on_path = np.isfinite(cost[:, edge_sources]) & \
+            (cost[:, edge_sources] + edge_weights == cost[:, edge_targets])
+
+        paths = np.zeros((len(batch), nodes))
+        paths[rows, batch] = 1
+        sigma = paths.copy()
+        while paths.any():
+            paths = into_targets(np.add, paths[:, edge_sources] * on_path, 0)
+            sigma += paths
+
+        reachable = sigma > 0
+        q_step = np.divide(1, sigma, out=np.zeros_like(sigma), where=reachable)
+        q = q_step.copy()
+        while q_step.any():
+            q_step = into_sources(q_step[:, edge_targets] * on_path)
+            q += q_step
+
+        dependency = np.where(reachable, sigma * q - 1, 0)
+        dependency[rows, batch] = 0
+        node_scores += dependency.sum(axis=0)
+        edge_scores += \
+            (sigma[:, edge_sources] * q[:, edge_targets] * on_path).sum(axis=0)
+
+    return (node_scores, edge_scores)
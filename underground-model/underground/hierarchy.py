@@ -0,0 +1,373 @@
+"""Contraction hierarchies for fast station-to-station routing.
+
+An optional preprocessing stage over the BoardingGraph for networks too
+large to search afresh for every query.
+
+Preprocessing ranks the nodes by importance, then removes ("contracts")
+them least important first. Whenever removing a node would break a
+shortest path between two of its neighbours, a shortcut edge is added
+between them which stands for the two edges via the removed node.
+
+A query then only ever needs to follow edges towards more important
+nodes: a search forwards from the start and one backwards from the
+destination, both going "upwards", must meet at the most important
+node on the shortest path. On road-like networks those searches
+settle a tiny fraction of the nodes a plain search would.
+
+The hierarchy is built over the BoardingGraph rather than the
+StationGraph: contracting a station of the StationGraph joins up the
+stations on all its lines, each of which is already a clique, so the
+contraction is slow and leaves the upward searches little to gain. In the
+BoardingGraph stations only neighbour their boarding nodes, and the line
+nodes (which everything else leads to) are contracted last.
+
+Shortcuts remember the node they bypass, so the route found can be
+unpacked back into real edges and hence JourneySegments.
+"""
+
+from typing import *
+
+from array import array
+import heapq
+
+from .graph import BoardingGraph
+from .queries import JourneySegment
+
+
+# Limit on the number of nodes a witness search may settle before giving
+# up and adding the shortcut anyway. Adding an unnecessary shortcut is
+# harmless, it just makes the index a little bigger.
+WITNESS_SETTLE_LIMIT = 64
+
+# No bypassed node, i.e. an original edge rather than a shortcut
+ORIGINAL = -1
+
+# (cost, bypassed node or ORIGINAL)
+_Edge = Tuple[float, int]
+
+
+class ContractionHierarchy:
+    """Contraction hierarchy over a BoardingGraph.
+
+    Like the graph, the hierarchy is a snapshot of the model it was built
+    from. Compare version() with the model's to tell if it needs
+    rebuilding.
+    """
+
+    graph: BoardingGraph
+    """The graph the hierarchy was built from"""
+
+    rank: array
+    """Node -> position in the contraction order (higher is more important)"""
+
+    shortcuts: int
+    """The number of shortcut edges added"""
+
+    # Upward edges in CSR form (see graph.py). The forward graph holds edges
+    # u -> v and the backward graph edges v -> u for each original or
+    # shortcut edge u -> v where v is ranked higher than u.
+    _up_offsets: array
+    _up_targets: array
+    _up_weights: array
+    _down_offsets: array
+    _down_targets: array
+    _down_weights: array
+
+    # (u, v) -> (cost, bypassed node or ORIGINAL) for unpacking
+    _edges: Dict[Tuple[int, int], _Edge]
+
+    def __init__(self, graph: BoardingGraph):
+        """Contract the graph"""
+        self.graph = graph
+        self._edges = {}
+        self.shortcuts = 0
+
+        # The remaining (uncontracted) graph, in both directions
+        out_edges: List[Dict[int, _Edge]] = [{} for _ in range(len(graph))]
+        in_edges: List[Dict[int, _Edge]] = [{} for _ in range(len(graph))]
+
+        for node in range(len(graph)):
+            for (target, weight) in graph.edges(node):
+                out_edges[node][target] = (weight, ORIGINAL)
+                in_edges[target][node] = (weight, ORIGINAL)
+                self._edges[(node, target)] = (weight, ORIGINAL)
+
+        self.rank = array("l", [0] * len(graph))
+        contracted = [False] * len(graph)
+        contracted_neighbours = [0] * len(graph)
+
+        def shortcuts_needed(node: int) -> List[Tuple[int, int, float]]:
+            """The shortcuts contracting node would need: (from, to, cost)"""
+            needed = []
+
+            for (source, (in_cost, _)) in in_edges[node].items():
+                # Targets whose direct edge isn't already good enough
+                pending = {
+                    target: in_cost + out_cost
+                    for (target, (out_cost, _)) in out_edges[node].items()
+                    if target != source and (
+                        target not in out_edges[source] or
+                        out_edges[source][target][0] > in_cost + out_cost
+                    )
+                }
+                if not pending:
+                    continue
+
+                found = _witness_search(
+                    out_edges, source, node, pending, max(pending.values())
+                )
+                needed.extend(
+                    (source, target, cost)
+                    for (target, cost) in pending.items()
+                    if found.get(target, cost + 1) > cost
+                )
+
+            return needed
+
+        def priority(node: int) -> int:
+            """Estimated edge difference plus contracted neighbours.
+
+            Lower goes first. Working out exactly which shortcuts would be
+            needed means a witness search per neighbour, which is too slow
+            to do for every node every time the order is checked, so assume
+            the worst: every in-neighbour needs a shortcut to every
+            out-neighbour. That is still a good guide to which nodes are
+            unimportant, and puts the line nodes, with an edge to every
+            station on the line, last.
+            """
+            degree_in = len(in_edges[node])
+            degree_out = len(out_edges[node])
+            return degree_in * degree_out - degree_in - degree_out + \
+                contracted_neighbours[node]
+
+        queue = [(priority(node), node) for node in range(len(graph))]
+        heapq.heapify(queue)
+        order = 0
+
+        while queue:
+            (_, node) = heapq.heappop(queue)
+            if contracted[node]:
+                continue
+
+            # Lazy update: if the node's priority has got worse since it
+            # was queued, put it back and try the next one
+            current = priority(node)
+            if queue and current > queue[0][0]:
+                heapq.heappush(queue, (current, node))
+                continue
+
+            for (source, target, cost) in shortcuts_needed(node):
+                edge = (cost, node)
+                out_edges[source][target] = edge
+                in_edges[target][source] = edge
+                self._edges[(source, target)] = edge
+                self.shortcuts += 1
+
+            for neighbour in [*in_edges[node], *out_edges[node]]:
+                contracted_neighbours[neighbour] += 1
+                out_edges[neighbour].pop(node, None)
+                in_edges[neighbour].pop(node, None)
+
+            contracted[node] = True
+            self.rank[node] = order
+            order += 1
+
+        self._build_upward_graphs()
+
+    def _build_upward_graphs(self):
+        """Split the edges into the forward and backward upward graphs"""
+        up: List[List[Tuple[int, float]]] = [[] for _ in range(len(self.graph))]
+        down: List[List[Tuple[int, float]]] = \
+            [[] for _ in range(len(self.graph))]
+
+        for ((source, target), (cost, _)) in self._edges.items():
+            if self.rank[target] > self.rank[source]:
+                up[source].append((target, cost))
+            else:
+                down[target].append((source, cost))
+
+        (self._up_offsets, self._up_targets, self._up_weights) = _csr(up)
+        (self._down_offsets, self._down_targets, self._down_weights) = \
+            _csr(down)
+
+    def version(self) -> int:
+        """The version of the model the hierarchy was built from"""
+        return self.graph.version()
+
+    def edge_count(self) -> int:
+        """The number of edges in the upward graphs (original + shortcuts)"""
+        return len(self._up_targets) + len(self._down_targets)
+
+    def index_bytes(self) -> int:
+        """Approximate size of the query index in bytes"""
+        return sum(
+            a.itemsize * len(a)
+            for a in (
+                self.rank,
+                self._up_offsets, self._up_targets, self._up_weights,
+                self._down_offsets, self._down_targets, self._down_weights
+            )
+        )
+
+    def route(self, start: str, destination: str) -> List[JourneySegment]:
+        """Cheapest journey from one station to another.
+
+        Raises ValueError if a route cannot be found.
+        Raises KeyError if either station does not exist.
+        """
+        source = self.graph.nodes[start]
+        target = self.graph.nodes[destination]
+
+        if source == target:
+            return []
+
+        # Bidirectional search, each direction only going upwards
+        forward = _UpwardSearch(
+            source, self._up_offsets, self._up_targets, self._up_weights
+        )
+        backward = _UpwardSearch(
+            target, self._down_offsets, self._down_targets,
+            self._down_weights
+        )
+
+        best = float("inf")
+        meeting = -1
+
+        while forward.queue or backward.queue:
+            for (search, other) in ((forward, backward), (backward, forward)):
+                # Neither side can improve once its frontier costs more
+                # than the best route found
+                if not search.queue or search.queue[0][0] >= best:
+                    search.queue = []
+                    continue
+
+                node = search.step()
+                if node in other.settled or node in other.cost:
+                    total = search.cost[node] + other.cost[node]
+                    if total < best:
+                        (best, meeting) = (total, node)
+
+        if meeting < 0:
+            raise ValueError(
+                f"Cannot find a route from {start} to {destination}"
+            )
+
+        path = forward.path(meeting)[::-1] + backward.path(meeting)[1:]
+
+        # Expand shortcuts back into original edges
+        nodes = [path[0]]
+        for (u, v) in zip(path, path[1:]):
+            nodes.extend(self._unpack(u, v))
+
+        return self.graph.segments(nodes)
+
+    def _unpack(self, source: int, target: int) -> List[int]:
+        """Nodes after source on the original edges an edge stands for"""
+        (_, middle) = self._edges[(source, target)]
+
+        if middle == ORIGINAL:
+            return [target]
+
+        return self._unpack(source, middle) + self._unpack(middle, target)
+
+
+class _UpwardSearch:
+    """One direction of a contraction hierarchy query"""
+
+    def __init__(
+        self,
+        source: int,
+        offsets: array,
+        targets: array,
+        weights: array
+    ):
+        self.cost = {source: 0.0}
+        self.previous = {source: -1}
+        self.settled = set()
+        self.queue = [(0.0, source)]
+        self._offsets = offsets
+        self._targets = targets
+        self._weights = weights
+
+    def step(self) -> int:
+        """Settle the next node, returning it"""
+        (cost, node) = heapq.heappop(self.queue)
+        while node in self.settled:
+            (cost, node) = heapq.heappop(self.queue)
+        self.settled.add(node)
+
+        for i in range(self._offsets[node], self._offsets[node + 1]):
+            next_node = self._targets[i]
+            next_cost = cost + self._weights[i]
+            if next_cost < self.cost.get(next_node, float("inf")):
+                self.cost[next_node] = next_cost
+                self.previous[next_node] = node
+                heapq.heappush(self.queue, (next_cost, next_node))
+
+        # Discard anything already settled from the top of the queue
+        while self.queue and self.queue[0][1] in self.settled:
+            heapq.heappop(self.queue)
+
+        return node
+
+    def path(self, node: int) -> List[int]:
+        """Nodes from node back to the source"""
+        path = [node]
+        while self.previous[path[-1]] >= 0:
+            path.append(self.previous[path[-1]])
+        return path
+
+
+def _witness_search(
+    out_edges: List[Dict[int, _Edge]],
+    source: int,
+    avoid: int,
+    targets: Dict[int, float],
+    limit: float
+) -> Dict[int, float]:
+    """Costs of the cheapest paths from source to targets avoiding a node.
+
+    Gives up on paths costing more than limit, or after settling
+    WITNESS_SETTLE_LIMIT nodes, so some targets may be missing.
+    """
+    cost = {source: 0.0}
+    settled = set()
+    queue = [(0.0, source)]
+    remaining = len(targets)
+
+    while queue and remaining and len(settled) < WITNESS_SETTLE_LIMIT:
+        (node_cost, node) = heapq.heappop(queue)
+        if node in settled:
+            continue
+        settled.add(node)
+
+        if node_cost > limit:
+            break
+        if node in targets:
+            remaining -= 1
+
+        for (next_node, (weight, _)) in out_edges[node].items():
+            if next_node == avoid:
+                continue
+            next_cost = node_cost + weight
+            if next_cost < cost.get(next_node, float("inf")):
+                cost[next_node] = next_cost
+                heapq.heappush(queue, (next_cost, next_node))
+
+    return {target: cost[target] for target in targets if target in cost}
+
+
+def _csr(adjacency: List[List[Tuple[int, float]]]) \
+        -> Tuple[array, array, array]:
+    """Pack an adjacency list into CSR offsets, targets and weights"""
+    offsets = array("l", [0])
+    targets = array("l")
+    weights = array("d")
+
+    for edges in adjacency:
+        for (target, weight) in edges:
+            targets.append(target)
+            weights.append(weight)
+        offsets.append(len(targets))
+
+    return (offsets, targets, weights)
@@ -0,0 +1,253 @@
+"""Load testing the server: recording, replaying and generating traffic.
+
+  - RequestLogger wraps the server's WSGI app and writes a line of JSON
+    per request (when it arrived, the path and query, the status and how
+    long it took), e.g. bin/serve.py --request-log requests.log
+  - zipf_routes makes synthetic /route requests, with a few popular
+    stations as the origin or destination of most journeys, as in real
+    traffic
+  - run_load sends requests to a server at a fixed rate, with the timing
+    of a recorded log, or as fast as possible, from a number of threads
+  - summarise works out the throughput, latency percentiles and error
+    rate by endpoint
+
+See bin/loadtest.py.
+
+With a schedule (a rate or recorded timings) latency is measured from
+when each request was due to be sent rather than when it actually was,
+so if the server falls behind the time requests spend waiting counts
+against it, as it would for real clients.
+"""
+
+from typing import *
+
+import bisect
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+import attr
+import requests
+from werkzeug.serving import BaseWSGIServer, make_server
+
+from .model import Model
+
+
+@attr.s(auto_attribs=True)
+class LoggedRequest:
+    """A request as recorded by RequestLogger"""
+
+    time: float
+    """When the request arrived, in seconds since the epoch"""
+
+    path: str
+    """The path and query string requested"""
+
+    status: int
+    """The response status"""
+
+    seconds: float
+    """Time taken to send the response"""
+
+
+class RequestLogger:
+    """WSGI middleware writing a LoggedRequest line per request"""
+
+    def __init__(self, app: Callable, log: TextIO):
+        self._app = app
+        self._log = log
+        self._lock = threading.Lock()
+
+    def __call__(self, environ, start_response):
+        arrived = time.time()
+        start_time = time.perf_counter()
+        status = [0]
+
+        def logged_start_response(line, headers, exc_info=None):
+            status[0] = int(line.split()[0])
+            return start_response(line, headers, exc_info)
+
+        body = self._app(environ, logged_start_response)
+        try:
+            yield from body
+        finally:
+            if hasattr(body, "close"):
+                body.close()
+
+            record = LoggedRequest(
+                time=arrived,
+                path=_request_path(environ),
+                status=status[0],
+                seconds=time.perf_counter() - start_time
+            )
+            with self._lock:
+                self._log.write(json.dumps(attr.asdict(record)) + "\n")
+                self._log.flush()
+
+
+def _request_path(environ) -> str:
+    """The path and query string of a request, still URL-encoded"""
+    # WSGI decodes the path as latin-1, so encoding it again gets back the
+    # original bytes
+    path = quote(environ.get("PATH_INFO", "").encode("latin-1"))
+    if environ.get("QUERY_STRING"):
+        path += "?" + environ["QUERY_STRING"]
+    return path
+
+
+def read_log(path: str) -> List[LoggedRequest]:
+    """Read a log written by RequestLogger"""
+    with open(path) as fd:
+        return [LoggedRequest(**json.loads(line)) for line in fd if line.strip()]
+
+
+def zipf_routes(
+    model: Model,
+    count: int,
+    exponent: float=1.0,
+    seed: int=0
+) -> List[str]:
+    """Paths of count /route requests between Zipf-distributed stations.
+
+    Stations are ranked by popularity, busiest interchanges first, and the
+    station of rank r is picked with probability proportional to
+    1 / r ** exponent, for both origin and destination.
+    """
+    rng = random.Random(seed)
+
+    # Busiest interchanges first, the rest in a random (but repeatable)
+    # order
+    names = sorted(model.stations())
+    rng.shuffle(names)
+    names.sort(key=lambda name: -len(model.station(name).lines))
+
+    weights = [1 / rank ** exponent for rank in range(1, len(names) + 1)]
+    cumulative = []
+    total = 0.0
+    for weight in weights:
+        total += weight
+        cumulative.append(total)
+
+    def pick() -> str:
+        position = bisect.bisect(cumulative, rng.random() * total)
+        return names[min(position, len(names) - 1)]
+
+    paths = []
+    while len(paths) < count:
+        (start, destination) = (pick(), pick())
+        if start != destination:
+            paths.append(f"/route/{quote(start)}/{quote(destination)}")
+    return paths
+
+
+def serve_in_background(app: Callable) -> Tuple[BaseWSGIServer, str]:
+    """Serve an app on a free local port from a background thread.
+
+    Returns the server, to shutdown() when finished, and its base URL.
+    """
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return (server, f"http://127.0.0.1:{server.server_port}")
+
+
+@attr.s(auto_attribs=True)
+class Result:
+    """The outcome of one request sent by run_load"""
+
+    path: str
+    """The path and query string requested"""
+
+    status: int
+    """The response status, or 0 if no response was received"""
+
+    seconds: float
+    """Latency of the request"""
+
+
+def run_load(
+    base_url: str,
+    paths: List[str],
+    offsets: Optional[List[float]]=None,
+    concurrency: int=8
+) -> Tuple[List[Result], float]:
+    """Send requests to a server, returning the results and the time taken.
+
+    offsets gives when to send each request, in seconds after starting.
+    Without it requests are sent as fast as the threads can manage.
+    """
+    sessions = threading.local()
+    start_time = time.perf_counter()
+
+    def send(n: int) -> Result:
+        due = start_time
+        if offsets is not None:
+            due += offsets[n]
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        sent = time.perf_counter()
+
+        if not hasattr(sessions, "session"):
+            sessions.session = requests.Session()
+
+        try:
+            status = sessions.session.get(base_url + paths[n]).status_code
+        except requests.RequestException:
+            status = 0
+
+        return Result(
+            path=paths[n],
+            status=status,
+            seconds=time.perf_counter() - (due if offsets else sent)
+        )
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = [*pool.map(send, range(len(paths)))]
+
+    return (results, time.perf_counter() - start_time)
+
+
+def endpoint(path: str) -> str:
+    """The endpoint a path is for, e.g. /route for /route/Bank/Oval"""
+    return "/" + path.split("?")[0].split("/")[1]
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """The value below which the fraction of the (sorted) values fall"""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def summarise(results: List[Result], seconds: float) \
+        -> Dict[str, Dict[str, float]]:
+    """Throughput, latency and errors by endpoint, and over "all" of them.
+
+    Latencies are in milliseconds. Errors are responses with a 4xx or 5xx
+    status, or no response at all.
+    """
+    groups: Dict[str, List[Result]] = {"all": results}
+    for result in results:
+        groups.setdefault(endpoint(result.path), []).append(result)
+
+    summary = {}
+    for (name, group) in sorted(groups.items()):
+        latencies = sorted(result.seconds * 1000 for result in group)
+        errors = sum(
+            1 for result in group
+            if result.status == 0 or result.status >= 400
+        )
+        summary[name] = {
+            "requests": len(group),
+            "throughput": len(group) / seconds if seconds else 0.0,
+            "errors": errors,
+            "error_rate": errors / len(group) if group else 0.0,
+            "p50": percentile(latencies, 0.5),
+            "p99": percentile(latencies, 0.99),
+            "p999": percentile(latencies, 0.999),
+        }
+
+    return summary
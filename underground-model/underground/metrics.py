@@ -0,0 +1,203 @@
+"""Counters and histograms in the Prometheus text format.
+
+Just enough of a metrics library to instrument the server without another
+dependency: counters, fixed-bucket histograms and gauges read from a
+callback when the metrics are rendered, each optionally split by labels.
+
+Recording is a dictionary update (plus a bisect for histograms) under a
+lock, cheap enough to leave on for every request.
+"""
+
+from typing import *
+
+import bisect
+import threading
+
+# Request latency buckets in seconds, from half a millisecond (a cached
+# route) to ten seconds (something has gone very wrong)
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0
+)
+
+
+def _escape(value: str) -> str:
+    """Escape a label value for the text format"""
+    return value.replace("\\", "\\\\").replace("\"", "\\\"") \
+        .replace("\n", "\\n")
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...]) -> str:
+    """Format label names and values, e.g. {route="/",status="200"}"""
+    if not names:
+        return ""
+    return "{" + ",".join(
+        f"{name}=\"{_escape(str(value))}\""
+        for (name, value) in zip(names, values)
+    ) + "}"
+
+
+def _number(value: float) -> str:
+    """Format a sample value, without a pointless .0 on whole numbers"""
+    if value == int(value):
+        return str(int(value))
+    return repr(value)
+
+
+class Counter:
+    """A count which only goes up, e.g. requests handled"""
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...]=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float=1):
+        """Add to the count for the given label values"""
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels: str) -> float:
+        """The count for the given label values"""
+        return self._values.get(labels, 0)
+
+    def render(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {self.help}",
+            f"# TYPE {self.name} counter"
+        ]
+        with self._lock:
+            values = sorted(self._values.items())
+        for (labels, value) in values:
+            lines.append(
+                f"{self.name}{_labels(self.labels, labels)} {_number(value)}"
+            )
+        return lines
+
+
+class Histogram:
+    """Counts of observations (e.g. latencies) in fixed buckets.
+
+    As in Prometheus, bucket counts are cumulative: the count for a bucket
+    includes every observation less than or equal to its upper bound.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        buckets: Sequence[float]=LATENCY_BUCKETS,
+        labels: Tuple[str, ...]=()
+    ):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = sorted(buckets)
+        # Label values -> (count in each bucket plus +Inf, sum)
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str):
+        """Record an observation for the given label values"""
+        bucket = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            if labels not in self._values:
+                self._values[labels] = ([0] * (len(self.buckets) + 1), [0.0])
+            (counts, total) = self._values[labels]
+            counts[bucket] += 1
+            total[0] += value
+
+    def count(self, *labels: str) -> int:
+        """The number of observations for the given label values"""
+        if labels not in self._values:
+            return 0
+        return sum(self._values[labels][0])
+
+    def render(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {self.help}",
+            f"# TYPE {self.name} histogram"
+        ]
+        with self._lock:
+            values = sorted(
+                (labels, ([*counts], total[0]))
+                for (labels, (counts, total)) in self._values.items()
+            )
+
+        names = (*self.labels, "le")
+        for (labels, (counts, total)) in values:
+            cumulative = 0
+            bounds = [*map(_number, self.buckets), "+Inf"]
+            for (bound, count) in zip(bounds, counts):
+                cumulative += count
+                lines.append(
+                    f"{self.name}_bucket{_labels(names, (*labels, bound))} "
+                    f"{cumulative}"
+                )
+            lines.append(
+                f"{self.name}_sum{_labels(self.labels, labels)} "
+                f"{_number(total)}"
+            )
+            lines.append(
+                f"{self.name}_count{_labels(self.labels, labels)} "
+                f"{cumulative}"
+            )
+        return lines
+
+
+class Gauge:
+    """A value read when the metrics are rendered, e.g. a cache size"""
+
+    def __init__(self, name: str, help: str, read: Callable[[], float]):
+        self.name = name
+        self.help = help
+        self._read = read
+
+    def render(self) -> List[str]:
+        return [
+            f"# HELP {self.name} {self.help}",
+            f"# TYPE {self.name} gauge",
+            f"{self.name} {_number(self._read())}"
+        ]
+
+
+class Registry:
+    """A set of metrics rendered together"""
+
+    def __init__(self):
+        self._metrics: List[Union[Counter, Histogram, Gauge]] = []
+
+    def counter(self, name: str, help: str, labels: Tuple[str, ...]=()) \
+            -> Counter:
+        """Create and register a counter"""
+        metric = Counter(name, help, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        buckets: Sequence[float]=LATENCY_BUCKETS,
+        labels: Tuple[str, ...]=()
+    ) -> Histogram:
+        """Create and register a histogram"""
+        metric = Histogram(name, help, buckets, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def gauge(self, name: str, help: str, read: Callable[[], float]) \
+            -> Gauge:
+        """Create and register a gauge"""
+        metric = Gauge(name, help, read)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """All the metrics in the Prometheus text format"""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
@@ -2,6 +2,14 @@ from typing import *
 
 import attr
 
+from . import trace
+from .store import (
+    CountIndex, NodeTable, PropertyGraph, RelationshipTable, overlay
+)
+
+if TYPE_CHECKING:
+    from .filters import StationFilter
+
 
 @attr.s(auto_attribs=True)
 class Station:
@@ -27,7 +35,7 @@ class Line:
     name: str
     """The name of the line"""
 
-    stations: List[str] = attr.Factory(list)
+    stations: Sequence[str] = attr.Factory(list)
     """The stations on the line"""
 
 
@@ -38,7 +46,7 @@ class District:
     name: str
     """The name of the local authority"""
 
-    stations: List[str] = attr.Factory(list)
+    stations: Sequence[str] = attr.Factory(list)
     """Stations within the local authority"""
 
 
@@ -49,34 +57,80 @@ class Zone:
     id: int
     """The id of the zone"""
 
-    stations: List[str] = attr.Factory(list)
+    stations: Sequence[str] = attr.Factory(list)
     """Stations within the zone"""
 
 
+
+
 class Model:
     """A representation of the TFL underground network.
 
-    The datastructure is in effect a graph - each of the
-    stations has a number of relationships to lines, a zone
-    and some districts.
-
-    A full general graph solution would be overkill for this
-    toy problem, so we're using a hard-coded structure here
-    instead. (Can't add arbitrary properties or relationships.)
+    The network is stored in a general property graph (see
+    underground/store.py): Station, Line, District and Zone nodes, with
+    ON_LINE, IN_DISTRICT and IN_ZONE relationships from each station. The
+    Model is a typed façade over it, keeping the graph consistent (e.g.
+    removing lines left without stations). Further properties can be
+    added to the graph's tables directly; see graph().
+
+    A Station, Line, District or Zone object is kept for every entity, so
+    a lookup costs a dictionary lookup. Their lists of lines and stations
+    are the graph's own lists of relationships, so follow changes, but a
+    change may replace an object; fetch it again after changing the model.
     """
 
-    # Private backing values
+    # The graph and its tables
+    _graph: PropertyGraph
+    _station_table: NodeTable
+    _line_table: NodeTable
+    _district_table: NodeTable
+    _zone_table: NodeTable
+    _on_line: RelationshipTable
+    _in_district: RelationshipTable
+    _in_zone: RelationshipTable
+
+    # An object for each entity, kept up to date as the model changes
     _stations: Dict[str, Station]
     _lines: Dict[str, Line]
     _districts: Dict[str, District]
     _zones: Dict[int, Zone]
 
+    # Whether the dicts of objects are shared with a copy, so must be
+    # overlaid (see store.py) before they're changed
+    _shared: bool
+
+    # Bitsets of all the stations and of those on each line and in each
+    # district and zone, kept on first use until they change, so filters
+    # cost a dict lookup per term
+    _station_bits: Optional[int]
+    _line_bits: Dict[str, int]
+    _district_bits: Dict[str, int]
+    _zone_bits: Dict[int, int]
+
     def __init__(self):
         """Initialise empty model"""
+        self._graph = PropertyGraph()
+        self._station_table = self._graph.add_nodes("Station")
+        self._line_table = self._graph.add_nodes("Line")
+        self._district_table = self._graph.add_nodes("District")
+        self._zone_table = self._graph.add_nodes("Zone")
+        self._on_line = self._graph.add_relationships(
+            "ON_LINE", "Station", "Line", degrees=True
+        )
+        self._in_district = \
+            self._graph.add_relationships("IN_DISTRICT", "Station", "District")
+        self._in_zone = \
+            self._graph.add_relationships("IN_ZONE", "Station", "Zone")
+
         self._stations = {}
         self._lines = {}
         self._districts = {}
         self._zones = {}
+        self._shared = False
+        self._station_bits = None
+        self._line_bits = {}
+        self._district_bits = {}
+        self._zone_bits = {}
 
     #
     # Methods to access data from the model
@@ -98,6 +152,55 @@ class Model:
         """Iterable of zone ids"""
         return self._zones.keys()
 
+    def version(self) -> int:
+        """Counter incremented every time the model content changes.
+
+        Anything precomputed from the model can compare this against the
+        value it was built from to tell whether it is stale.
+        """
+        return self._graph.version()
+
+    def graph(self) -> PropertyGraph:
+        """The property graph the model is stored in.
+
+        Properties may be added to its tables, set, indexed and queried
+        freely, e.g. model.graph().nodes("Station").add_property(...), but
+        nodes and relationships must only be changed through the Model.
+        """
+        return self._graph
+
+    def copy(self) -> "Model":
+        """A copy of the model to change independently, e.g. a variant of
+        the network for weekend service or engineering works.
+
+        The two share everything, down to the Station, Line, District and
+        Zone objects, until either changes it, and then only what changed
+        is copied (see PropertyGraph.copy). So a variant differing by a
+        few stations costs memory for those stations, however big the
+        network. Bitsets for filters are made again on first use.
+        """
+        copy = Model.__new__(Model)
+        copy._graph = self._graph.copy()
+        copy._station_table = copy._graph.nodes("Station")
+        copy._line_table = copy._graph.nodes("Line")
+        copy._district_table = copy._graph.nodes("District")
+        copy._zone_table = copy._graph.nodes("Zone")
+        copy._on_line = copy._graph.relationships("ON_LINE")
+        copy._in_district = copy._graph.relationships("IN_DISTRICT")
+        copy._in_zone = copy._graph.relationships("IN_ZONE")
+
+        copy._stations = self._stations
+        copy._lines = self._lines
+        copy._districts = self._districts
+        copy._zones = self._zones
+        self._shared = copy._shared = True
+
+        copy._station_bits = self._station_bits
+        copy._line_bits = {}
+        copy._district_bits = {}
+        copy._zone_bits = {}
+        return copy
+
     def station(self, name: str) -> Station:
         """Get named station from the model.
 
@@ -142,34 +245,186 @@ class Model:
         """
         return self._zones[id]
 
+    def station_line_counts(self) -> CountIndex:
+        """Index of stations by the number of lines they are on.
+
+        Kept up to date as the model changes. Users should not attempt to
+        modify the index.
+        """
+        return self._on_line.out_degrees
+
+    def line_station_counts(self) -> CountIndex:
+        """Index of lines by the number of stations on them.
+
+        Kept up to date as the model changes. Users should not attempt to
+        modify the index.
+        """
+        return self._on_line.in_degrees
+
+    #
+    # Bitset indexes, for combining with &, | and ~ to answer compound
+    # questions (see underground/filters.py)
+    #
+
+    def station_bits(self) -> int:
+        """Bitset of the ids of all stations in the model"""
+        if self._station_bits is None:
+            self._station_bits = self._station_table.bits()
+        return self._station_bits
+
+    def line_bits(self, name: str) -> int:
+        """Bitset of the ids of the stations on the named line.
+
+        Raises KeyError if the Line does not exist.
+        """
+        try:
+            return self._line_bits[name]
+        except KeyError:
+            pass
+
+        bits = self._line_bits[name] = self._on_line.source_bits(name)
+        return bits
+
+    def district_bits(self, name: str) -> int:
+        """Bitset of the ids of the stations in the named district.
+
+        Raises KeyError if the District does not exist.
+        """
+        try:
+            return self._district_bits[name]
+        except KeyError:
+            pass
+
+        bits = self._district_bits[name] = self._in_district.source_bits(name)
+        return bits
+
+    def zone_bits(self, id: int) -> int:
+        """Bitset of the ids of the stations in the zone.
+
+        Raises KeyError if the Zone does not exist.
+        """
+        try:
+            return self._zone_bits[id]
+        except KeyError:
+            pass
+
+        bits = self._zone_bits[id] = self._in_zone.source_bits(id)
+        return bits
+
+    def stations_from_bits(self, bits: int) -> List[str]:
+        """The names of the stations in a bitset, in id order"""
+        return self._station_table.keys_from_bits(bits)
+
+    def select(self, query: "StationFilter") -> List[str]:
+        """The names of the stations matching a filter, in id order.
+
+        See underground/filters.py for the available filters.
+        """
+        return self.stations_from_bits(query.bits(self))
+
+    def station_id(self, name: str) -> int:
+        """Get the integer id of the named station.
+
+        Ids are small non-negative integers suitable for indexing arrays
+        and bitmasks; they are never reused within a model.
+
+        Raises KeyError if the Station does not exist.
+        """
+        return self._station_table.id(name)
+
+    def station_name(self, id: int) -> str:
+        """Get the name of the station with the given id.
+
+        Raises KeyError if there is no station with that id.
+        """
+        return self._station_table.key(id)
+
+    def station_id_bound(self) -> int:
+        """One more than the largest station id handed out so far"""
+        return self._station_table.id_bound()
+
+    def line_id(self, name: str) -> int:
+        """Get the integer id of the named line.
+
+        Raises KeyError if the Line does not exist.
+        """
+        return self._line_table.id(name)
+
+    def line_name(self, id: int) -> str:
+        """Get the name of the line with the given id.
+
+        Raises KeyError if there is no line with that id.
+        """
+        return self._line_table.key(id)
+
+    def line_id_bound(self) -> int:
+        """One more than the largest line id handed out so far"""
+        return self._line_table.id_bound()
+
     #
     # Methods to alter model content
     #
 
+    @trace.traced("model.add_station")
     def add_station(self, name: str, district: str, zones: Tuple[int, ...]):
         """Add a new station to the model.
 
         Districts and Zones will be created as necessary.
         """
 
-        if name in self.stations():
+        if name in self._stations:
             raise ValueError(f"Station {name} already exists")
+        if self._shared:
+            self._unshare()
 
-        self._stations[name] = \
-            Station(name=name, district=district, zones=tuple(zones))
+        name = self._station_table.key(self._station_table.add(name))
+        self._station_bits = None
+        self._add_to_district_and_zones(name, district, zones)
 
-        if district not in self.districts():
-            self._districts[district] = District(name=district)
+    @trace.traced("model.update_station")
+    def update_station(
+        self,
+        name: str,
+        district: str,
+        zones: Tuple[int, ...]
+    ):
+        """Change the district and zones of an existing station.
 
-        self._districts[district].stations.append(name)
+        Districts and Zones will be created or removed as necessary.
 
-        for zone in zones:
-            if zone not in self.zones():
-                self._zones[zone] = Zone(id=zone)
+        Raises KeyError if the station does not exist.
+        """
+        name = self._stations[name].name
+        if self._shared:
+            self._unshare()
+
+        self._remove_from_district_and_zones(name)
+        self._add_to_district_and_zones(name, district, zones)
 
-            self._zones[zone].stations.append(name)
+    @trace.traced("model.remove_station")
+    def remove_station(self, name: str):
+        """Remove a station from the model.
 
+        The station is taken off all of its lines first. Lines, Districts
+        and Zones left without any stations are removed too.
 
+        Raises KeyError if the station does not exist.
+        """
+        station = self._stations[name]
+
+        for line in [*station.lines]:
+            self.remove_station_from_line(name, line)
+
+        if self._shared:
+            self._unshare()
+
+        self._remove_from_district_and_zones(station.name)
+
+        self._station_table.remove(station.name)
+        del self._stations[station.name]
+        self._station_bits = None
+
+    @trace.traced("model.add_station_to_line")
     def add_station_to_line(self, station_name: str, line: str):
         """Associate a station to a line.
 
@@ -178,11 +433,139 @@ class Model:
         Raises KeyError if the station does not exist.
         Raises ValueError if line has already been added to the station.
         """
-        if line in self._stations[station_name].lines:
+        station = self._stations[station_name]
+        if line in station.lines:
             raise ValueError(f"{station_name} already on {line}")
+        if self._shared:
+            self._unshare()
+
+        view = self._lines.get(line)
+        if view is None:
+            key = self._line_table.key(self._line_table.add(line))
+            view = self._lines[key] = \
+                Line(name=key, stations=self._on_line.sources(key))
+
+        self._on_line.add(station.name, view.name)
+
+        # The graph copies lists it shares with a copy of the model when
+        # they change, so the objects are replaced to hold the new ones
+        lines = self._on_line.targets(station.name)
+        if station.lines is not lines:
+            self._stations[station.name] = attr.evolve(station, lines=lines)
+        stations = self._on_line.sources(view.name)
+        if view.stations is not stations:
+            self._lines[view.name] = attr.evolve(view, stations=stations)
+
+        self._line_bits.pop(line, None)
+
+    @trace.traced("model.remove_station_from_line")
+    def remove_station_from_line(self, station_name: str, line: str):
+        """Disassociate a station from a line.
+
+        Lines left without any stations are removed.
 
-        if line not in self.lines():
-            self._lines[line] = Line(name=line)
+        Raises KeyError if the station does not exist.
+        Raises ValueError if the station is not on the line.
+        """
+        station = self._stations[station_name]
+        if line not in station.lines:
+            raise ValueError(f"{station_name} not on {line}")
+        if self._shared:
+            self._unshare()
+
+        self._on_line.remove(station.name, line)
+
+        lines = self._on_line.targets(station.name)
+        if station.lines is not lines:
+            self._stations[station.name] = attr.evolve(station, lines=lines)
+
+        stations = self._on_line.sources(line)
+        if stations:
+            view = self._lines[line]
+            if view.stations is not stations:
+                self._lines[line] = attr.evolve(view, stations=stations)
+        else:
+            self._line_table.remove(line)
+            del self._lines[line]
+
+        self._line_bits.pop(line, None)
 
-        self._lines[line].stations.append(station_name)
-        self._stations[station_name].lines.append(line)
+    #
+    # Internal helpers
+    #
+
+    def _unshare(self):
+        self._stations = overlay(self._stations)
+        self._lines = overlay(self._lines)
+        self._districts = overlay(self._districts)
+        self._zones = overlay(self._zones)
+        self._shared = False
+    def _add_to_district_and_zones(
+        self,
+        name: str,
+        district: str,
+        zones: Tuple[int, ...]
+    ):
+        """Record a station against its district and zones.
+
+        Also makes the station's object, which records both.
+        """
+        view = self._districts.get(district)
+        if view is None:
+            key = self._district_table.key(self._district_table.add(district))
+            view = self._districts[key] = District(
+                name=key, stations=self._in_district.sources(key)
+            )
+        district = view.name
+
+        self._in_district.add(name, district)
+        stations = self._in_district.sources(district)
+        if view.stations is not stations:
+            self._districts[district] = attr.evolve(view, stations=stations)
+        self._district_bits.pop(district, None)
+
+        # Each zone once, in order
+        zones = tuple(dict.fromkeys(zones))
+        for zone in zones:
+            view = self._zones.get(zone)
+            if view is None:
+                self._zone_table.add(zone)
+                view = self._zones[zone] = \
+                    Zone(id=zone, stations=self._in_zone.sources(zone))
+
+            self._in_zone.add(name, zone)
+            stations = self._in_zone.sources(zone)
+            if view.stations is not stations:
+                self._zones[zone] = attr.evolve(view, stations=stations)
+            self._zone_bits.pop(zone, None)
+
+        self._stations[name] = Station(
+            name=name,
+            district=district,
+            zones=zones,
+            lines=self._on_line.targets(name)
+        )
+
+    def _remove_from_district_and_zones(self, name: str):
+        """Undo _add_to_district_and_zones, dropping emptied entries"""
+        for (table, relationships, views, bits) in [
+            (
+                self._district_table, self._in_district,
+                self._districts, self._district_bits
+            ),
+            (
+                self._zone_table, self._in_zone,
+                self._zones, self._zone_bits
+            ),
+        ]:
+            for key in [*relationships.targets(name)]:
+                relationships.remove(name, key)
+                stations = relationships.sources(key)
+                if stations:
+                    view = views[key]
+                    if view.stations is not stations:
+                        views[key] = attr.evolve(view, stations=stations)
+                else:
+                    table.remove(key)
+                    del views[key]
+                bits.pop(key, None)
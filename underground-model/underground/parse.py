@@ -11,11 +11,13 @@ from typing import *
 
 import re
 
+from . import trace
 from .model import Model
 
 from bs4 import BeautifulSoup
 
 
+@trace.traced("parse.parse_underground")
 def parse_underground(filename: str, model: Optional[Model]=None) -> Model:
     """Parse the underground dataset.
 
@@ -24,7 +26,7 @@ def parse_underground(filename: str, model: Optional[Model]=None) -> Model:
     created.
     """
 
-    with open(filename) as fd:
+    with open(filename) as fd, trace.span("parse.html"):
         soup = BeautifulSoup(fd.read(), features="lxml")
 
     # The first table is expected to be the relevant one
@@ -87,6 +89,7 @@ def parse_underground(filename: str, model: Optional[Model]=None) -> Model:
     return model
 
 
+@trace.traced("parse.parse_dlr")
 def parse_dlr(filename: str, model: Optional[Model]=None) -> Model:
     """Parse the dlr dataset.
 
@@ -95,7 +98,7 @@ def parse_dlr(filename: str, model: Optional[Model]=None) -> Model:
     created.
     """
 
-    with open(filename) as fd:
+    with open(filename) as fd, trace.span("parse.html"):
         soup = BeautifulSoup(fd.read(), features="lxml")
 
     # The second table is expected to be the relevant one
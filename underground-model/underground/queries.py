@@ -2,37 +2,50 @@
 
 from typing import *
 
-from collections import defaultdict
+from array import array
+import heapq
 
 import attr
 
+from . import trace
 from .model import Model
 
+if TYPE_CHECKING:
+    from .graph import StationGraph
+
 
 def most_interchanges(model: Model) -> Tuple[int, List[str]]:
-    """The station(s) with the most interchanges in the Model."""
+    """The station(s) with the most interchanges in the Model.
 
-    counts = defaultdict(list)
+    Raises ValueError if the Model has no stations.
+    """
+    # The model keeps stations bucketed by their number of lines,
+    # so this is a lookup rather than a scan
+    return model.station_line_counts().max()
 
-    for station in model.stations():
-        counts[len(model.station(station).lines)].append(station)
 
-    max_count = max(counts.keys())
+def top_interchanges(model: Model, k: int) -> List[Tuple[str, int]]:
+    """The k stations with the most interchanges, as (station, lines) pairs.
 
-    return (max_count, counts[max_count])
+    Stations with the most lines come first.
+    """
+    return model.station_line_counts().top(k)
 
 
 def longest_line(model: Model) -> Tuple[int, List[str]]:
-    """The line(s) with the most stations in the Model."""
+    """The line(s) with the most stations in the Model.
 
-    counts = defaultdict(list)
+    Raises ValueError if the Model has no lines.
+    """
+    return model.line_station_counts().max()
 
-    for line in model.lines():
-        counts[len(model.line(line).stations)].append(line)
 
-    max_count = max(counts.keys())
+def longest_lines(model: Model, k: int) -> List[Tuple[str, int]]:
+    """The k longest lines, as (line, stations) pairs.
 
-    return (max_count, counts[max_count])
+    Lines with the most stations come first.
+    """
+    return model.line_station_counts().top(k)
 
 
 @attr.s(auto_attribs=True)
@@ -52,15 +65,74 @@ class JourneySegment:
     """The line to take"""
 
 
+@attr.s(auto_attribs=True, frozen=True)
+class Closures:
+    """Stations and lines which are out of service.
+
+    Trains still run through closed stations but passengers can't board,
+    alight or change there. Closed lines can't be used at all.
+
+    Closures are immutable and hashable so they can form part of a cache key.
+    """
+
+    stations: FrozenSet[str] = attr.ib(default=frozenset(), converter=frozenset)
+    """The names of the closed stations"""
+
+    lines: FrozenSet[str] = attr.ib(default=frozenset(), converter=frozenset)
+    """The names of the closed lines"""
+
+    def __bool__(self) -> bool:
+        return bool(self.stations or self.lines)
+
+    def masks(self, model: Model) -> Tuple[bytearray, bytearray]:
+        """Compile to (station, line) masks indexed by model ids.
+
+        A non-zero entry means that station or line is closed, so checking
+        an individual station or line is a single array lookup.
+
+        Raises KeyError if a closed station or line does not exist.
+        """
+        closed_stations = bytearray(model.station_id_bound())
+        for station in self.stations:
+            closed_stations[model.station_id(station)] = 1
+
+        closed_lines = bytearray(model.line_id_bound())
+        for line in self.lines:
+            closed_lines[model.line_id(line)] = 1
+
+        return (closed_stations, closed_lines)
+
+
+NO_CLOSURES = Closures()
+
+
+@attr.s(auto_attribs=True)
+class SearchStats:
+    """The work done by a shortest_route search"""
+
+    lines_expanded: int = 0
+    """Lines whose stations were all costed"""
+
+    stations_relaxed: int = 0
+    """Times a station was given a new best cost"""
+
+
+@trace.traced("queries.shortest_route")
 def shortest_route(
     model: Model,
     start: str,
-    destination: str
+    destination: str,
+    closures: Closures=NO_CLOSURES,
+    stats: Optional[SearchStats]=None
 ) -> List[JourneySegment]:
     """Get the recommended journey to take from one station to another.
 
+    Any stations or lines in closures are avoided. If stats is given, the
+    work done by the search is added to it.
+
     Raises ValueError if a route cannot be found.
-    Raises KeyError if either station does not exist.
+    Raises KeyError if either station does not exist, or a closed station
+    or line does not exist.
     """
 
     # We're going to calculate this using a modified Dijkstra's algorithm
@@ -115,8 +187,25 @@ def shortest_route(
     model.station(start)
     model.station(destination)
 
+    # Closures are checked against masks indexed by id, so a closed
+    # station or line costs one lookup to skip. When there are no closures
+    # the checks are skipped entirely.
+    (closed_stations, closed_lines) = closures.masks(model)
+    has_closures = bool(closures)
+    station_id = model.station_id
+    line_id = model.line_id
+
+    for station in (start, destination):
+        if has_closures and closed_stations[station_id(station)]:
+            raise ValueError(f"{station} is closed")
+
+    # Number of times a station got a new best cost, for stats
+    relaxed = 0
+
     # Initial step: seed the line weights
     for line in model.station(start).lines:
+        if has_closures and closed_lines[line_id(line)]:
+            continue
         line_weights[line] = (0, start)
 
     while len(line_weights) > 0:
@@ -130,6 +219,9 @@ def shortest_route(
         line_access_district = model.station(line_station).district
 
         for station in model.line(line).stations:
+            if has_closures and closed_stations[station_id(station)]:
+                continue
+
             station = model.station(station)
             station_cost = cost + min(station.zones)
 
@@ -143,10 +235,14 @@ def shortest_route(
                 processed_stations[station.name][0] > station_cost
             ):
                 processed_stations[station.name] = (station_cost, line)
+                relaxed += 1
 
                 # Update all the possible interchanges from that station,
                 # if that's a new best route to that line
                 for next_line in station.lines:
+                    if has_closures and closed_lines[line_id(next_line)]:
+                        continue
+
                     if (
                         next_line not in processed_lines and
                         (next_line not in line_weights or
@@ -162,6 +258,10 @@ def shortest_route(
             break
 
 
+    if stats is not None:
+        stats.lines_expanded += len(processed_lines)
+        stats.stations_relaxed += relaxed
+
     if destination not in processed_stations:
         # We ran out of lines to evaluate; somehow this journey is impossible
         raise ValueError(f"Cannot find a route from {start} to {destination}")
@@ -183,3 +283,405 @@ def shortest_route(
 
     # Reverse this and we have our journey!
     return journey_segments[::-1]
+
+
+@attr.s(auto_attribs=True)
+class Reach:
+    """The cheapest way to reach a station in a reachable() search"""
+
+    cost: float
+    """The journey cost, as used by shortest_route"""
+
+    interchanges: int
+    """The number of changes on the way (the fewest for that cost)"""
+
+    origin: str
+    """The origin the journey starts from"""
+
+
+@trace.traced("queries.reachable")
+def reachable(
+    model: Model,
+    origins: Iterable[str],
+    budget: Optional[float]=None,
+    max_interchanges: Optional[int]=None,
+    closures: Closures=NO_CLOSURES
+) -> Dict[str, Reach]:
+    """Every station reachable from any of the origins within the limits.
+
+    Returns station -> Reach for the cheapest journey from the nearest
+    origin, in order of cost. With a budget, stations costing more are
+    left out; with max_interchanges, only journeys changing at most that
+    many times are considered.
+
+    Raises ValueError if an origin is closed.
+    Raises KeyError if an origin does not exist, or a closed station or
+    line does not exist.
+    """
+
+    # Journeys are built up a ride at a time, in rounds: after round k the
+    # best cost of every station using at most k rides is known. Only
+    # stations which got cheaper in the last round can lead anywhere
+    # cheaper in the next, so each round only rides the lines through
+    # those. This finds the cheapest journeys within the interchange limit
+    # exactly, which a single cost-ordered search (like shortest_route)
+    # can't: the cheapest journey may change too often, with a dearer one
+    # that changes less still allowed.
+    #
+    # Riding to a station costs its (lowest) zone, less 0.5 if it's in
+    # the district the line was boarded in, as in shortest_route.
+
+    (closed_stations, closed_lines) = closures.masks(model)
+    has_closures = bool(closures)
+    station_id = model.station_id
+    line_id = model.line_id
+
+    def closed_station(name: str) -> bool:
+        return has_closures and closed_stations[station_id(name)]
+
+    def closed_line(name: str) -> bool:
+        return has_closures and closed_lines[line_id(name)]
+
+    # Station -> (cost, rides, origin)
+    best: Dict[str, Tuple[float, int, str]] = {}
+    for origin in origins:
+        model.station(origin)
+        if closed_station(origin):
+            raise ValueError(f"{origin} is closed")
+        best[origin] = (0.0, 0, origin)
+
+    improved = set(best)
+    rides = 0
+    max_rides = None if max_interchanges is None else max_interchanges + 1
+
+    while improved and (max_rides is None or rides < max_rides):
+        rides += 1
+
+        # For each line through an improved station, the cheapest place to
+        # board it overall and in each district
+        boarding: Dict[str, Tuple[float, str]] = {}
+        boarding_by_district: Dict[Tuple[str, str], Tuple[float, str]] = {}
+        for name in improved:
+            (cost, _, origin) = best[name]
+            if budget is not None and cost >= budget:
+                continue
+
+            station = model.station(name)
+            for line in station.lines:
+                if closed_line(line):
+                    continue
+                if line not in boarding or boarding[line][0] > cost:
+                    boarding[line] = (cost, origin)
+                key = (line, station.district)
+                if key not in boarding_by_district or \
+                        boarding_by_district[key][0] > cost:
+                    boarding_by_district[key] = (cost, origin)
+
+        improved = set()
+        for (line, (board_cost, board_origin)) in boarding.items():
+            for name in model.line(line).stations:
+                if closed_station(name):
+                    continue
+
+                station = model.station(name)
+                (cost, origin) = (board_cost + min(station.zones), board_origin)
+
+                same_district = boarding_by_district.get(
+                    (line, station.district)
+                )
+                if same_district is not None and \
+                        same_district[0] + min(station.zones) - 0.5 < cost:
+                    cost = same_district[0] + min(station.zones) - 0.5
+                    origin = same_district[1]
+
+                if budget is not None and cost > budget:
+                    continue
+                if name not in best or best[name][0] > cost:
+                    best[name] = (cost, rides, origin)
+                    improved.add(name)
+
+    return {
+        name: Reach(
+            cost=cost, interchanges=max(0, rides - 1), origin=origin
+        )
+        for (name, (cost, rides, origin)) in sorted(
+            best.items(), key=lambda item: (item[1][0], item[0])
+        )
+    }
+
+@attr.s(auto_attribs=True)
+class ParetoRoute:
+    """One of the routes in a pareto_routes() trade-off"""
+
+    cost: float
+    """The journey cost, as used by shortest_route"""
+
+    interchanges: int
+    """The number of changes"""
+
+    zones: int
+    """Zone boundaries crossed, boundary stations counting as their lowest"""
+
+    journey: List[JourneySegment]
+    """The route itself"""
+
+
+@trace.traced("queries.pareto_routes")
+def pareto_routes(
+    model: Model,
+    start: str,
+    destination: str,
+    closures: Closures=NO_CLOSURES,
+    graph: Optional["StationGraph"]=None
+) -> List[ParetoRoute]:
+    """Every route not beaten on all of cost, interchanges and zones.
+
+    Rather than the single cheapest route, this is the trade-off between
+    the three: a route is only left out if another is no worse on any of
+    them (and better on at least one). Where routes tie on all three only
+    one is given. Cheapest first.
+
+    graph is the model compiled to a StationGraph, built if not given;
+    pass one kept from earlier to save building it again.
+
+    Raises ValueError if a route cannot be found.
+    Raises KeyError if either station does not exist, or a closed station
+    or line does not exist.
+    """
+    # graph.py uses JourneySegment from this module, so import it late
+    from .graph import StationGraph
+
+    # A label-setting search (Martins' algorithm) over the station graph.
+    # A label is a way of reaching a station: its cost, rides and zones
+    # crossed, and the label it was reached from. Labels come off the
+    # queue in order of (cost, rides, zones), and as every ride costs
+    # something a label can only be dominated by ones taken off before
+    # it, so each one taken off the queue and not dominated by the labels
+    # kept at its station (or the destination, as nothing can improve on
+    # those) is on the Pareto front there and is kept.
+    #
+    # The labels are parallel arrays indexed by label number, rather than
+    # an object each. As every label kept is no dearer than the one being
+    # checked, dominance only needs the rides and zones of the kept ones:
+    # each station's front is the fewest zones of any label kept there
+    # with at most each number of rides, so checking is one lookup.
+    #
+    # Anything still short of the destination needs at least one more ride
+    # and to cross the zones between it and the destination, so labels are
+    # checked against the destination's front with those added.
+
+    if graph is None:
+        graph = StationGraph(model)
+
+    model.station(start)
+    model.station(destination)
+    (closed_stations, _) = closures.masks(model)
+    for station in (start, destination):
+        if closures and closed_stations[model.station_id(station)]:
+            raise ValueError(f"{station} is closed")
+
+    closed_nodes = {graph.nodes[name] for name in closures.stations}
+    line_numbers = {line: n for (n, line) in enumerate(graph.line_names)}
+    closed_line_numbers = {line_numbers[line] for line in closures.lines}
+
+    def open_line(node: int, next_node: int, line: int) -> int:
+        """An open line to use instead of a closed one, or -1 if none.
+
+        The edge records one of the lines between its stations; others
+        may still be open.
+        """
+        other = model.station(graph.names[next_node]).lines
+        for line in model.station(graph.names[node]).lines:
+            if line in other and line not in closures.lines:
+                return line_numbers[line]
+        return -1
+
+    source = graph.nodes[start]
+    target = graph.nodes[destination]
+    (offsets, targets, weights, lines, crossings) = (
+        graph.offsets, graph.targets, graph.weights, graph.lines,
+        graph.crossings
+    )
+
+    label_costs = array("d", [0.0])
+    label_rides = array("l", [0])
+    label_zones = array("l", [0])
+    label_nodes = array("l", [source])
+    label_parents = array("l", [-1])
+    label_lines = array("l", [-1])
+
+    # Node -> zone boundaries between it and the destination
+    destination_zone = min(model.station(destination).zones)
+    zones_left = [
+        abs(min(model.station(name).zones) - destination_zone)
+        for name in graph.names
+    ]
+
+    # Node -> fewest zones crossed by a kept label with at most n rides
+    fronts: List[List[int]] = [[] for _ in range(len(graph))]
+    kept: List[int] = []
+
+    def dominated(node: int, rides: int, zones: int) -> bool:
+        front = fronts[node]
+        return bool(front) and front[min(rides, len(front) - 1)] <= zones
+
+    def keep(node: int, rides: int, zones: int):
+        front = fronts[node]
+        if len(front) <= rides:
+            front.extend(
+                [front[-1] if front else zones] * (rides + 1 - len(front))
+            )
+        for i in range(rides, len(front)):
+            front[i] = min(front[i], zones)
+
+    target_front = fronts[target]
+    queue = [(0.0, 0, 0, 0)]
+    while queue:
+        (cost, rides, zones, label) = heapq.heappop(queue)
+        node = label_nodes[label]
+        if dominated(node, rides, zones) or (
+            node != target and
+            dominated(target, rides + 1, zones + zones_left[node])
+        ):
+            continue
+        keep(node, rides, zones)
+        if node == target:
+            kept.append(label)
+            continue
+
+        # The checks from dominated(), inline as this is the hot loop
+        rides += 1
+        for edge in range(offsets[node], offsets[node + 1]):
+            next_node = targets[edge]
+            next_zones = zones + crossings[edge]
+            front = fronts[next_node]
+            if front and front[min(rides, len(front) - 1)] <= next_zones:
+                continue
+            if next_node != target and target_front and target_front[
+                min(rides + 1, len(target_front) - 1)
+            ] <= next_zones + zones_left[next_node]:
+                continue
+            if next_node in closed_nodes:
+                continue
+            line = lines[edge]
+            if line in closed_line_numbers:
+                line = open_line(node, next_node, line)
+                if line < 0:
+                    continue
+
+            label_costs.append(cost + weights[edge])
+            label_rides.append(rides)
+            label_zones.append(next_zones)
+            label_nodes.append(next_node)
+            label_parents.append(label)
+            label_lines.append(line)
+            heapq.heappush(queue, (
+                cost + weights[edge], rides, next_zones, len(label_costs) - 1
+            ))
+
+    if not kept:
+        raise ValueError(f"Cannot find a route from {start} to {destination}")
+
+    routes = []
+    for label in kept:
+        path = [target]
+        path_lines = []
+        step = label
+        while label_parents[step] >= 0:
+            path_lines.append(label_lines[step])
+            step = label_parents[step]
+            path.append(label_nodes[step])
+
+        routes.append(ParetoRoute(
+            cost=label_costs[label],
+            interchanges=max(0, label_rides[label] - 1),
+            zones=label_zones[label],
+            journey=graph.segments(path[::-1], path_lines[::-1])
+        ))
+
+    return routes
+
+
+@attr.s(auto_attribs=True)
+class Centrality:
+    """How much the network's cheapest journeys rely on each station and line.
+
+    Scores are betweenness centralities: out of the cheapest journeys
+    between every (ordered) pair of stations, the number which change
+    trains at a station or ride a line. Where several journeys are equally
+    cheap each counts for a share.
+    """
+
+    version: int
+    """The version of the model the scores are for"""
+
+    stations: Dict[str, float]
+    """Station name -> number of journeys changing there"""
+
+    lines: Dict[str, float]
+    """Line name -> number of journeys riding it"""
+
+    def top_stations(self, k: int) -> List[Tuple[str, float]]:
+        """The k most critical stations, as (station, score) pairs"""
+        return _top(self.stations, k)
+
+    def top_lines(self, k: int) -> List[Tuple[str, float]]:
+        """The k most critical lines, as (line, score) pairs"""
+        return _top(self.lines, k)
+
+
+def _top(scores: Dict[str, float], k: int) -> List[Tuple[str, float]]:
+    """Highest scores first, ties by name"""
+    return sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:k]
+
+
+@trace.traced("queries.betweenness_centrality")
+def betweenness_centrality(model: Model, workers: Optional[int]=None) \
+        -> Centrality:
+    """Betweenness centrality of every station and line.
+
+    This considers every pair of stations, so is far too slow to do per
+    request; the result should be kept until the model version changes.
+    With workers > 1 the journeys from different stations are counted in
+    that many processes.
+
+    A ride between two stations on more than one line is shared equally
+    between the lines.
+    """
+    # graph.py uses JourneySegment from this module, so import it late
+    from .graph import StationGraph, betweenness
+
+    graph = StationGraph(model)
+    sources = range(len(graph))
+
+    if workers and workers > 1:
+        # Only imported when needed, as multiprocessing is slow to import
+        from concurrent.futures import ProcessPoolExecutor
+
+        chunks = [sources[n::workers] for n in range(workers)]
+        with ProcessPoolExecutor(workers) as pool:
+            results = [*pool.map(betweenness, [graph] * workers, chunks)]
+        station_scores = sum(scores for (scores, _) in results)
+        edge_scores = sum(scores for (_, scores) in results)
+    else:
+        (station_scores, edge_scores) = betweenness(graph, sources)
+
+    edge_scores = edge_scores.tolist()
+    line_scores = {line: 0.0 for line in model.lines()}
+    for node in range(len(graph)):
+        lines = model.station(graph.names[node]).lines
+        for i in range(graph.offsets[node], graph.offsets[node + 1]):
+            if edge_scores[i]:
+                other = model.station(graph.names[graph.targets[i]]).lines
+                shared = [line for line in lines if line in other]
+                for line in shared:
+                    line_scores[line] += edge_scores[i] / len(shared)
+
+    return Centrality(
+        version=graph.version(),
+        stations={
+            name: float(score)
+            for (name, score) in zip(graph.names, station_scores)
+        },
+        lines=line_scores
+    )
@@ -0,0 +1,187 @@
+"""Incrementally bring a live Model up to date with re-downloaded sources.
+
+Rather than throwing away the live model and rebuilding it, the freshly
+parsed data is diffed against it and only the differences are applied.
+The differences are reported back so that anything derived from the model
+only needs rebuilding when the parts it depends on have changed.
+"""
+
+from typing import *
+
+import attr
+
+from . import make_standard_model
+from .model import Model
+
+
+@attr.s(auto_attribs=True)
+class StationUpdate:
+    """The new district and zones of a station"""
+
+    name: str
+    """The name of the station"""
+
+    district: str
+    """The name of the district the station is in"""
+
+    zones: Tuple[int, ...]
+    """The zones the station is in"""
+
+
+@attr.s(auto_attribs=True)
+class ModelChanges:
+    """The differences between two models.
+
+    Applying these to the old model turns it into the new one.
+    """
+
+    added_stations: List[StationUpdate] = attr.Factory(list)
+    """Stations which are new"""
+
+    removed_stations: List[str] = attr.Factory(list)
+    """Stations which no longer exist"""
+
+    changed_stations: List[StationUpdate] = attr.Factory(list)
+    """Stations whose district or zones have changed"""
+
+    added_to_lines: List[Tuple[str, str]] = attr.Factory(list)
+    """(station, line) memberships which are new"""
+
+    removed_from_lines: List[Tuple[str, str]] = attr.Factory(list)
+    """(station, line) memberships which no longer exist"""
+
+    added_lines: List[str] = attr.Factory(list)
+    """Lines created as a result of the changes"""
+
+    removed_lines: List[str] = attr.Factory(list)
+    """Lines removed as a result of the changes"""
+
+    added_districts: List[str] = attr.Factory(list)
+    """Districts created as a result of the changes"""
+
+    removed_districts: List[str] = attr.Factory(list)
+    """Districts removed as a result of the changes"""
+
+    added_zones: List[int] = attr.Factory(list)
+    """Zones created as a result of the changes"""
+
+    removed_zones: List[int] = attr.Factory(list)
+    """Zones removed as a result of the changes"""
+
+    def is_empty(self) -> bool:
+        """True if the models were identical"""
+        return not (
+            self.added_stations or self.removed_stations or
+            self.changed_stations or self.added_to_lines or
+            self.removed_from_lines
+        )
+
+    def stations_changed(self) -> bool:
+        """True if the set of station names has changed.
+
+        Structures keyed purely on station names (e.g. name lookups) only
+        need rebuilding when this is true.
+        """
+        return bool(self.added_stations or self.removed_stations)
+
+    def routes_changed(self) -> bool:
+        """True if anything used to plan journeys has changed.
+
+        Route searches depend on line memberships as well as the districts
+        and zones of the stations.
+        """
+        return not self.is_empty()
+
+
+def diff_models(old: Model, new: Model) -> ModelChanges:
+    """Work out the changes needed to turn the old model into the new one.
+
+    Only the station-level changes are filled in; the lines, districts and
+    zones which appear or disappear are filled in by apply_changes, as they
+    follow from the station changes.
+    """
+    changes = ModelChanges()
+
+    for name in new.stations():
+        station = new.station(name)
+        update = StationUpdate(
+            name=name,
+            district=station.district,
+            zones=station.zones
+        )
+
+        if name not in old.stations():
+            changes.added_stations.append(update)
+            old_lines = []
+        else:
+            old_station = old.station(name)
+            if (
+                old_station.district != station.district or
+                old_station.zones != station.zones
+            ):
+                changes.changed_stations.append(update)
+            old_lines = old_station.lines
+
+        changes.added_to_lines.extend(
+            (name, line) for line in station.lines if line not in old_lines
+        )
+        changes.removed_from_lines.extend(
+            (name, line) for line in old_lines if line not in station.lines
+        )
+
+    for name in old.stations():
+        if name not in new.stations():
+            changes.removed_stations.append(name)
+
+    return changes
+
+
+def apply_changes(model: Model, changes: ModelChanges) -> ModelChanges:
+    """Apply the changes found by diff_models to the model in place.
+
+    The lines, districts and zones which were created or removed are
+    recorded on the changes, which are returned for convenience.
+    """
+    lines = [*model.lines()]
+    districts = [*model.districts()]
+    zones = [*model.zones()]
+
+    # Removals first, so that a line emptied then refilled doesn't churn
+    for (station, line) in changes.removed_from_lines:
+        model.remove_station_from_line(station, line)
+
+    for station in changes.removed_stations:
+        model.remove_station(station)
+
+    for update in changes.changed_stations:
+        model.update_station(update.name, update.district, update.zones)
+
+    for update in changes.added_stations:
+        model.add_station(update.name, update.district, update.zones)
+
+    for (station, line) in changes.added_to_lines:
+        model.add_station_to_line(station, line)
+
+    changes.added_lines = [l for l in model.lines() if l not in lines]
+    changes.removed_lines = [l for l in lines if l not in model.lines()]
+    changes.added_districts = \
+        [d for d in model.districts() if d not in districts]
+    changes.removed_districts = \
+        [d for d in districts if d not in model.districts()]
+    changes.added_zones = [z for z in model.zones() if z not in zones]
+    changes.removed_zones = [z for z in zones if z not in model.zones()]
+
+    return changes
+
+
+def refresh_model(
+    model: Model,
+    underground_file: str="underground.html",
+    dlr_file: str="dlr.html"
+) -> ModelChanges:
+    """Re-parse the source files and bring the model up to date with them.
+
+    Returns the changes which were applied.
+    """
+    fresh = make_standard_model(underground_file, dlr_file)
+    return apply_changes(model, diff_models(model, fresh))
@@ -0,0 +1,306 @@
+"""Fuzzy lookup of station names.
+
+Station names on Wikipedia are inconsistent about punctuation ("St. Paul's"
+vs "St James's Park", "Harrow-on-the-Hill", "Elephant & Castle") and users
+are inconsistent about everything. The StationIndex built here accepts
+partial and misspelled names and ranks the stations they could refer to.
+
+All the work is done when the index is built, so a lookup is a few
+bisections and dictionary lookups rather than a scan over the stations:
+
+  - A sorted array of normalised names, for prefix matches.
+  - A sorted array of the words in the names, for matching any word.
+  - A deletion index (as used by SymSpell) over both names and words for
+    matches within a bounded edit distance. Two strings are within edit
+    distance k only if deleting at most k characters from each gives a
+    common string, so precomputing the deletions of every name means a
+    query only has to look up its own deletions.
+"""
+
+from typing import *
+
+import bisect
+import re
+
+import attr
+
+from .model import Model
+
+
+# Maximum edit distance for fuzzy matches
+MAX_EDIT_DISTANCE = 2
+
+# Words shorter than this are only matched exactly (or by prefix),
+# otherwise everything matches "st" or "by"
+MIN_FUZZY_LENGTH = 4
+
+
+def normalise(name: str) -> str:
+    """Normalise a name for comparison.
+
+    Lower case, "&" spelt out, apostrophes and full stops dropped and any
+    other punctuation treated as a space, e.g. "St. John's Wood" becomes
+    "st johns wood" and "Harrow-on-the-Hill" becomes "harrow on the hill".
+    """
+    name = name.lower().replace("&", " and ")
+    name = re.sub(r"['.’]", "", name)
+    return " ".join(re.split(r"[^a-z0-9]+", name)).strip()
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """Levenshtein distance between two strings, up to limit.
+
+    Returns limit + 1 as soon as the distance is known to exceed limit.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+
+    previous = [*range(len(b) + 1)]
+
+    for (i, ca) in enumerate(a, 1):
+        current = [i]
+        for (j, cb) in enumerate(b, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (ca != cb)
+            ))
+
+        if min(current) > limit:
+            return limit + 1
+
+        previous = current
+
+    return min(previous[-1], limit + 1)
+
+
+def _deletions(word: str, distance: int) -> Set[str]:
+    """All the strings made by deleting up to distance characters"""
+    result = {word}
+    frontier = {word}
+
+    for _ in range(distance):
+        frontier = {
+            w[:i] + w[i + 1:]
+            for w in frontier
+            for i in range(len(w))
+        }
+        result |= frontier
+
+    return result
+
+
+class _DeletionIndex:
+    """Finds strings within a bounded edit distance of a query"""
+
+    _deletions: Dict[str, Set[str]]
+    _distance: int
+
+    def __init__(self, words: Iterable[str], distance: int):
+        self._deletions = {}
+        self._distance = distance
+
+        for word in words:
+            for deletion in _deletions(word, distance):
+                self._deletions.setdefault(deletion, set()).add(word)
+
+    def find(self, query: str) -> Dict[str, int]:
+        """Indexed strings within the edit distance, with their distances"""
+        candidates = set()
+        for deletion in _deletions(query, self._distance):
+            candidates |= self._deletions.get(deletion, set())
+
+        result = {}
+        for candidate in candidates:
+            distance = edit_distance(query, candidate, self._distance)
+            if distance <= self._distance:
+                result[candidate] = distance
+
+        return result
+
+
+def _prefixed(keys: List[str], prefix: str) -> Iterator[str]:
+    """The entries of a sorted list starting with prefix"""
+    i = bisect.bisect_left(keys, prefix)
+    while i < len(keys) and keys[i].startswith(prefix):
+        yield keys[i]
+        i += 1
+
+
+@attr.s(auto_attribs=True)
+class SearchResult:
+    """A station matching a search"""
+
+    name: str
+    """The name of the station"""
+
+    exact: bool
+    """Whether the query names the station exactly (after normalisation)"""
+
+    distance: int
+    """Total edit distance of the words of the query from the name"""
+
+
+class StationIndex:
+    """Search index over the names of the stations in a Model.
+
+    The index is a snapshot; it will not reflect changes made to the model
+    after it is built. Compare version() with the model's to tell if it
+    needs rebuilding.
+    """
+
+    _version: int
+
+    # Normalised name -> station names (usually just the one)
+    _names: Dict[str, List[str]]
+    _sorted_names: List[str]
+
+    # Word -> station names containing that word
+    _words: Dict[str, Set[str]]
+    _sorted_words: List[str]
+
+    _name_deletions: _DeletionIndex
+    _word_deletions: _DeletionIndex
+
+    def __init__(self, model: Model):
+        """Build the index from the model's stations"""
+        self._version = model.version()
+        self._names = {}
+        self._words = {}
+
+        for station in model.stations():
+            key = normalise(station)
+            self._names.setdefault(key, []).append(station)
+
+            for word in key.split():
+                self._words.setdefault(word, set()).add(station)
+
+        self._sorted_names = sorted(self._names)
+        self._sorted_words = sorted(self._words)
+
+        self._name_deletions = \
+            _DeletionIndex(self._names, MAX_EDIT_DISTANCE)
+        self._word_deletions = _DeletionIndex(
+            (w for w in self._words if len(w) >= MIN_FUZZY_LENGTH),
+            MAX_EDIT_DISTANCE
+        )
+
+    def version(self) -> int:
+        """The version of the model the index was built from"""
+        return self._version
+
+    def search(self, query: str, limit: int=10) -> List[SearchResult]:
+        """Stations matching the query, best first.
+
+        Matches are ranked:
+          - Exact matches (ignoring case and punctuation)
+          - Names starting with the query
+          - Names with words starting with each word of the query
+          - Names within a small edit distance of the query, or with words
+            within a small edit distance of each word of the query
+        with fewer edits, then shorter names, ranking higher in each group.
+
+        Raises ValueError if limit is negative.
+        """
+        if limit < 0:
+            raise ValueError("Invalid limit")
+
+        key = normalise(query)
+        if not key:
+            return []
+
+        # Station -> (rank, distance)
+        matches: Dict[str, Tuple[int, int]] = {}
+
+        def found(stations: Iterable[str], rank: int, distance: int=0):
+            for station in stations:
+                if (rank, distance) < matches.get(station, (rank + 1, 0)):
+                    matches[station] = (rank, distance)
+
+        found(self._names.get(key, []), 0)
+
+        for name in _prefixed(self._sorted_names, key):
+            found(self._names[name], 1)
+
+        if len(key) >= MIN_FUZZY_LENGTH:
+            fuzzy = self._name_deletions.find(key)
+            for (name, distance) in fuzzy.items():
+                found(self._names[name], 3, distance)
+
+        # Word matching: every word of the query must match a word of the
+        # name, the last by prefix (as it may not have been finished)
+        # and all of them allowing for typos
+        words = key.split()
+        candidates: Optional[Dict[str, Tuple[int, int]]] = None
+
+        for (i, word) in enumerate(words):
+            word_matches: Dict[str, Tuple[int, int]] = {}
+
+            def word_found(
+                station_word: str, rank: int, distance: int
+            ):
+                for station in self._words[station_word]:
+                    if (rank, distance) < \
+                            word_matches.get(station, (4, 0)):
+                        word_matches[station] = (rank, distance)
+
+            if i == len(words) - 1:
+                for station_word in _prefixed(self._sorted_words, word):
+                    word_found(station_word, 2, 0)
+            elif word in self._words:
+                word_found(word, 2, 0)
+
+            if len(word) >= MIN_FUZZY_LENGTH:
+                fuzzy = self._word_deletions.find(word)
+                for (station_word, distance) in fuzzy.items():
+                    word_found(station_word, 3, distance)
+
+            if candidates is None:
+                candidates = word_matches
+            else:
+                candidates = {
+                    station: (
+                        max(rank, word_matches[station][0]),
+                        distance + word_matches[station][1]
+                    )
+                    for (station, (rank, distance)) in candidates.items()
+                    if station in word_matches
+                }
+
+        for (station, (rank, distance)) in (candidates or {}).items():
+            found([station], rank, distance)
+
+        ranked = sorted(
+            matches.items(),
+            key=lambda item: (*item[1], len(item[0]), item[0])
+        )
+
+        return [
+            SearchResult(name=station, exact=rank == 0, distance=distance)
+            for (station, (rank, distance)) in ranked[:limit]
+        ]
+
+    def resolve(self, query: str) -> Optional[str]:
+        """The station the query most likely refers to.
+
+        Returns None unless there is an exact match, or a single best
+        match for the whole name within the edit distance limit.
+        """
+        key = normalise(query)
+
+        if len(self._names.get(key, [])) == 1:
+            return self._names[key][0]
+
+        if len(key) < MIN_FUZZY_LENGTH:
+            return None
+
+        fuzzy = sorted(
+            (distance, station)
+            for (name, distance) in self._name_deletions.find(key).items()
+            for station in self._names[name]
+        )
+
+        if fuzzy and (len(fuzzy) == 1 or fuzzy[0][0] < fuzzy[1][0]):
+            return fuzzy[0][1]
+
+        return None
@@ -1,11 +1,39 @@
+from typing import *
+
+import functools
+import hashlib
 import json
+import math
 import os
+import re
+import threading
+import time
+import weakref
+import zlib
 
-from flask import Flask, Response, jsonify, render_template
+from flask import (
+    Blueprint, Flask, Response, g, jsonify, render_template, request
+)
 from flask_cors import CORS
 
-from .model import Model
-from .queries import shortest_route
+from .ask import MentionFinder, interpret
+from .encoding import (
+    JSON, MSGPACK, ROUTE_IDS, dictionary, pack_route, pack_route_ids, packb
+)
+from .filters import parse_filter
+from .geo import LocationIndex, parse_coordinates
+from .metrics import Registry
+from .model import Model, Station
+from .queries import (
+    NO_CLOSURES, Centrality, Closures, JourneySegment, ParetoRoute,
+    SearchStats, betweenness_centrality, longest_lines, pareto_routes,
+    reachable, shortest_route, top_interchanges
+)
+from .search import StationIndex
+from .timetable import Timetable, TimedJourneySegment, format_time, parse_time
+
+if TYPE_CHECKING:
+    from .graph import StationGraph
 
 FRONTEND_DIST_DIR = os.path.abspath(
     os.path.join(
@@ -17,78 +45,855 @@ FRONTEND_DIST_DIR = os.path.abspath(
 )
 
 
-def make_error_response(reason: str) -> Response:
-    """Helper to make error response"""
-    return Response(json.dumps({"error": reason}), status=400)
+def make_error_response(reason: str, kind: str, status: int=400) \
+        -> Response:
+    """Helper to make error response.
 
-def make_app(model: Model) -> Flask:
-    """Create a flask application for the provided model"""
+    kind is what the error is counted as in the metrics, e.g.
+    "unknown_station" or "bad_request".
+    """
+    # Remembered for the error metrics
+    g.error_kind = kind
+    return Response(json.dumps({"error": reason}), status=status)
 
-    print(FRONTEND_DIST_DIR)
 
-    app = Flask(
-        __name__,
-        template_folder=FRONTEND_DIST_DIR,
-        static_folder=FRONTEND_DIST_DIR,
-        static_url_path=""
-    )
+def route_error_kind(closures: Closures, *stations: str) -> str:
+    """The kind of error a route search's ValueError is.
 
-    # Allow cross-origin requests
-    CORS(app)
+    Searches fail either because the start or destination is closed or
+    because there's no route between them.
+    """
+    if any(station in closures.stations for station in stations):
+        return "closed_station"
+    return "unreachable"
 
-    @app.route("/")
-    def frontpage():
-        return render_template("index.html")
 
-    @app.route("/station/<station>")
+def preferred_encoding(offers: Sequence[str]=(JSON, MSGPACK)) -> str:
+    """The offered content type the client's Accept header prefers.
+
+    JSON if the client doesn't say, or accepts none of them.
+    """
+    return request.accept_mimetypes.best_match(offers, default=JSON)
+
+
+def encoded(data: bytes, mimetype: str) -> Response:
+    """A response already encoded in a negotiated content type"""
+    return Response(data, mimetype=mimetype, headers={"Vary": "Accept"})
+
+
+def negotiated(value: Any) -> Response:
+    """value as JSON, or MessagePack if the client prefers it"""
+    if preferred_encoding() == MSGPACK:
+        return encoded(packb(value), MSGPACK)
+
+    response = jsonify(value)
+    response.headers["Vary"] = "Accept"
+    return response
+
+
+def station_json(station: Station) -> Dict[str, Any]:
+    """JSON representation of a station"""
+    return {
+        "name": station.name,
+        "district": station.district,
+        "zones": station.zones,
+        "lines": station.lines
+    }
+
+
+def route_json(route: List[JourneySegment]) -> List[Dict[str, str]]:
+    """JSON representation of a route"""
+    return [
+        {
+            "start": segment.start,
+            "destination": segment.destination,
+            "line": segment.line
+        }
+        for segment in route
+    ]
+
+
+def pareto_json(routes: List[ParetoRoute]) -> List[Dict[str, Any]]:
+    """JSON representation of the trade-off between routes"""
+    return [
+        {
+            "cost": route.cost,
+            "interchanges": route.interchanges,
+            "zones": route.zones,
+            "route": route_json(route.journey)
+        }
+        for route in routes
+    ]
+
+
+def network_ndjson(model: Model) -> Iterator[str]:
+    """The whole model as newline-delimited JSON, a record at a time.
+
+    The first record describes the network, then come the stations, lines,
+    districts and zones, each with a "type".
+    """
+    yield json.dumps({
+        "type": "network",
+        "version": model.version(),
+        "stations": len(model.stations()),
+        "lines": len(model.lines()),
+        "districts": len(model.districts()),
+        "zones": len(model.zones())
+    }) + "\n"
+
+    for name in [*model.stations()]:
+        yield json.dumps(
+            {"type": "station", **station_json(model.station(name))}
+        ) + "\n"
+
+    for name in [*model.lines()]:
+        yield json.dumps({
+            "type": "line",
+            "name": name,
+            "stations": list(model.line(name).stations)
+        }) + "\n"
+
+    for name in [*model.districts()]:
+        yield json.dumps({
+            "type": "district",
+            "name": name,
+            "stations": list(model.district(name).stations)
+        }) + "\n"
+
+    for id in [*model.zones()]:
+        yield json.dumps({
+            "type": "zone",
+            "id": id,
+            "stations": list(model.zone(id).stations)
+        }) + "\n"
+
+
+def network_hash(model: Model) -> str:
+    """Hash of the model's network_ndjson, e.g. for an ETag.
+
+    Unlike the model version this is the same for the same network in any
+    process, and never the same for different ones.
+    """
+    digest = hashlib.sha256()
+    for record in network_ndjson(model):
+        digest.update(record.encode())
+    return digest.hexdigest()[:16]
+
+
+def gzip_stream(chunks: Iterable[str]) -> Iterator[bytes]:
+    """Gzip a stream of text as it is produced"""
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if data:
+            yield data
+
+    yield compressor.flush()
+
+
+# Number of distinct routes (including closures) to remember per app
+ROUTE_CACHE_SIZE = 4096
+
+# Number of results for the ranking endpoints when ?k= isn't given
+DEFAULT_TOP_K = 10
+
+# Number of results for /search when ?limit= isn't given
+DEFAULT_SEARCH_LIMIT = 10
+
+# Number of results for /nearest when ?k= isn't given
+DEFAULT_NEAREST_K = 5
+
+# Seconds a client is told to wait while /analytics/critical is worked out
+CENTRALITY_RETRY_AFTER = 5
+
+
+def timed_route_json(route: List[TimedJourneySegment]) \
+        -> List[Dict[str, str]]:
+    """JSON representation of a timetabled route"""
+    return [
+        {
+            "start": segment.start,
+            "destination": segment.destination,
+            "line": segment.line,
+            "departure": format_time(segment.departure),
+            "arrival": format_time(segment.arrival)
+        }
+        for segment in route
+    ]
+
+
+# Network names must be usable as a single path segment
+NETWORK_NAME = re.compile(r"[\w-]+")
+
+T = TypeVar("T")
+
+
+def per_version(model: Model, build: Callable[[Model], T]) \
+        -> Callable[[], T]:
+    """Getter for something built from the model, rebuilt when it changes"""
+    value: Optional[T] = None
+    version: Optional[int] = None
+
+    def get() -> T:
+        nonlocal value, version
+        if version != model.version():
+            value = build(model)
+            version = model.version()
+        return value
+
+    return get
+
+
+class SharedIndexes:
+    """Indexes depending only on names, shared between networks.
+
+    The search index, spatial index and name matcher only depend on the
+    names of the stations (and for the matcher, lines), so networks with
+    the same names, as variants of a network usually have, share one
+    rather than each building their own. Indexes no network uses any more
+    are dropped.
+    """
+
+    def __init__(self, locations: Optional[Dict[str, Tuple[float, float]]]):
+        self._locations = locations or {}
+        self._station_indexes = weakref.WeakValueDictionary()
+        self._mention_finders = weakref.WeakValueDictionary()
+        self._location_indexes = weakref.WeakValueDictionary()
+
+    def station_index(self, model: Model) -> StationIndex:
+        return self._shared(
+            self._station_indexes, frozenset(model.stations()),
+            lambda: StationIndex(model)
+        )
+
+    def mention_finder(self, model: Model) -> MentionFinder:
+        return self._shared(
+            self._mention_finders,
+            (frozenset(model.stations()), frozenset(model.lines())),
+            lambda: MentionFinder(model)
+        )
+
+    def location_index(self, model: Model) -> LocationIndex:
+        return self._shared(
+            self._location_indexes, frozenset(model.stations()),
+            lambda: LocationIndex(model, self._locations)
+        )
+
+    @staticmethod
+    def _shared(
+        indexes: MutableMapping[Hashable, T],
+        names: Hashable,
+        build: Callable[[], T]
+    ) -> T:
+        index = indexes.get(names)
+        if index is None:
+            index = indexes[names] = build()
+        return index
+
+
+def network_routes(
+    name: str,
+    model: Model,
+    timetable: Optional[Timetable],
+    locations: Optional[Dict[str, Tuple[float, float]]],
+    indexes: "SharedIndexes",
+    searched: Callable[[SearchStats], None]
+) -> Tuple[Blueprint, Callable]:
+    """The endpoints for querying one network, as a blueprint.
+
+    Returns the blueprint and its memoised route search (for its cache
+    statistics). searched is called with the statistics of each search.
+    """
+    routes = Blueprint(name, __name__)
+
+    @functools.lru_cache(maxsize=ROUTE_CACHE_SIZE)
+    def cached_route(start, destination, closures, version):
+        """Memoised shortest_route.
+
+        Keyed by the (hashable) closures so that normal service and
+        disrupted routes are cached side by side, and by the model version
+        so that entries from before a model change are never returned.
+        """
+        stats = SearchStats()
+        try:
+            return shortest_route(model, start, destination, closures, stats)
+        finally:
+            searched(stats)
+
+    # The search index, station and line name matcher and spatial index,
+    # up to date with the model. The first two are built up front so the
+    # first search doesn't pay for them.
+    station_index = per_version(model, indexes.station_index)
+    mention_finder = per_version(model, indexes.mention_finder)
+    station_locations = per_version(model, indexes.location_index)
+    station_index()
+    mention_finder()
+
+    # Names by id for ROUTE_IDS routes, with the version they carry
+    id_names = per_version(model, dictionary)
+
+    # The ETag of /network, worked out when first asked for
+    network_etag = per_version(model, network_hash)
+
+    def build_station_graph(model: Model) -> "StationGraph":
+        # Imported when first needed, as it brings in numpy
+        from .graph import StationGraph
+        return StationGraph(model)
+
+    # For mode=pareto routes, built when first asked for one
+    station_graph = per_version(model, build_station_graph)
+
+    # Counting every journey takes far too long to do in a request, so is
+    # done on a thread when first asked for, and again once the model
+    # changes. Only one count runs at a time: one for an older version
+    # finishes before the next is started.
+    centrality: Optional[Centrality] = None
+    counting: Optional[threading.Thread] = None
+    counting_lock = threading.Lock()
+
+    def count_journeys():
+        nonlocal centrality
+        centrality = betweenness_centrality(model)
+
+    def network_centrality() -> Optional[Centrality]:
+        """Betweenness centrality if up to date with the model.
+
+        If not, None, and it's worked out in the background.
+        """
+        nonlocal counting
+        scores = centrality
+        if scores is not None and scores.version == model.version():
+            return scores
+
+        with counting_lock:
+            if counting is None or not counting.is_alive():
+                counting = threading.Thread(target=count_journeys, daemon=True)
+                counting.start()
+        return None
+
+    def resolve_station(name: str) -> str:
+        """Correct a mistyped station name if there's an obvious match.
+
+        "@latitude,longitude" is the station nearest that point.
+        """
+        if name in model.stations():
+            return name
+
+        coordinates = parse_coordinates(name)
+        if coordinates is not None:
+            nearest = station_locations().nearest_stations(*coordinates)
+            return nearest[0][0] if nearest else name
+
+        return station_index().resolve(name) or name
+
+    @routes.route("/station/<station>")
     def station_info(station):
         try:
             station = model.station(station)
         except KeyError:
-            return make_error_response(f"No such station '{station}'")
+            return make_error_response(
+                f"No such station '{station}'", "unknown_station"
+            )
 
-        return jsonify({
-            "name": station.name,
-            "district": station.district,
-            "zones": station.zones,
-            "lines": station.lines
-        })
+        return negotiated(station_json(station))
 
-    @app.route("/station/<station>/interchanges")
+    @routes.route("/station/<station>/interchanges")
     def station_interchanges(station):
         try:
             station = model.station(station)
         except KeyError:
-            return make_error_response(f"No such station '{station}'")
+            return make_error_response(
+                f"No such station '{station}'", "unknown_station"
+            )
 
-        return jsonify(sorted(station.lines))
+        return negotiated(sorted(station.lines))
+
+    @routes.route("/search")
+    def search_stations():
+        query = request.args.get("q", "")
+        limit = request.args.get("limit", DEFAULT_SEARCH_LIMIT, type=int)
+        if limit < 0:
+            return make_error_response("Invalid limit", "bad_request")
+
+        return negotiated([
+            result.name for result in station_index().search(query, limit)
+        ])
 
-    @app.route("/line/<line>/list-stations")
+    @routes.route("/stations")
+    def filter_stations():
+        # e.g. ?q=line:Central AND line:Jubilee AND zone:1
+        try:
+            stations = model.select(parse_filter(request.args.get("q", "")))
+        except ValueError as e:
+            return make_error_response(str(e), "bad_request")
+
+        return negotiated(sorted(stations))
+
+    def point_argument() -> Tuple[float, float]:
+        """?lat= and ?lon= as a point, raising ValueError if invalid"""
+        if not locations:
+            raise ValueError("No station locations available")
+
+        latitude = request.args.get("lat", type=float)
+        longitude = request.args.get("lon", type=float)
+        # NB float() accepts "nan" and "inf"
+        if latitude is None or longitude is None or \
+                not (math.isfinite(latitude) and math.isfinite(longitude)) or \
+                not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+            raise ValueError("Invalid coordinates")
+
+        return (latitude, longitude)
+
+    @routes.route("/nearest")
+    def nearest_stations():
+        # e.g. ?lat=51.5226&lon=-0.1571&k=3
+        try:
+            point = point_argument()
+        except ValueError as e:
+            return make_error_response(str(e), "bad_request")
+
+        k = request.args.get("k", DEFAULT_NEAREST_K, type=int)
+
+        return negotiated([
+            {"name": name, "distance": round(distance)}
+            for (name, distance) in station_locations().nearest_stations(
+                *point, k
+            )
+        ])
+
+    @routes.route("/within")
+    def stations_within():
+        # e.g. ?lat=51.5226&lon=-0.1571&radius=800 (metres)
+        try:
+            point = point_argument()
+        except ValueError as e:
+            return make_error_response(str(e), "bad_request")
+
+        radius = request.args.get("radius", type=float)
+        if radius is None or not math.isfinite(radius) or radius < 0:
+            return make_error_response("Invalid radius", "bad_request")
+
+        return negotiated([
+            {"name": name, "distance": round(distance)}
+            for (name, distance) in station_locations().stations_within(
+                *point, radius
+            )
+        ])
+
+    @routes.route("/network")
+    def network():
+        # The whole network in one request, for mirroring. The ETag is a
+        # hash of the network, only worked out again when the model
+        # changes, so a mirror which is up to date gets a 304 without the
+        # network being serialised at all.
+        compress = request.accept_encodings["gzip"] > 0
+        etag = network_etag()
+        if compress:
+            etag += "-gzip"
+
+        if request.if_none_match.contains(etag):
+            return Response(status=304, headers={"ETag": f'"{etag}"'})
+
+        headers = {"ETag": f'"{etag}"', "Vary": "Accept-Encoding"}
+        records = network_ndjson(model)
+        if compress:
+            headers["Content-Encoding"] = "gzip"
+            records = gzip_stream(records)
+
+        return Response(
+            records, mimetype="application/x-ndjson", headers=headers
+        )
+
+    @routes.route("/dictionary")
+    def names_dictionary():
+        # Station and line names by id, for decoding ROUTE_IDS routes.
+        # The ETag is the dictionary's version, a hash of the names, so
+        # only changes when they do and is the same from any server.
+        names = id_names()
+        etag = names["version"]
+        if request.if_none_match.contains(etag):
+            return Response(status=304, headers={"ETag": f'"{etag}"'})
+
+        response = negotiated(names)
+        response.headers["ETag"] = f'"{etag}"'
+        return response
+
+    @routes.route("/line/<line>/list-stations")
     def line_stations(line):
         try:
             line = model.line(line)
         except KeyError:
-            return make_error_response(f"No such line '{line}'")
+            return make_error_response(
+                f"No such line '{line}'", "unknown_line"
+            )
+
+        return negotiated(sorted(line.stations))
+
+    @routes.route("/top/interchanges")
+    def ranked_interchanges():
+        k = request.args.get("k", DEFAULT_TOP_K, type=int)
+
+        return negotiated([
+            {"name": station, "lines": count}
+            for (station, count) in top_interchanges(model, k)
+        ])
+
+    @routes.route("/top/lines")
+    def ranked_lines():
+        k = request.args.get("k", DEFAULT_TOP_K, type=int)
+
+        return negotiated([
+            {"name": line, "stations": count}
+            for (line, count) in longest_lines(model, k)
+        ])
+
+    @routes.route("/analytics/critical")
+    def critical():
+        # The stations and lines the most cheapest journeys rely on
+        k = request.args.get("k", DEFAULT_TOP_K, type=int)
+        scores = network_centrality()
+        if scores is None:
+            response = make_error_response(
+                "Still counting journeys, try again later", "unavailable", 503
+            )
+            response.headers["Retry-After"] = str(CENTRALITY_RETRY_AFTER)
+            return response
+
+        return negotiated({
+            "stations": [
+                {"name": station, "journeys": round(score, 1)}
+                for (station, score) in scores.top_stations(k)
+            ],
+            "lines": [
+                {"name": line, "journeys": round(score, 1)}
+                for (line, score) in scores.top_lines(k)
+            ]
+        })
 
-        return jsonify(sorted(line.stations))
+    def closures_argument() -> Closures:
+        """Optional closures, e.g. ?closed_station=Bank&closed_line=Central
 
-    @app.route("/route/<start>/<destination>")
+        Raises ValueError if a closed line does not exist.
+        """
+        closures = Closures(
+            stations=request.args.getlist("closed_station"),
+            lines=request.args.getlist("closed_line")
+        )
+
+        for line in closures.lines:
+            if line not in model.lines():
+                raise ValueError(f"No such line '{line}'")
+
+        return closures
+
+    @routes.route("/route/<start>/<destination>")
     def route(start, destination):
         try:
-            route = shortest_route(model, start, destination)
+            closures = closures_argument()
+        except ValueError as e:
+            return make_error_response(str(e), "unknown_line")
+
+        mode = request.args.get("mode")
+        if mode not in (None, "pareto"):
+            return make_error_response(f"Invalid mode '{mode}'", "bad_request")
+
+        start = resolve_station(start)
+        destination = resolve_station(destination)
+
+        if "depart" in request.args:
+            if mode == "pareto":
+                return make_error_response(
+                    "mode=pareto can't be used with depart", "bad_request"
+                )
+            return timed_route(start, destination, closures)
+
+        if mode == "pareto":
+            return pareto_route(start, destination, closures)
+
+        try:
+            route = cached_route(start, destination, closures, model.version())
         except KeyError as e:
             # NB when converting KeyError to string it will
             # include the quotes, e.g. str(e) -> "'Acton Town'"
             station = str(e)
-            return make_error_response(f"No such station {station}")
-
-        return jsonify([
-            {
-                "start": segment.start,
-                "destination": segment.destination,
-                "line": segment.line
-            }
-            for segment in route
-        ])
+            return make_error_response(
+                f"No such station {station}", "unknown_station"
+            )
+        except ValueError as e:
+            return make_error_response(
+                str(e), route_error_kind(closures, start, destination)
+            )
+
+        # Straight to MessagePack, without the dicts of route_json
+        encoding = preferred_encoding((JSON, MSGPACK, ROUTE_IDS))
+        if encoding == ROUTE_IDS:
+            return encoded(
+                pack_route_ids(model, route, id_names()["version"]),
+                ROUTE_IDS
+            )
+        if encoding == MSGPACK:
+            return encoded(pack_route(route), MSGPACK)
+        return negotiated(route_json(route))
+
+    def pareto_route(start, destination, closures):
+        """Trade-off between routes for /route?mode=pareto"""
+        try:
+            routes = pareto_routes(
+                model, start, destination, closures, station_graph()
+            )
+        except KeyError as e:
+            return make_error_response(
+                f"No such station {e}", "unknown_station"
+            )
+        except ValueError as e:
+            return make_error_response(
+                str(e), route_error_kind(closures, start, destination)
+            )
+
+        return negotiated(pareto_json(routes))
+
+    def timed_route(start, destination, closures):
+        """Earliest arrival route for /route?depart=HH:MM"""
+        if timetable is None:
+            return make_error_response("No timetable available", "bad_request")
+
+        try:
+            departure = parse_time(request.args["depart"])
+        except ValueError as e:
+            return make_error_response(str(e), "bad_request")
+
+        for station in (start, destination):
+            if station not in model.stations():
+                return make_error_response(
+                    f"No such station '{station}'", "unknown_station"
+                )
+            if station not in timetable.nodes:
+                return make_error_response(
+                    f"No timetabled trains at '{station}'", "unknown_station"
+                )
+
+        try:
+            route = timetable.earliest_arrival(
+                start, destination, departure, closures
+            )
+        except ValueError as e:
+            return make_error_response(
+                str(e), route_error_kind(closures, start, destination)
+            )
+
+        return negotiated(timed_route_json(route))
+
+    @routes.route("/reachable/<station>")
+    def reachable_stations(station):
+        # e.g. ?budget=6&interchanges=1, plus &from=Bank for more origins
+        try:
+            closures = closures_argument()
+        except ValueError as e:
+            return make_error_response(str(e), "unknown_line")
+
+        budget = request.args.get("budget", type=float)
+        if "budget" in request.args and budget is None:
+            return make_error_response("Invalid budget", "bad_request")
+
+        interchanges = request.args.get("interchanges", type=int)
+        if "interchanges" in request.args and interchanges is None:
+            return make_error_response("Invalid interchanges", "bad_request")
+
+        origins = [
+            resolve_station(name)
+            for name in [station, *request.args.getlist("from")]
+        ]
+
+        try:
+            reach = reachable(model, origins, budget, interchanges, closures)
+        except KeyError as e:
+            return make_error_response(
+                f"No such station {e}", "unknown_station"
+            )
+        except ValueError as e:
+            return make_error_response(str(e), "closed_station")
+
+        # Parallel arrays rather than an object per station, as there can
+        # be hundreds of them. Origins are indexes into "from".
+        return negotiated({
+            "from": origins,
+            "stations": [*reach],
+            "costs": [r.cost for r in reach.values()],
+            "interchanges": [r.interchanges for r in reach.values()],
+            "origins": [origins.index(r.origin) for r in reach.values()]
+        })
+
+    @routes.route("/ask")
+    def ask():
+        # e.g. ?q=How do I get from Marylebone to Holborn?
+        try:
+            question = interpret(mention_finder(), request.args.get("q", ""))
+        except ValueError as e:
+            return make_error_response(str(e), "bad_request")
+
+        if question.kind == "route":
+            (start, destination) = question.names
+            try:
+                answer = route_json(cached_route(
+                    start, destination, NO_CLOSURES, model.version()
+                ))
+            except ValueError as e:
+                return make_error_response(str(e), "unreachable")
+        elif question.kind == "station":
+            answer = station_json(model.station(question.names[0]))
+        else:
+            answer = sorted(model.line(question.names[0]).stations)
+
+        return negotiated({
+            "kind": question.kind,
+            "names": question.names,
+            "answer": answer
+        })
+
+    return (routes, cached_route)
+
+
+def make_app(
+    model: Model,
+    timetable: Optional[Timetable]=None,
+    locations: Optional[Dict[str, Tuple[float, float]]]=None,
+    networks: Optional[Dict[str, Model]]=None
+) -> Flask:
+    """Create a flask application for the provided model.
+
+    If a timetable is provided then routes can be planned for a departure
+    time, e.g. /route/Bank/Oval?depart=08:30
+
+    /route/Bank/Oval?mode=pareto gives the trade-off between cost, changes
+    and zones crossed instead: every route no other beats on all three.
+
+    If station locations (see geo.load_locations) are provided then the
+    nearest stations to a point can be found, and routes can start or end
+    at coordinates, e.g. /route/@51.5226,-0.1571/Oval
+
+    Further networks, e.g. other cities or variants of this one made with
+    Model.copy (weekend service, engineering works), can be hosted by the
+    same app, each with the same endpoints under /net/<name>/, e.g.
+    /net/weekend/route/Bank/Oval. Indexes depending only on names are
+    shared between networks with the same stations, and names are
+    interned by the model. A variant shares everything it doesn't change
+    with the model it was copied from, so costs memory for its changes,
+    not for the whole network.
+
+    Responses are JSON unless the Accept header prefers MessagePack
+    (encoding.MSGPACK), or for routes the smaller ID-based form
+    (encoding.ROUTE_IDS) decoded with the names from /dictionary. Errors
+    are always JSON.
+
+    Raises ValueError if a network name isn't a single path segment.
+    """
+    networks = networks or {}
+    for name in networks:
+        if not NETWORK_NAME.fullmatch(name):
+            raise ValueError(f"Invalid network name '{name}'")
+
+    app = Flask(
+        __name__,
+        template_folder=FRONTEND_DIST_DIR,
+        static_folder=FRONTEND_DIST_DIR,
+        static_url_path=""
+    )
+
+    # Allow cross-origin requests
+    CORS(app)
+
+    metrics = Registry()
+    requests_total = metrics.counter(
+        "underground_requests_total",
+        "Requests handled, by route and status",
+        ("route", "status")
+    )
+    request_seconds = metrics.histogram(
+        "underground_request_duration_seconds",
+        "Time taken to handle requests, by route",
+        labels=("route",)
+    )
+    errors_total = metrics.counter(
+        "underground_errors_total",
+        "Error responses, by kind of error",
+        ("kind",)
+    )
+    searches_total = metrics.counter(
+        "underground_route_searches_total",
+        "shortest_route searches run (i.e. route cache misses)"
+    )
+    lines_expanded_total = metrics.counter(
+        "underground_route_lines_expanded_total",
+        "Lines expanded by shortest_route searches"
+    )
+    stations_relaxed_total = metrics.counter(
+        "underground_route_stations_relaxed_total",
+        "Station costs improved by shortest_route searches"
+    )
+
+    @app.before_request
+    def start_timer():
+        g.start_time = time.perf_counter()
+
+    @app.after_request
+    def record_request(response: Response) -> Response:
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        requests_total.inc(route, str(response.status_code))
+
+        if "start_time" in g:
+            request_seconds.observe(time.perf_counter() - g.start_time, route)
+
+        if response.status_code >= 400:
+            if "error_kind" in g:
+                errors_total.inc(g.error_kind)
+            else:
+                errors_total.inc(f"http_{response.status_code}")
+
+        return response
+
+    def searched(stats: SearchStats):
+        searches_total.inc()
+        lines_expanded_total.inc(amount=stats.lines_expanded)
+        stations_relaxed_total.inc(amount=stats.stations_relaxed)
+
+    indexes = SharedIndexes(locations)
+    (routes, cached_route) = network_routes(
+        "network", model, timetable, locations, indexes, searched
+    )
+    app.register_blueprint(routes)
+    route_caches = [cached_route]
+
+    for (name, network) in networks.items():
+        (routes, cached_route) = network_routes(
+            f"net_{name}", network, None, locations, indexes, searched
+        )
+        app.register_blueprint(routes, url_prefix=f"/net/{name}")
+        route_caches.append(cached_route)
+
+    metrics.gauge(
+        "underground_route_cache_hits",
+        "Routes answered from the route caches",
+        lambda: sum(cache.cache_info().hits for cache in route_caches)
+    )
+    metrics.gauge(
+        "underground_route_cache_size",
+        "Routes in the route caches",
+        lambda: sum(cache.cache_info().currsize for cache in route_caches)
+    )
+
+    @app.route("/")
+    def frontpage():
+        return render_template("index.html")
+
+    @app.route("/metrics")
+    def metrics_page():
+        return Response(
+            metrics.render(), content_type="text/plain; version=0.0.4"
+        )
+
+    @app.route("/net")
+    def list_networks():
+        return negotiated(sorted(networks))
 
     return app
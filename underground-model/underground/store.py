@@ -0,0 +1,1263 @@
+"""A general typed property graph, with columnar storage.
+
+The graph holds nodes, each with a label (e.g. "Station") and a unique
+key (e.g. the station's name), and typed relationships between them (e.g.
+"ON_LINE" from a station to a line). The Model is a façade over one of
+these; anything beyond its fixed structure (step-free access, platform
+counts, operators...) can be added as properties without code changes:
+
+    stations = model.graph().nodes("Station")
+    stations.add_property("step_free", bool)
+    stations.set("Bank", "step_free", True)
+    stations.where("step_free", True)   # bitset of station ids
+
+Each label's nodes live in a NodeTable:
+
+  - Nodes get dense integer ids in the order they're added, never reused;
+    removing a node leaves a hole
+  - Each property is a column: typed arrays indexed by id, with strings
+    stored as codes into a table of distinct (interned) values. Scanning
+    a property is a pass over contiguous arrays, done with numpy
+  - A declared index maps each value of a property to a bitset of ids
+    (a Python int, bit n set => node n), so an equality filter is a
+    dictionary lookup
+
+Each relationship type lives in a RelationshipTable, as a list of the
+neighbours' keys per node in each direction, in the order the
+relationships were added, so following them from a node costs a
+dictionary lookup. For scans over every relationship, csr() compacts them
+into compressed sparse row arrays of ids, kept until the next change.
+Likewise bitsets of the sources related to each target are made on first
+use after a change. Indexes of the nodes by degree are kept up to date as
+relationships change.
+
+A copy of a graph (e.g. a variant of a network) shares all of this with
+the original until one of them changes it. The first change puts the
+changed table's dicts behind Overlays, which hold only the entries
+changed since. Lists are copied as they're changed, and the long ones (a
+target's sources, e.g. a zone's stations, and property columns) are held
+in chunks so that only the chunks changed are. So a copy costs memory
+for what it changes rather than for the whole graph.
+"""
+
+from typing import *
+
+from array import array
+import collections.abc
+import itertools
+import sys
+
+
+class Overlay(dict):
+    """Changes to a dict which is shared with a copy, reading through.
+
+    The shared dict (the base) is never changed again, so each copy can
+    have its own overlay over it. The overlay's own items are those set
+    since it was made, and keys removed since are remembered so as not to
+    be read through. Iteration gives the base's keys, less those removed,
+    then those added.
+
+    Only what the store needs is supported: [], get, in, del, len,
+    iteration, keys(), values() and items().
+    """
+
+    __slots__ = ("base", "depth", "_removed", "_len")
+
+    def __init__(self, base: dict):
+        super().__init__()
+        self.base = base
+        self.depth = base.depth + 1 if isinstance(base, Overlay) else 1
+        self._removed: Set[Hashable] = set()
+        self._len = len(base)
+
+    def __missing__(self, key: Hashable) -> Any:
+        if key in self._removed:
+            raise KeyError(key)
+        return self.base[key]
+
+    def __contains__(self, key: Hashable) -> bool:
+        if dict.__contains__(self, key):
+            return True
+        return key not in self._removed and key in self.base
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __iter__(self) -> Iterator:
+        # Removed keys stay in _removed if added again, so come last
+        removed = self._removed
+        for key in self.base:
+            if key not in removed:
+                yield key
+        for key in dict.__iter__(self):
+            if key in removed or key not in self.base:
+                yield key
+
+    def __setitem__(self, key: Hashable, value: Any):
+        if key not in self:
+            self._len += 1
+        dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key: Hashable):
+        if key not in self:
+            raise KeyError(key)
+        dict.pop(self, key, None)
+        if key in self.base:
+            self._removed.add(key)
+        self._len -= 1
+
+    def __reduce__(self):
+        # Pickled as the dict it stands for
+        return (dict, (dict(self.items()),))
+
+    def get(self, key: Hashable, default: Any=None) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self) -> KeysView:
+        return collections.abc.KeysView(self)
+
+    def values(self) -> ValuesView:
+        return collections.abc.ValuesView(self)
+
+    def items(self) -> ItemsView:
+        return collections.abc.ItemsView(self)
+
+
+# Overlays over overlays deeper than this are flattened into a dict, so
+# reading through them stays cheap
+MAX_OVERLAY_DEPTH = 4
+
+
+def overlay(shared: dict) -> Overlay:
+    """An Overlay to make changes in, over a dict shared with a copy"""
+    if isinstance(shared, Overlay) and shared.depth >= MAX_OVERLAY_DEPTH:
+        shared = dict(shared.items())
+    return Overlay(shared)
+
+
+# Items in each chunk of a ChunkedList
+LIST_CHUNK_SIZE = 64
+
+
+class ChunkedList(collections.abc.Sequence):
+    """A list held in chunks, which copies of it share until changed.
+
+    Once copied, a list is not changed again, so the copy can share its
+    chunks and copy only those it changes. Appends fill the last chunk
+    and start a new one when it's full; removals leave their chunk short.
+
+    Compares equal to a list with the same items.
+    """
+
+    __slots__ = ("_chunks", "_owned", "_len")
+
+    def __init__(self, items: Iterable=()):
+        self._chunks: List[list] = []
+        # Whether each chunk is ours to change, rather than shared
+        self._owned: List[bool] = []
+        self._len = 0
+        for item in items:
+            self.append(item)
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __iter__(self) -> Iterator:
+        return itertools.chain.from_iterable(self._chunks)
+
+    def __contains__(self, item: Any) -> bool:
+        return any(item in chunk for chunk in self._chunks)
+
+    def __getitem__(self, index: Union[int, slice]) -> Any:
+        if isinstance(index, slice):
+            return [*self][index]
+
+        if index < 0:
+            index += self._len
+        if 0 <= index < self._len:
+            for chunk in self._chunks:
+                if index < len(chunk):
+                    return chunk[index]
+                index -= len(chunk)
+        raise IndexError("ChunkedList index out of range")
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, (ChunkedList, list)):
+            return len(self) == len(other) and [*self] == [*other]
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return f"ChunkedList({[*self]!r})"
+
+    def __reduce__(self):
+        return (ChunkedList, ([*self],))
+
+    def append(self, item: Any):
+        chunks = self._chunks
+        if not chunks or len(chunks[-1]) >= LIST_CHUNK_SIZE:
+            chunks.append([item])
+            self._owned.append(True)
+        elif self._owned[-1]:
+            chunks[-1].append(item)
+        else:
+            self._writable(len(chunks) - 1).append(item)
+        self._len += 1
+
+    def remove(self, item: Any):
+        """Remove the first occurrence of an item.
+
+        Raises ValueError if it isn't present.
+        """
+        for (i, chunk) in enumerate(self._chunks):
+            if item in chunk:
+                break
+        else:
+            raise ValueError(f"{item!r} not in list")
+
+        if len(chunk) == 1:
+            del self._chunks[i]
+            del self._owned[i]
+        else:
+            self._writable(i).remove(item)
+        self._len -= 1
+
+    def copy(self) -> "ChunkedList":
+        """A copy sharing the chunks, after which this one isn't changed"""
+        copy = ChunkedList()
+        copy._chunks = [*self._chunks]
+        copy._owned = [False] * len(self._chunks)
+        copy._len = self._len
+        return copy
+
+    def _writable(self, i: int) -> list:
+        """Chunk i, copied first if it's shared"""
+        if not self._owned[i]:
+            self._chunks[i] = [*self._chunks[i]]
+            self._owned[i] = True
+        return self._chunks[i]
+
+
+class CountIndex:
+    """Names bucketed by an integer count, maintained incrementally.
+
+    Used to answer "which has the most?" questions without scanning the
+    whole model. Within a bucket names are reported in the order given
+    by the sort key (the model uses ids, i.e. the order things were added).
+    """
+
+    # Count -> names with it, as the keys of a dict
+    _buckets: Dict[int, Dict[str, None]]
+    _counts: Dict[str, int]
+    _max: int
+    _key: Callable[[str], int]
+
+    # Whether _buckets and _counts are shared with a copy, and if the
+    # buckets in them may be, the counts whose buckets are ours to change
+    _shared: bool
+    _owned: Optional[Set[int]]
+
+    def __init__(self, key: Callable[[str], int]):
+        """Initialise empty index, ordering names within a bucket by key"""
+        self._buckets = {}
+        self._counts = {}
+        self._max = -1
+        self._key = key
+        self._shared = False
+        self._owned = None
+
+    def __len__(self) -> int:
+        return len(self._counts)
+
+    def count(self, name: str) -> int:
+        """The count recorded for a name.
+
+        Raises KeyError if the name is not in the index.
+        """
+        return self._counts[name]
+
+    def set(self, name: str, count: int):
+        """Record the count for a name, adding it if necessary"""
+        if self._shared:
+            self._unshare()
+
+        if name in self._counts:
+            self._discard(name)
+        self._counts[name] = count
+
+        bucket = self._buckets.get(count)
+        if bucket is None or self._owned is not None:
+            bucket = self._writable_bucket(count)
+        bucket[name] = None
+
+        if count > self._max:
+            self._max = count
+
+    def remove(self, name: str):
+        """Remove a name from the index.
+
+        Raises KeyError if the name is not in the index.
+        """
+        if self._shared:
+            self._unshare()
+
+        self._discard(name)
+        del self._counts[name]
+
+    def max(self) -> Tuple[int, List[str]]:
+        """The highest count and all the names which have it.
+
+        Raises ValueError if the index is empty.
+        """
+        if not self._counts:
+            raise ValueError("Index is empty")
+
+        return (self._max, sorted(self._buckets[self._max], key=self._key))
+
+    def top(self, k: int) -> List[Tuple[str, int]]:
+        """Up to k (name, count) pairs with the highest counts, highest first.
+
+        Ties are broken by the sort key.
+        """
+        result = []
+        count = self._max
+
+        while len(result) < k and count >= 0:
+            if count in self._buckets:
+                result.extend(
+                    (name, count)
+                    for name in sorted(self._buckets[count], key=self._key)
+                )
+            count -= 1
+
+        return result[:k]
+
+    def copy(self, key: Callable[[str], int]) -> "CountIndex":
+        """A copy of the index, ordering names within a bucket by key.
+
+        The two share their buckets until either changes them.
+        """
+        copy = CountIndex(key)
+        copy._buckets = self._buckets
+        copy._counts = self._counts
+        copy._max = self._max
+
+        for index in (self, copy):
+            index._shared = True
+            index._owned = set()
+
+        return copy
+
+    def _unshare(self):
+        self._buckets = overlay(self._buckets)
+        self._counts = overlay(self._counts)
+        self._shared = False
+
+    def _writable_bucket(self, count: int) -> Dict[str, None]:
+        """The bucket for a count, made or overlaid first if need be"""
+        bucket = self._buckets.get(count)
+        if bucket is not None and (
+            self._owned is None or count in self._owned
+        ):
+            return bucket
+
+        bucket = {} if bucket is None else overlay(bucket)
+        self._buckets[count] = bucket
+        if self._owned is not None:
+            self._owned.add(count)
+        return bucket
+
+    def _discard(self, name: str):
+        """Take a name out of its bucket, keeping track of the max"""
+        count = self._counts[name]
+
+        bucket = self._buckets[count]
+        if self._owned is not None:
+            bucket = self._writable_bucket(count)
+        del bucket[name]
+        if not bucket:
+            del self._buckets[count]
+
+            # Counts are small so walking down to the next bucket is cheap
+            while self._max >= 0 and self._max not in self._buckets:
+                self._max -= 1
+
+
+#
+# Property columns
+#
+
+# Values in each chunk of a column, as a power of two. Copies of a column
+# share its chunks until they change a value in one.
+CHUNK_BITS = 10
+CHUNK_SIZE = 1 << CHUNK_BITS
+
+
+class Column:
+    """The values of one property, in typed arrays indexed by node id.
+
+    The values are held CHUNK_SIZE to an array, so that copies of the
+    column can share the chunks neither has changed.
+    """
+
+    type: type
+    """The Python type of the values"""
+
+    typecode = "q"
+    dtype = "int64"
+    default: Any = 0
+
+    _chunks: List[array]
+    _size: int
+
+    # None until the column is copied, then the chunks which have been
+    # copied since and are ours to change
+    _owned: Optional[Set[int]]
+
+    def __init__(self, size: int):
+        """Initialise a column of size default values"""
+        fill = array(self.typecode, [self._encode(self.default)])
+        (full, rest) = divmod(size, CHUNK_SIZE)
+        self._chunks = [fill * CHUNK_SIZE for _ in range(full)]
+        if rest:
+            self._chunks.append(fill * rest)
+        self._size = size
+        self._owned = None
+
+    def __len__(self) -> int:
+        return self._size
+
+    def grow(self):
+        """Add a default value for a new node"""
+        (chunk, offset) = divmod(self._size, CHUNK_SIZE)
+        if offset == 0:
+            self._chunks.append(array(self.typecode))
+            if self._owned is not None:
+                self._owned.add(chunk)
+
+        self._writable(chunk).append(self._encode(self.default))
+        self._size += 1
+
+    def get(self, id: int) -> Any:
+        return self._decode(
+            self._chunks[id >> CHUNK_BITS][id & (CHUNK_SIZE - 1)]
+        )
+
+    def set(self, id: int, value: Any):
+        self._writable(id >> CHUNK_BITS)[id & (CHUNK_SIZE - 1)] = \
+            self._encode(value)
+
+    def parse(self, text: str) -> Any:
+        """Convert the text form of a value, e.g. from a query string"""
+        return self.type(text)
+
+    def copy(self) -> "Column":
+        """A copy of the column to change independently.
+
+        The two share their chunks until either changes them.
+        """
+        copy = object.__new__(type(self))
+        copy.__dict__.update(self.__dict__)
+        copy._chunks = [*self._chunks]
+        self._owned = set()
+        copy._owned = set()
+        return copy
+
+    def array(self, np):
+        """The encoded values as one numpy array, to scan"""
+        if not self._chunks:
+            return np.zeros(0, self.dtype)
+        return np.concatenate([
+            np.frombuffer(chunk, self.dtype) for chunk in self._chunks
+        ])
+
+    def equal(self, np, value: Any):
+        """Boolean numpy mask of the ids with the value"""
+        return self.array(np) == self._encode(value)
+
+    def _writable(self, chunk: int) -> array:
+        """A chunk of the values, copied first if shared with a copy"""
+        if self._owned is not None and chunk not in self._owned:
+            self._chunks[chunk] = self._chunks[chunk][:]
+            self._owned.add(chunk)
+        return self._chunks[chunk]
+
+    def _encode(self, value: Any) -> Any:
+        return value
+
+    def _decode(self, value: Any) -> Any:
+        return value
+
+
+class IntColumn(Column):
+    type = int
+
+
+class FloatColumn(Column):
+    type = float
+    typecode = "d"
+    dtype = "float64"
+    default = float("nan")
+
+
+class BoolColumn(Column):
+    type = bool
+    typecode = "b"
+    dtype = "int8"
+    default = False
+
+    def parse(self, text: str) -> bool:
+        if text.lower() in ("true", "yes", "1"):
+            return True
+        if text.lower() in ("false", "no", "0"):
+            return False
+        raise ValueError(f"Invalid boolean '{text}'")
+
+    def _encode(self, value: bool) -> int:
+        return int(bool(value))
+
+    def _decode(self, value: int) -> bool:
+        return bool(value)
+
+
+class StringColumn(Column):
+    """Strings (or None) as codes into a table of distinct values.
+
+    Each distinct value is stored (and interned) once, however many nodes
+    have it, and comparing codes is far quicker than comparing strings.
+    Values are only ever added to the table, so copies of the column
+    share it, each using the codes it needs.
+    """
+
+    type = str
+    default = None
+
+    def __init__(self, size: int):
+        self.values: List[str] = []
+        self.codes: Dict[str, int] = {}
+        super().__init__(size)
+
+    def equal(self, np, value: Optional[str]):
+        if value is not None and value not in self.codes:
+            return np.zeros(self._size, dtype=bool)
+        return super().equal(np, value)
+
+    def _encode(self, value: Optional[str]) -> int:
+        if value is None:
+            return -1
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(sys.intern(value))
+        return code
+
+    def _decode(self, code: int) -> Optional[str]:
+        return None if code < 0 else self.values[code]
+
+
+# Property type -> column storing it
+COLUMN_TYPES = {
+    int: IntColumn,
+    float: FloatColumn,
+    bool: BoolColumn,
+    str: StringColumn,
+}
+
+
+def _mask_to_bits(np, mask) -> int:
+    """Convert a boolean numpy mask to a bitset"""
+    padded = np.zeros((len(mask) + 7) // 8 * 8, dtype=bool)
+    padded[:len(mask)] = mask
+    # packbits puts the first element in the high bit of each byte, so
+    # reverse each group of 8 to get bit n for element n
+    packed = np.packbits(padded.reshape(-1, 8)[:, ::-1])
+    return int.from_bytes(packed.tobytes(), "little")
+
+
+def _ids_to_bits(ids: Iterable[int], bound: int) -> int:
+    """Make a bitset of ids, all less than bound"""
+    # Written as a binary string, which int() reads in linear time, rather
+    # than or-ing in a bit at a time, each of which copies the whole int
+    digits = bytearray(b"0" * bound)
+    for id in ids:
+        digits[bound - 1 - id] = ord("1")
+    return int(digits, 2) if digits else 0
+
+
+#
+# Nodes and relationships
+#
+
+class NodeTable:
+    """The nodes with one label, and their properties"""
+
+    label: str
+    """The label of the nodes"""
+
+    _ids: Dict[Hashable, int]
+    _keys: Dict[int, Hashable]
+    _bound: int
+    _columns: Dict[str, Column]
+    _indexes: Dict[str, Dict[Any, int]]
+    _relationships: List["RelationshipTable"]
+    _changed: Callable[[], None]
+
+    # Bitset of all the ids, made on first use after a change
+    _bits: Optional[int]
+
+    # Whether _ids, _keys and the indexes are shared with a copy, so must
+    # be overlaid before they're changed
+    _shared: bool
+
+    def __init__(self, label: str, changed: Callable[[], None]=lambda: None):
+        """Initialise empty table, calling changed on every change"""
+        self.label = label
+        self._ids = {}
+        self._keys = {}
+        self._bound = 0
+        self._columns = {}
+        self._indexes = {}
+        self._relationships = []
+        self._changed = changed
+        self._bits = 0
+        self._shared = False
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._ids
+
+    def keys(self) -> KeysView:
+        """The keys of the nodes, in the order they were added"""
+        return self._ids.keys()
+
+    def id(self, key: Hashable) -> int:
+        """The id of a node.
+
+        Raises KeyError if there is no node with the key.
+        """
+        return self._ids[key]
+
+    def key(self, id: int) -> Hashable:
+        """The key of the node with an id.
+
+        Raises KeyError if there is no node with the id.
+        """
+        return self._keys[id]
+
+    def id_bound(self) -> int:
+        """One more than the largest id handed out so far"""
+        return self._bound
+
+    def bits(self) -> int:
+        """Bitset of the ids of all the nodes"""
+        if self._bits is None:
+            self._bits = _ids_to_bits(self._ids.values(), self._bound)
+        return self._bits
+
+    def keys_from_bits(self, bits: int) -> List[Hashable]:
+        """The keys of the nodes in a bitset, in id order"""
+        keys = []
+        table = self._keys
+
+        # Scanning the binary string finds set bits at C speed, which
+        # beats repeatedly shifting and masking a large int
+        digits = bin(bits)[:1:-1]
+        id = digits.find("1")
+        while id >= 0:
+            keys.append(table[id])
+            id = digits.find("1", id + 1)
+
+        return keys
+
+    def add(self, key: Hashable) -> int:
+        """Add a node, returning its id.
+
+        Its properties start with their defaults (0, NaN, False or None).
+
+        Raises ValueError if there is already a node with the key.
+        """
+        if key in self._ids:
+            raise ValueError(f"{self.label} {key} already exists")
+        if self._shared:
+            self._unshare()
+
+        # Interned so that graphs with the same names (e.g. variants of a
+        # network) share one copy of each
+        if isinstance(key, str):
+            key = sys.intern(key)
+
+        id = self._bound
+        self._bound += 1
+        self._ids[key] = id
+        self._keys[id] = key
+        self._bits = None
+
+        for (name, column) in self._columns.items():
+            column.grow()
+            if name in self._indexes:
+                self._index_add(name, column.default, id)
+
+        for relationships in self._relationships:
+            relationships._node_added(self, key)
+
+        self._changed()
+        return id
+
+    def remove(self, key: Hashable):
+        """Remove a node, along with all its relationships.
+
+        Raises KeyError if there is no node with the key.
+        """
+        id = self._ids[key]
+        if self._shared:
+            self._unshare()
+
+        for relationships in self._relationships:
+            relationships._node_removed(self, key)
+
+        for name in self._indexes:
+            self._index_discard(name, self._columns[name].get(id), id)
+
+        del self._ids[key]
+        del self._keys[id]
+        self._bits = None
+        self._changed()
+
+    #
+    # Properties
+    #
+
+    def add_property(self, name: str, type: type):
+        """Add a property of a type (int, float, bool or str) to every node.
+
+        Raises ValueError if the property exists or the type isn't one of
+        those supported.
+        """
+        if name in self._columns:
+            raise ValueError(f"{self.label} already has property {name}")
+        if type not in COLUMN_TYPES:
+            raise ValueError(f"Unsupported property type {type.__name__}")
+
+        self._columns[name] = COLUMN_TYPES[type](self._bound)
+        self._changed()
+
+    def properties(self) -> Dict[str, type]:
+        """Property name -> type"""
+        return {name: column.type for (name, column) in self._columns.items()}
+
+    def get(self, key: Hashable, name: str) -> Any:
+        """The value of a property of a node.
+
+        Raises KeyError if the node or property doesn't exist.
+        """
+        return self._columns[name].get(self._ids[key])
+
+    def set(self, key: Hashable, name: str, value: Any):
+        """Set a property of a node.
+
+        Raises KeyError if the node or property doesn't exist.
+        """
+        id = self._ids[key]
+        column = self._columns[name]
+
+        if name in self._indexes:
+            if self._shared:
+                self._unshare()
+            self._index_discard(name, column.get(id), id)
+            column.set(id, value)
+            self._index_add(name, column.get(id), id)
+        else:
+            column.set(id, value)
+
+        self._changed()
+
+    def parse(self, name: str, text: str) -> Any:
+        """Convert the text form of a value of a property.
+
+        Raises KeyError if the property doesn't exist, ValueError if the
+        text isn't a valid value.
+        """
+        return self._columns[name].parse(text)
+
+    def create_index(self, name: str):
+        """Index a property, making where() on it a lookup.
+
+        Raises KeyError if the property doesn't exist.
+        """
+        column = self._columns[name]
+        self._indexes[name] = {}
+        for id in self._ids.values():
+            self._index_add(name, column.get(id), id)
+
+    def indexed(self, name: str) -> bool:
+        """True if the property has an index"""
+        return name in self._indexes
+
+    def where(self, name: str, value: Any) -> int:
+        """Bitset of the ids of the nodes whose property has the value.
+
+        Raises KeyError if the property doesn't exist.
+        """
+        column = self._columns[name]
+
+        if name in self._indexes:
+            return self._indexes[name].get(value, 0)
+
+        import numpy as np
+        return _mask_to_bits(np, column.equal(np, value)) & self.bits()
+
+    def between(self, name: str, low: float, high: float) -> int:
+        """Bitset of the ids of the nodes with low <= property <= high.
+
+        Only for int and float properties.
+
+        Raises KeyError if the property doesn't exist.
+        """
+        column = self._columns[name]
+        if column.type not in (int, float):
+            raise ValueError(f"{name} is not a numeric property")
+
+        import numpy as np
+        data = column.array(np)
+        bits = _mask_to_bits(np, (data >= low) & (data <= high))
+        return bits & self.bits()
+
+    def _copy(self, changed: Callable[[], None]) -> "NodeTable":
+        """A copy of the nodes and properties, not the relationships.
+
+        The two share their nodes and indexes until either changes them.
+        """
+        copy = NodeTable(self.label, changed)
+        copy._ids = self._ids
+        copy._keys = self._keys
+        copy._bound = self._bound
+        copy._bits = self._bits
+        copy._columns = {
+            name: column.copy() for (name, column) in self._columns.items()
+        }
+        copy._indexes = dict(self._indexes)
+
+        self._shared = copy._shared = True
+        return copy
+
+    def _unshare(self):
+        self._ids = overlay(self._ids)
+        self._keys = overlay(self._keys)
+        self._indexes = {
+            name: overlay(index) for (name, index) in self._indexes.items()
+        }
+        self._shared = False
+
+    def _index_add(self, name: str, value: Any, id: int):
+        index = self._indexes[name]
+        index[value] = index.get(value, 0) | (1 << id)
+
+    def _index_discard(self, name: str, value: Any, id: int):
+        index = self._indexes[name]
+        bits = index.get(value, 0) & ~(1 << id)
+        if bits:
+            index[value] = bits
+        elif value in index:
+            del index[value]
+
+
+class RelationshipTable:
+    """The relationships of one type, from one table's nodes to another's.
+
+    Nodes are given by key, as the lists of neighbours are. A target's
+    sources are kept in a ChunkedList, as a target may have very many
+    (e.g. a zone's stations); a source's targets are usually few.
+    """
+
+    type: str
+    """The type of the relationships"""
+
+    source: NodeTable
+    """The table of the nodes the relationships are from"""
+
+    target: NodeTable
+    """The table of the nodes the relationships are to"""
+
+    out_degrees: Optional[CountIndex]
+    """Source keys indexed by the number of relationships from them, if
+    declared with degrees=True"""
+
+    in_degrees: Optional[CountIndex]
+    """Target keys indexed by the number of relationships to them, if
+    declared with degrees=True"""
+
+    _out: Dict[Hashable, List[Hashable]]
+    _in: Dict[Hashable, ChunkedList]
+    _count: int
+
+    # Bitsets of the sources of each target, made on first use after a
+    # change to them. Not shared with a copy, which makes its own.
+    _source_bits: Dict[Hashable, int]
+
+    # Whether _out and _in are shared with a copy, so must be overlaid before they're changed; and if the lists in them may be,
+    # the keys whose lists have been copied since and are ours to change
+    _shared: bool
+    _owned_out: Optional[Set[Hashable]]
+    _owned_in: Optional[Set[Hashable]]
+
+    _csr: Dict[bool, Tuple[array, array]]
+    _changed: Callable[[], None]
+
+    def __init__(
+        self,
+        type: str,
+        source: NodeTable,
+        target: NodeTable,
+        degrees: bool=False,
+        changed: Callable[[], None]=lambda: None
+    ):
+        """Initialise with no relationships, calling changed on every change.
+
+        With degrees, the nodes at each end are indexed by degree.
+        """
+        self.type = type
+        self.source = source
+        self.target = target
+        self.out_degrees = None
+        self.in_degrees = None
+        self._out = {key: [] for key in source.keys()}
+        self._in = {key: ChunkedList() for key in target.keys()}
+        self._count = 0
+        self._source_bits = {}
+        self._shared = False
+        self._owned_out = None
+        self._owned_in = None
+        self._csr = {}
+        self._changed = changed
+
+        if degrees:
+            self.out_degrees = CountIndex(key=source.id)
+            self.in_degrees = CountIndex(key=target.id)
+            for key in source.keys():
+                self.out_degrees.set(key, 0)
+            for key in target.keys():
+                self.in_degrees.set(key, 0)
+
+        self._register()
+
+    def __len__(self) -> int:
+        return self._count
+
+    def has(self, source: Hashable, target: Hashable) -> bool:
+        """True if the source node is related to the target node.
+
+        Raises KeyError if the source node doesn't exist.
+        """
+        return target in self._out[source]
+
+    def targets(self, source: Hashable) -> List[Hashable]:
+        """Keys of the nodes the source is related to, in the order added.
+
+        Users should not modify the list returned.
+
+        Raises KeyError if the source node doesn't exist.
+        """
+        return self._out[source]
+
+    def sources(self, target: Hashable) -> ChunkedList:
+        """Keys of the nodes related to the target, in the order added.
+
+        Users should not modify the list returned.
+
+        Raises KeyError if the target node doesn't exist.
+        """
+        return self._in[target]
+
+    def source_bits(self, target: Hashable) -> int:
+        """Bitset of the ids of the nodes related to the target.
+
+        Raises KeyError if the target node doesn't exist.
+        """
+        try:
+            return self._source_bits[target]
+        except KeyError:
+            pass
+
+        ids = self.source._ids
+        bits = self._source_bits[target] = _ids_to_bits(
+            [ids[source] for source in self._in[target]], self.source._bound
+        )
+        return bits
+
+    def add(self, source: Hashable, target: Hashable):
+        """Relate a source node to a target node.
+
+        Raises KeyError if either node doesn't exist.
+        Raises ValueError if they are already related.
+        """
+        sources = self._in[target]
+        targets = self._out[source]
+        if target in targets:
+            raise ValueError(f"{source} already {self.type} {target}")
+        if self._shared:
+            self._unshare()
+        if self._owned_out is not None:
+            targets = self._writable_out(source)
+            sources = self._writable_in(target)
+
+        targets.append(target)
+        sources.append(source)
+        self._source_bits.pop(target, None)
+        self._count += 1
+
+        if self.out_degrees is not None:
+            self.out_degrees.set(source, len(targets))
+            self.in_degrees.set(target, len(sources))
+        if self._csr:
+            self._csr.clear()
+        self._changed()
+
+    def remove(self, source: Hashable, target: Hashable):
+        """Remove the relationship between a source and target node.
+
+        Raises KeyError if the source node doesn't exist.
+        Raises ValueError if they aren't related.
+        """
+        if target not in self._out[source]:
+            raise ValueError(f"{source} not {self.type} {target}")
+        if self._shared:
+            self._unshare()
+
+        targets = self._writable_out(source)
+        sources = self._writable_in(target)
+        targets.remove(target)
+        sources.remove(source)
+        self._source_bits.pop(target, None)
+        self._count -= 1
+
+        if self.out_degrees is not None:
+            self.out_degrees.set(source, len(targets))
+            self.in_degrees.set(target, len(sources))
+        if self._csr:
+            self._csr.clear()
+        self._changed()
+
+    def csr(self, reverse: bool=False) -> Tuple[array, array]:
+        """The relationships in compressed sparse row form, by id.
+
+        Returns (offsets, neighbours): the targets of source n (or with
+        reverse, the sources of target n) are neighbours[offsets[n]] to
+        neighbours[offsets[n + 1] - 1]. Built on first use after a change.
+        """
+        if reverse not in self._csr:
+            (nodes, others, adjacency) = (
+                (self.target, self.source, self._in) if reverse else
+                (self.source, self.target, self._out)
+            )
+            keys = nodes._keys
+            offsets = array("q", [0])
+            neighbours = array("q")
+            for id in range(nodes.id_bound()):
+                if id in keys:
+                    neighbours.extend(map(others.id, adjacency[keys[id]]))
+                offsets.append(len(neighbours))
+            self._csr[reverse] = (offsets, neighbours)
+
+        return self._csr[reverse]
+
+    def _register(self):
+        """Have the node tables tell us about nodes added and removed"""
+        self.source._relationships.append(self)
+        if self.target is not self.source:
+            self.target._relationships.append(self)
+
+    def _unshare(self):
+        self._out = overlay(self._out)
+        self._in = overlay(self._in)
+        self._shared = False
+
+    def _writable_out(self, source: Hashable) -> List[Hashable]:
+        """The targets of a source, copied first if shared with a copy"""
+        if self._owned_out is not None and source not in self._owned_out:
+            self._out[source] = [*self._out[source]]
+            self._owned_out.add(source)
+        return self._out[source]
+
+    def _writable_in(self, target: Hashable) -> ChunkedList:
+        """The sources of a target, copied first if shared with a copy"""
+        if self._owned_in is not None and target not in self._owned_in:
+            self._in[target] = self._in[target].copy()
+            self._owned_in.add(target)
+        return self._in[target]
+
+    def _copy(
+        self,
+        source: NodeTable,
+        target: NodeTable,
+        changed: Callable[[], None]
+    ) -> "RelationshipTable":
+        """A copy of the relationships between copies of the node tables.
+
+        The two share their relationships until either changes them.
+        """
+        copy = object.__new__(RelationshipTable)
+        copy.__dict__.update(self.__dict__)
+        copy.source = source
+        copy.target = target
+        copy._source_bits = {}
+        copy._csr = dict(self._csr)
+        copy._changed = changed
+        if self.out_degrees is not None:
+            copy.out_degrees = self.out_degrees.copy(source.id)
+            copy.in_degrees = self.in_degrees.copy(target.id)
+        copy._register()
+
+        for table in (self, copy):
+            table._shared = True
+            table._owned_out = set()
+            table._owned_in = set()
+
+        return copy
+
+    def _node_added(self, table: NodeTable, key: Hashable):
+        """Called by a table when a node is added"""
+        if self._shared:
+            self._unshare()
+
+        if table is self.source:
+            self._out[key] = []
+            if self._owned_out is not None:
+                self._owned_out.add(key)
+            if self.out_degrees is not None:
+                self.out_degrees.set(key, 0)
+        if table is self.target:
+            self._in[key] = ChunkedList()
+            if self._owned_in is not None:
+                self._owned_in.add(key)
+            if self.in_degrees is not None:
+                self.in_degrees.set(key, 0)
+        if self._csr:
+            self._csr.clear()
+
+    def _node_removed(self, table: NodeTable, key: Hashable):
+        """Called by a table before a node is removed"""
+        if self._shared:
+            self._unshare()
+
+        if table is self.source:
+            for target in [*self._out[key]]:
+                self.remove(key, target)
+            del self._out[key]
+            if self.out_degrees is not None:
+                self.out_degrees.remove(key)
+        if table is self.target:
+            for source in [*self._in[key]]:
+                self.remove(source, key)
+            del self._in[key]
+            self._source_bits.pop(key, None)
+            if self.in_degrees is not None:
+                self.in_degrees.remove(key)
+        self._csr.clear()
+
+
+class PropertyGraph:
+    """Tables of nodes by label and relationships by type"""
+
+    _nodes: Dict[str, NodeTable]
+    _relationships: Dict[str, RelationshipTable]
+    _version: int
+
+    def __init__(self):
+        """Initialise empty graph"""
+        self._nodes = {}
+        self._relationships = {}
+        self._version = 0
+
+    def version(self) -> int:
+        """Counter incremented every time the graph's content changes"""
+        return self._version
+
+    def add_nodes(self, label: str) -> NodeTable:
+        """Create the table of nodes with a label.
+
+        Raises ValueError if it already exists.
+        """
+        if label in self._nodes:
+            raise ValueError(f"Label {label} already exists")
+        self._nodes[label] = NodeTable(label, self._changed)
+        return self._nodes[label]
+
+    def nodes(self, label: str) -> NodeTable:
+        """The table of nodes with a label.
+
+        Raises KeyError if there is no such label.
+        """
+        return self._nodes[label]
+
+    def labels(self) -> KeysView[str]:
+        """Iterable of node labels"""
+        return self._nodes.keys()
+
+    def add_relationships(
+        self,
+        type: str,
+        source: str,
+        target: str,
+        degrees: bool=False
+    ) -> RelationshipTable:
+        """Create the table of relationships of a type between two labels.
+
+        With degrees, the nodes at each end are indexed by their number of
+        relationships of the type.
+
+        Raises ValueError if it already exists, KeyError if either label
+        doesn't.
+        """
+        if type in self._relationships:
+            raise ValueError(f"Relationship {type} already exists")
+        self._relationships[type] = RelationshipTable(
+            type, self._nodes[source], self._nodes[target], degrees,
+            self._changed
+        )
+        return self._relationships[type]
+
+    def relationships(self, type: str) -> RelationshipTable:
+        """The table of relationships of a type.
+
+        Raises KeyError if there is no such type.
+        """
+        return self._relationships[type]
+
+    def relationship_types(self) -> KeysView[str]:
+        """Iterable of relationship types"""
+        return self._relationships.keys()
+
+    def copy(self) -> "PropertyGraph":
+        """A copy of the graph to change independently, e.g. a variant.
+
+        The two share their tables until either changes them, and then
+        only what's changed is copied (see the module docstring), so a
+        copy costs memory in proportion to its changes. The exceptions
+        are the bitsets of indexed properties, which are made anew when
+        changed, so each costs a bit per node; and the lists of chunks, a
+        pointer per CHUNK_SIZE nodes of a column or LIST_CHUNK_SIZE
+        sources of a target.
+        """
+        copy = PropertyGraph()
+        copy._version = self._version
+
+        for (label, table) in self._nodes.items():
+            copy._nodes[label] = table._copy(copy._changed)
+
+        for (type, relationships) in self._relationships.items():
+            copy._relationships[type] = relationships._copy(
+                copy._nodes[relationships.source.label],
+                copy._nodes[relationships.target.label],
+                copy._changed
+            )
+
+        return copy
+
+    def _changed(self):
+        self._version += 1
@@ -0,0 +1,478 @@
+"""Timetabled routing from a GTFS feed, using RAPTOR.
+
+shortest_route has to guess at journey costs from zones and districts as
+the Model has no times. Given a GTFS feed (stops.txt, trips.txt,
+stop_times.txt and optionally routes.txt) on local disk, this module
+builds a timetable linked to the Model's stations and answers "when is
+the earliest I can get to B if I leave A at 08:30?".
+
+Loading streams stop_times.txt a row at a time, holding just one trip in
+memory, and packs the result into flat arrays of integers:
+
+  - Trips with the same line and sequence of stops are grouped into a
+    "pattern" (what the RAPTOR paper calls a route), and each pattern's
+    stop times are stored as a trips x stops block of one array.
+  - Within a pattern trips are sorted by departure time, so the first
+    trip that can be caught is found by binary search.
+
+so memory is proportional to the number of stop times, with no per-row
+Python objects, and a multi-million row feed loads in bounded memory.
+
+RAPTOR (Delling, Pajor & Werneck, "Round-Based Public Transit Routing")
+works in rounds: round k finds the earliest arrival at every stop using at
+most k trips, by scanning each pattern serving a stop improved in the
+previous round once. There is no priority queue, and the scans walk
+contiguous arrays.
+
+Stops are matched to Model stations by name, with child stops (platforms)
+merged into their parent station. Stops which don't match a station are
+kept under their GTFS stop name. Changing trains is only possible at the
+same station, after MIN_CHANGE_SECONDS; walking transfers between
+stations (transfers.txt) are not used.
+"""
+
+from typing import *
+
+from array import array
+import csv
+import os
+import re
+
+import attr
+
+from .model import Model
+from .queries import NO_CLOSURES, Closures, JourneySegment
+from .search import normalise
+
+
+# Minimum time allowed to change trains at a station
+MIN_CHANGE_SECONDS = 120
+
+# Maximum number of trips in a journey
+MAX_ROUNDS = 8
+
+# Larger than any time of day in a timetable
+NEVER = 2 ** 31 - 1
+
+# Words on the end of GTFS stop names that the Model's names don't have
+_STOP_NAME_SUFFIX = re.compile(
+    r"\s+(underground|dlr|rail|tube)?\s*station$"
+)
+
+
+def parse_time(text: str) -> int:
+    """Convert a GTFS "HH:MM:SS" time to seconds after midnight.
+
+    Hours may be 24 or more for trips running past midnight. Seconds are
+    optional so that "08:30" can be used for departure times.
+
+    Raises ValueError if the time is badly formatted.
+    """
+    parts = text.strip().split(":")
+    if len(parts) not in (2, 3) or not all(p.isdigit() for p in parts):
+        raise ValueError(f"Invalid time '{text}'")
+
+    (hours, minutes, seconds) = (*map(int, parts), 0)[:3]
+    return hours * 3600 + minutes * 60 + seconds
+
+
+def format_time(seconds: int) -> str:
+    """Convert seconds after midnight to "HH:MM:SS" """
+    return f"{seconds // 3600:02}:{seconds // 60 % 60:02}:{seconds % 60:02}"
+
+
+@attr.s(auto_attribs=True)
+class TimedJourneySegment(JourneySegment):
+    """A section of a journey on a particular train"""
+
+    departure: int = 0
+    """Departure time from the start, in seconds after midnight"""
+
+    arrival: int = 0
+    """Arrival time at the destination, in seconds after midnight"""
+
+
+class Timetable:
+    """Timetable loaded from a GTFS feed, linked to a Model.
+
+    Node numbers are used for stations internally: the names of the nodes
+    are the Model station names where a stop could be matched to one.
+    """
+
+    names: List[str]
+    """Node -> station (or unmatched stop) name"""
+
+    nodes: Dict[str, int]
+    """Station (or unmatched stop) name -> node"""
+
+    line_names: List[str]
+    """Line number -> line name"""
+
+    # Pattern p visits the stops pattern_stops[pattern_stop_offsets[p]:
+    # pattern_stop_offsets[p + 1]], on line pattern_lines[p], with
+    # pattern_trips[p] trips. Its times start at pattern_time_offsets[p],
+    # stored trip by trip.
+    pattern_stop_offsets: array
+    pattern_stops: array
+    pattern_lines: array
+    pattern_trips: array
+    pattern_time_offsets: array
+    arrivals: array
+    departures: array
+
+    # Node n is served by the (pattern, index in pattern) pairs at
+    # node_patterns[node_pattern_offsets[n]:node_pattern_offsets[n + 1]]
+    node_pattern_offsets: array
+    node_patterns: array
+
+    def __init__(self, model: Model, directory: str):
+        """Load the GTFS feed in directory.
+
+        Raises ValueError if stop_times.txt is not grouped by trip, or
+        refers to unknown trips or stops.
+        """
+        self.names = []
+        self.nodes = {}
+        self.line_names = []
+
+        stop_nodes = self._load_stops(model, directory)
+        trip_lines = self._load_trips(directory)
+
+        # (line, stops) -> pattern number, and each pattern's trip times
+        patterns: Dict[Tuple[int, Tuple[int, ...]], int] = {}
+        pattern_times: List[List[array]] = []
+
+        def finish_trip(stops, arrivals, departures, line):
+            """Add a complete trip to its pattern"""
+            if len(stops) < 2:
+                return
+            key = (line, tuple(stops))
+            if key not in patterns:
+                patterns[key] = len(pattern_times)
+                pattern_times.append([])
+            # Packed as [departure at first stop, arrivals..., departures...]
+            # so sorting by the first element sorts by departure time
+            pattern_times[patterns[key]].append(
+                array("l", [departures[0], *arrivals, *departures])
+            )
+
+        finished = set()
+        trip = None
+        stops: List[int] = []
+        arrivals: List[int] = []
+        departures: List[int] = []
+        last_sequence = -1
+
+        with open(os.path.join(directory, "stop_times.txt"), newline="") as fd:
+            # A plain reader rather than a DictReader: this file can have
+            # millions of rows and building a dict for each one adds up
+            reader = csv.reader(fd)
+            columns = {name: n for (n, name) in enumerate(next(reader))}
+            (trip_column, stop_column, sequence_column) = (
+                columns["trip_id"], columns["stop_id"],
+                columns["stop_sequence"]
+            )
+            (arrival_column, departure_column) = (
+                columns["arrival_time"], columns["departure_time"]
+            )
+
+            for row in reader:
+                if row[trip_column] != trip:
+                    if trip is not None:
+                        finish_trip(stops, arrivals, departures,
+                                    trip_lines[trip])
+                        finished.add(trip)
+
+                    trip = row[trip_column]
+                    if trip in finished:
+                        raise ValueError(
+                            "stop_times.txt must be grouped by trip_id"
+                        )
+                    if trip not in trip_lines:
+                        raise ValueError(f"Unknown trip '{trip}'")
+
+                    (stops, arrivals, departures) = ([], [], [])
+                    last_sequence = -1
+
+                if row[stop_column] not in stop_nodes:
+                    raise ValueError(f"Unknown stop '{row[stop_column]}'")
+
+                sequence = int(row[sequence_column])
+                if sequence <= last_sequence:
+                    raise ValueError(
+                        f"stop_times.txt must be in stop_sequence order "
+                        f"(trip '{trip}')"
+                    )
+                last_sequence = sequence
+
+                node = stop_nodes[row[stop_column]]
+                arrival = parse_time(row[arrival_column] or
+                                     row[departure_column])
+                departure = parse_time(row[departure_column] or
+                                       row[arrival_column])
+
+                # Consecutive stops at the same station (e.g. two
+                # platforms) are merged
+                if stops and stops[-1] == node:
+                    departures[-1] = departure
+                    continue
+
+                stops.append(node)
+                arrivals.append(arrival)
+                departures.append(departure)
+
+            if trip is not None:
+                finish_trip(stops, arrivals, departures, trip_lines[trip])
+
+        self._pack(patterns, pattern_times)
+
+    def _node(self, name: str) -> int:
+        """The node for a name, creating one if needed"""
+        if name not in self.nodes:
+            self.nodes[name] = len(self.names)
+            self.names.append(name)
+        return self.nodes[name]
+
+    def _load_stops(self, model: Model, directory: str) -> Dict[str, int]:
+        """Read stops.txt, returning stop id -> node"""
+        stations = {normalise(name): name for name in model.stations()}
+        stop_names: Dict[str, str] = {}
+        parents: Dict[str, str] = {}
+
+        with open(os.path.join(directory, "stops.txt"), newline="") as fd:
+            for row in csv.DictReader(fd):
+                stop_names[row["stop_id"]] = row["stop_name"]
+                if row.get("parent_station"):
+                    parents[row["stop_id"]] = row["parent_station"]
+
+        def station_name(stop: str) -> str:
+            while stop in parents and parents[stop] in stop_names:
+                stop = parents[stop]
+            name = stop_names[stop]
+            key = _STOP_NAME_SUFFIX.sub("", normalise(name))
+            return stations.get(key, name)
+
+        return {stop: self._node(station_name(stop)) for stop in stop_names}
+
+    def _load_trips(self, directory: str) -> Dict[str, int]:
+        """Read trips.txt (and routes.txt), returning trip id -> line"""
+        route_names: Dict[str, str] = {}
+        routes_file = os.path.join(directory, "routes.txt")
+
+        if os.path.exists(routes_file):
+            with open(routes_file, newline="") as fd:
+                for row in csv.DictReader(fd):
+                    route_names[row["route_id"]] = \
+                        row.get("route_long_name") or \
+                        row.get("route_short_name") or row["route_id"]
+
+        line_numbers: Dict[str, int] = {}
+        trip_lines: Dict[str, int] = {}
+
+        with open(os.path.join(directory, "trips.txt"), newline="") as fd:
+            for row in csv.DictReader(fd):
+                line = route_names.get(row["route_id"], row["route_id"])
+                if line not in line_numbers:
+                    line_numbers[line] = len(self.line_names)
+                    self.line_names.append(line)
+                trip_lines[row["trip_id"]] = line_numbers[line]
+
+        return trip_lines
+
+    def _pack(self, patterns, pattern_times):
+        """Pack the patterns into flat arrays"""
+        self.pattern_stop_offsets = array("l", [0])
+        self.pattern_stops = array("l")
+        self.pattern_lines = array("l")
+        self.pattern_trips = array("l")
+        self.pattern_time_offsets = array("l", [0])
+        self.arrivals = array("l")
+        self.departures = array("l")
+
+        served_by: List[List[Tuple[int, int]]] = [[] for _ in self.names]
+
+        for ((line, stops), p) in sorted(patterns.items(), key=lambda i: i[1]):
+            for (i, node) in enumerate(stops):
+                served_by[node].append((p, i))
+
+            self.pattern_stops.extend(stops)
+            self.pattern_stop_offsets.append(len(self.pattern_stops))
+            self.pattern_lines.append(line)
+            self.pattern_trips.append(len(pattern_times[p]))
+
+            length = len(stops)
+            for times in sorted(pattern_times[p]):
+                self.arrivals.extend(times[1:length + 1])
+                self.departures.extend(times[length + 1:])
+            self.pattern_time_offsets.append(len(self.arrivals))
+
+            # Free each pattern's trips as soon as they're packed
+            pattern_times[p] = None
+
+        self.node_pattern_offsets = array("l", [0])
+        self.node_patterns = array("l")
+        for served in served_by:
+            for (p, i) in served:
+                self.node_patterns.extend((p, i))
+            self.node_pattern_offsets.append(len(self.node_patterns))
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def stop_time_count(self) -> int:
+        """The number of stop times stored"""
+        return len(self.arrivals)
+
+    def _earliest_trip(self, p: int, i: int, time: int) -> int:
+        """The first trip of pattern p leaving its ith stop at or after time.
+
+        Returns -1 if there is no such trip.
+        """
+        length = self.pattern_stop_offsets[p + 1] - self.pattern_stop_offsets[p]
+        base = self.pattern_time_offsets[p] + i
+        (low, high) = (0, self.pattern_trips[p])
+
+        while low < high:
+            middle = (low + high) // 2
+            if self.departures[base + middle * length] < time:
+                low = middle + 1
+            else:
+                high = middle
+
+        return low if low < self.pattern_trips[p] else -1
+
+    def earliest_arrival(
+        self,
+        start: str,
+        destination: str,
+        departure: int,
+        closures: Closures=NO_CLOSURES
+    ) -> List[TimedJourneySegment]:
+        """The journey arriving soonest when leaving start at departure.
+
+        Among journeys arriving at the same time the one with the fewest
+        trips is chosen. Closed stations can't be used to board, alight or
+        change, and closed lines aren't used.
+
+        Raises ValueError if the destination can't be reached.
+        Raises KeyError if either station is not in the timetable.
+        """
+        source = self.nodes[start]
+        target = self.nodes[destination]
+
+        closed_nodes = bytearray(len(self.names))
+        for station in closures.stations:
+            if station in self.nodes:
+                closed_nodes[self.nodes[station]] = 1
+        closed_lines = {
+            n for (n, line) in enumerate(self.line_names)
+            if line in closures.lines
+        }
+
+        if closed_nodes[source] or closed_nodes[target]:
+            raise ValueError(
+                f"{start if closed_nodes[source] else destination} is closed"
+            )
+
+        stop_offsets = self.pattern_stop_offsets
+        pattern_stops = self.pattern_stops
+        time_offsets = self.pattern_time_offsets
+        arrivals = self.arrivals
+        departures = self.departures
+
+        # arrival[k][n]: earliest arrival at node n using k trips, and how
+        # we got there: (pattern, trip, boarding index, alighting index)
+        arrival = [array("l", [NEVER]) * len(self.names)]
+        arrival[0][source] = departure
+        previous: List[Dict[int, Tuple[int, int, int, int]]] = [{}]
+        best = array("l", [NEVER]) * len(self.names)
+        best[source] = departure
+        marked = {source}
+
+        for k in range(1, MAX_ROUNDS + 1):
+            if not marked:
+                break
+
+            arrival.append(array("l", arrival[k - 1]))
+            previous.append({})
+            change = MIN_CHANGE_SECONDS if k > 1 else 0
+
+            # Each pattern serving a marked stop, from the earliest such stop
+            queue: Dict[int, int] = {}
+            for node in marked:
+                offsets = self.node_pattern_offsets
+                for j in range(offsets[node], offsets[node + 1], 2):
+                    (p, i) = (self.node_patterns[j], self.node_patterns[j + 1])
+                    if i < queue.get(p, NEVER):
+                        queue[p] = i
+            marked = set()
+
+            for (p, first) in queue.items():
+                if self.pattern_lines[p] in closed_lines:
+                    continue
+
+                length = stop_offsets[p + 1] - stop_offsets[p]
+                trip = -1
+                boarded = -1
+                times = 0
+
+                for i in range(first, length):
+                    node = pattern_stops[stop_offsets[p] + i]
+                    if closed_nodes[node]:
+                        continue
+
+                    # Alight here if that improves on anything so far
+                    # (and could improve on the destination)
+                    if trip >= 0:
+                        time = arrivals[times + i]
+                        if time < best[node] and time < best[target]:
+                            arrival[k][node] = time
+                            best[node] = time
+                            previous[k][node] = (p, trip, boarded, i)
+                            marked.add(node)
+
+                    # Board (or switch to an earlier trip) here if we could
+                    # have arrived in time in the previous round
+                    ready = arrival[k - 1][node]
+                    if ready == NEVER:
+                        continue
+                    if trip >= 0 and ready + change > departures[times + i]:
+                        continue
+
+                    earlier = self._earliest_trip(p, i, ready + change)
+                    if earlier >= 0 and earlier != trip:
+                        trip = earlier
+                        boarded = i
+                        times = time_offsets[p] + trip * length
+
+        if best[target] == NEVER:
+            raise ValueError(f"Cannot find a route from {start} to {destination}")
+
+        # The fewest trips achieving the best arrival time
+        k = min(
+            k for k in range(len(arrival)) if arrival[k][target] == best[target]
+        )
+
+        journey = []
+        node = target
+        while k > 0:
+            (p, trip, boarded, alighted) = previous[k][node]
+            length = stop_offsets[p + 1] - stop_offsets[p]
+            times = time_offsets[p] + trip * length
+            board_node = pattern_stops[stop_offsets[p] + boarded]
+
+            journey.append(TimedJourneySegment(
+                start=self.names[board_node],
+                destination=self.names[node],
+                line=self.line_names[self.pattern_lines[p]],
+                departure=departures[times + boarded],
+                arrival=arrivals[times + alighted]
+            ))
+
+            node = board_node
+            k -= 1
+            # The node may have been reached with fewer trips than k - 1
+            while k > 0 and node not in previous[k]:
+                k -= 1
+
+        return journey[::-1]
@@ -0,0 +1,225 @@
+"""Tracing hooks for finding where time (and memory) goes.
+
+Code marks out phases of work as spans, which nest:
+
+    with trace.span("parse.html"):
+        soup = BeautifulSoup(...)
+
+or for a whole function:
+
+    @trace.traced("queries.shortest_route")
+    def shortest_route(...):
+
+Collectors registered with add_collector are told when each span starts
+and ends. With no collectors, which is the normal case, span() hands back
+a shared do-nothing context manager and traced functions call straight
+through, so instrumented code pays one function call and an empty
+check.
+
+PhaseProfile is a collector that adds up the time and memory allocated
+(via tracemalloc) in each phase, e.g. for bin/serve.py --profile-startup.
+"""
+
+from typing import *
+
+import functools
+import threading
+import time
+import tracemalloc
+
+import attr
+
+# Path of span names from the outermost in
+SpanPath = Tuple[str, ...]
+
+
+class Collector:
+    """Receives span events. Override the events of interest.
+
+    Events for a span happen on the thread that ran it.
+    """
+
+    def start(self, path: SpanPath):
+        """A span has started"""
+
+    def end(self, path: SpanPath, seconds: float):
+        """A span has ended, having taken seconds"""
+
+
+# Replaced rather than changed in place, so a span always sees a
+# consistent list without taking a lock
+_collectors: List[Collector] = []
+
+# Names of the spans open on each thread
+_open = threading.local()
+
+
+def add_collector(collector: Collector):
+    """Start sending span events to a collector"""
+    global _collectors
+    _collectors = [*_collectors, collector]
+
+
+def remove_collector(collector: Collector):
+    """Stop sending span events to a collector"""
+    global _collectors
+    _collectors = [c for c in _collectors if c is not collector]
+
+
+def _stack() -> List[str]:
+    if not hasattr(_open, "names"):
+        _open.names = []
+    return _open.names
+
+
+class _Span:
+    """A span reported to the collectors"""
+
+    __slots__ = ("name", "path", "collectors", "start_time")
+
+    def __init__(self, name: str, collectors: List[Collector]):
+        self.name = name
+        self.collectors = collectors
+
+    def __enter__(self):
+        stack = _stack()
+        stack.append(self.name)
+        self.path = tuple(stack)
+        for collector in self.collectors:
+            collector.start(self.path)
+        self.start_time = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        seconds = time.perf_counter() - self.start_time
+        _stack().pop()
+        for collector in reversed(self.collectors):
+            collector.end(self.path, seconds)
+
+
+class _NoSpan:
+    """A span nobody is listening to"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_NO_SPAN = _NoSpan()
+
+
+def span(name: str) -> ContextManager:
+    """A context manager marking out a phase of work"""
+    if _collectors:
+        return _Span(name, _collectors)
+    return _NO_SPAN
+
+
+def traced(name: str) -> Callable[[Callable], Callable]:
+    """Decorator making every call of a function a span"""
+    def decorator(function: Callable) -> Callable:
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _collectors:
+                return function(*args, **kwargs)
+            with _Span(name, _collectors):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@attr.s(auto_attribs=True)
+class Phase:
+    """Totals for one span path in a PhaseProfile"""
+
+    calls: int = 0
+    """Number of times the span ran"""
+
+    seconds: float = 0.0
+    """Total time spent in the span, including nested spans"""
+
+    allocated: int = 0
+    """Net bytes allocated in the span and still in use at its end"""
+
+
+class PhaseProfile(Collector):
+    """Collector adding up time and memory by phase.
+
+    Use as a context manager around the code to profile:
+
+        with PhaseProfile() as profile:
+            model = make_standard_model()
+        print(profile.report())
+
+    Memory is measured with tracemalloc, which is started if it isn't
+    already running. It slows everything down (Python code roughly
+    doubles in time), so pass memory=False for accurate timings.
+    """
+
+    phases: Dict[SpanPath, Phase]
+    """Span path -> totals, in the order the spans first started"""
+
+    def __init__(self, memory: bool=True):
+        self.phases = {}
+        self._memory = memory
+        self._started_tracemalloc = False
+        self._lock = threading.Lock()
+        self._open = threading.local()
+
+    def __enter__(self) -> "PhaseProfile":
+        if self._memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        add_collector(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        remove_collector(self)
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+    def _memory_at_start(self) -> List[int]:
+        if not hasattr(self._open, "memory"):
+            self._open.memory = []
+        return self._open.memory
+
+    def start(self, path: SpanPath):
+        with self._lock:
+            self.phases.setdefault(path, Phase())
+        if self._memory:
+            self._memory_at_start().append(tracemalloc.get_traced_memory()[0])
+
+    def end(self, path: SpanPath, seconds: float):
+        allocated = 0
+        if self._memory:
+            allocated = tracemalloc.get_traced_memory()[0] - \
+                self._memory_at_start().pop()
+
+        with self._lock:
+            phase = self.phases[path]
+            phase.calls += 1
+            phase.seconds += seconds
+            phase.allocated += allocated
+
+    def report(self) -> str:
+        """The phases as a table, nested phases indented"""
+        lines = [f"{'phase':<48} {'calls':>7} {'ms':>10} {'KiB':>10}"]
+
+        # Each span after its parent, otherwise in the order they started
+        first_seen = {path: n for (n, path) in enumerate(self.phases)}
+        order = lambda path: [
+            first_seen.get(path[:n + 1], -1) for n in range(len(path))
+        ]
+
+        for path in sorted(self.phases, key=order):
+            phase = self.phases[path]
+            name = "  " * (len(path) - 1) + path[-1]
+            lines.append(
+                f"{name:<48} {phase.calls:>7} {phase.seconds * 1000:>10.1f} "
+                f"{phase.allocated / 1024:>10.1f}"
+            )
+
+        return "\n".join(lines)